@@ -9,7 +9,10 @@ User = get_user_model()
 
 
 @receiver(post_save, sender=User)
-def ensure_profile(sender, instance, created, **kwargs):
+def ensure_profile(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # Fixtures carry their own profiles.
+        return
     if created:
         UserProfile.objects.create(user=instance)
     else:
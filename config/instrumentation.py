@@ -0,0 +1,216 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` times a sample of requests (PERF_SAMPLE_RATE) and
+breaks each one down into SQL, template rendering and any named spans
+(``span('open_now')``). The breakdown goes out as a ``Server-Timing``
+header, which browser dev tools show next to the request, and as one JSON
+log line on the ``config.instrumentation`` logger tagged with the URL
+name. Queries run more than once with the same parameters are reported as
+duplicates, with the worst offender in the log line.
+
+With PERF_INSTRUMENTATION off the middleware removes itself from the stack
+when the server starts, so it costs nothing per request. Under ASGI it runs
+as async middleware, so async views are not pushed back onto a thread.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[RequestRecord | None] = ContextVar('perf_request_record', default=None)
+
+# Longest SQL statement quoted in a log line.
+_MAX_SQL = 300
+
+
+@dataclass
+class RequestRecord:
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_seconds: float = 0.0
+    template_seconds: float = 0.0
+    spans: dict[str, float] = field(default_factory=dict)
+    statements: Counter = field(default_factory=Counter)
+    rendering: bool = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper() for the duration of the request.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            try:
+                self.statements[(sql, repr(params))] += 1
+            except Exception:  # Unrepresentable parameters are not worth failing a request over.
+                pass
+
+    def duplicates(self) -> tuple[int, str | None]:
+        """Executions that repeated an earlier query exactly, and the most repeated statement."""
+        repeated = [(count, sql) for (sql, _), count in self.statements.items() if count > 1]
+        if not repeated:
+            return 0, None
+        count, sql = max(repeated)
+        return sum(count - 1 for count, _ in repeated), sql
+
+
+@contextmanager
+def span(name: str):
+    """Add the time spent in the block to the current request's ``name`` timing, if it is being measured."""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.spans[name] = record.spans.get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    """Install ``wrapper`` with execute_wrapper() on every database connection of this thread."""
+    with ExitStack() as stack:
+        # Wrapping a connection does not open it.
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+@asynccontextmanager
+async def awrap_connections(wrapper):
+    """
+    ``wrap_connections()`` for async code. Connections belong to threads, and
+    the async ORM runs its queries on the request's thread-sensitive
+    sync_to_async thread, so the wrappers are installed (and removed) there.
+    """
+    stack = ExitStack()
+    await sync_to_async(stack.enter_context)(wrap_connections(wrapper))
+    try:
+        yield
+    finally:
+        await sync_to_async(stack.close)()
+
+
+_original_render = Template.render
+
+
+def _timed_render(self, context):
+    record = _current.get()
+    if record is None or record.rendering:
+        # Included templates are part of the outermost render's time.
+        return _original_render(self, context)
+    record.rendering = True
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        record.template_seconds += time.perf_counter() - started
+        record.rendering = False
+
+
+def _server_timing(record: RequestRecord, total: float) -> str:
+    metrics = [
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={record.db_seconds * 1000:.1f};desc="{record.queries} queries"',
+        f'tpl;dur={record.template_seconds * 1000:.1f}',
+    ]
+    metrics += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in record.spans.items()]
+    return ', '.join(metrics)
+
+
+def _response_size(response) -> int | None:
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class PerformanceMiddleware:
+    """Measure a sample of requests; see the module docstring."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Template.render is wrapped once for the process; outside a sampled
+        # request the wrapper only reads a context variable.
+        Template.render = _timed_render
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PERF_SAMPLE_RATE:
+            return self.get_response(request)
+
+        record = RequestRecord()
+        token = _current.set(record)
+        try:
+            with wrap_connections(record):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, record)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PERF_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        record = RequestRecord()
+        token = _current.set(record)
+        try:
+            async with awrap_connections(record):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, record)
+
+    def finish(self, request, response, record):
+        total = time.perf_counter() - record.started
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = _server_timing(record, total)
+        self.log(request, response, record, total)
+        return response
+
+    def log(self, request, response, record, total):
+        match = getattr(request, 'resolver_match', None)
+        duplicates, duplicated_sql = record.duplicates()
+        entry = {
+            'url_name': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(record.db_seconds * 1000, 1),
+            'queries': record.queries,
+            'duplicate_queries': duplicates,
+            'template_ms': round(record.template_seconds * 1000, 1),
+            'bytes': _response_size(response),
+        }
+        if record.spans:
+            entry['spans_ms'] = {name: round(seconds * 1000, 1) for name, seconds in record.spans.items()}
+        if duplicated_sql:
+            entry['duplicated_sql'] = duplicated_sql[:_MAX_SQL]
+        level = logging.WARNING if duplicates >= settings.PERF_DUPLICATE_QUERY_WARNING else logging.INFO
+        logger.log(level, json.dumps(entry), extra={'perf': entry})
@@ -0,0 +1,259 @@
+"""
+Request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` records a latency histogram, response counts by
+status class and database query counts per URL name, split between HTMX
+partials and full pages. ``metrics_view`` serves them at /metrics.
+
+Each process keeps its numbers in memory. With METRICS_DIR set, it also
+writes them to its own file there, at most every METRICS_FLUSH_INTERVAL
+seconds and on exit, and /metrics adds up every file. That way a scrape of
+any gunicorn worker reports the whole server. Clear the directory when
+the server is deployed (start.sh does); a worker's file outlives it so
+counters do not drop when workers are recycled.
+"""
+from __future__ import annotations
+
+import atexit
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from .instrumentation import awrap_connections, wrap_connections
+
+
+# Upper bounds (seconds) of the latency buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help)
+METRICS = {
+    'dekat_http_request_duration_seconds': ('histogram', "Time to produce a response, by URL name."),
+    'dekat_http_responses_total': ('counter', "Responses by URL name and status class."),
+    'dekat_db_queries_total': ('counter', "Database queries run while handling requests, by URL name."),
+    'dekat_db_query_seconds_total': ('counter', "Time spent in database queries, by URL name."),
+    'dekat_directory_cache_requests_total': ('counter', "Directory fragment cache lookups by result."),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _labels(**labels) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    Flat ``(sample name, labels) -> value`` store. Every sample only ever
+    grows, so the totals of several processes are simply their sums.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset_process()
+
+    def _reset_process(self):
+        # Also called after a fork: the numbers of the parent are not this process's.
+        self._pid = os.getpid()
+        self._values = defaultdict(float)
+        self._file_name = f"{self._pid}-{uuid.uuid4().hex[:8]}.json"
+        self._flushed_at = 0.0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._reset_process()
+
+    def inc(self, name: str, labels: tuple, amount: float = 1.0) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_process()
+            self._values[(name, labels)] += amount
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_process()
+            for bound in LATENCY_BUCKETS:
+                if value <= bound:
+                    self._values[(f'{name}_bucket', (*labels, ('le', repr(bound))))] += 1
+            self._values[(f'{name}_bucket', (*labels, ('le', '+Inf')))] += 1
+            self._values[(f'{name}_sum', labels)] += value
+            self._values[(f'{name}_count', labels)] += 1
+
+    def samples(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def flush(self, directory, *, force: bool = False) -> None:
+        """Write this process's samples to its file in ``directory``, unless it did so within the flush interval."""
+        now = time.monotonic()
+        if not force and now - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+        rows = [[name, list(map(list, labels)), value] for (name, labels), value in self.samples().items()]
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed so readers never see half a file.
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(rows, fh)
+        os.replace(temporary, directory / self._file_name)
+
+    def collect(self, directory=None) -> dict:
+        """Samples of this process, or with ``directory`` the sums over every process's file."""
+        if not directory:
+            return self.samples()
+        self.flush(directory, force=True)
+        totals = defaultdict(float)
+        for path in Path(directory).glob('*.json'):
+            try:
+                rows = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Removed or replaced while being read; the next scrape picks it up.
+            for name, labels, value in rows:
+                totals[(name, tuple(map(tuple, labels)))] += value
+        return totals
+
+
+registry = Registry()
+
+
+def _flush_on_exit():
+    if settings.METRICS_ENABLED and settings.METRICS_DIR:
+        registry.flush(settings.METRICS_DIR, force=True)
+
+
+atexit.register(_flush_on_exit)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """Record every request in ``registry``; inactive unless METRICS_ENABLED is on."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with wrap_connections(counter):
+            response = self.get_response(request)
+        return self.record(request, response, counter, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        async with awrap_connections(counter):
+            response = await self.get_response(request)
+        return self.record(request, response, counter, time.perf_counter() - started)
+
+    def record(self, request, response, counter, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        if view == 'metrics':
+            return response
+        htmx = 'true' if request.headers.get('HX-Request') else 'false'
+        labels = _labels(view=view, htmx=htmx)
+        registry.observe('dekat_http_request_duration_seconds', labels, elapsed)
+        registry.inc('dekat_http_responses_total', _labels(view=view, htmx=htmx, status=f'{response.status_code // 100}xx'))
+        registry.inc('dekat_db_queries_total', labels, counter.queries)
+        registry.inc('dekat_db_query_seconds_total', labels, counter.seconds)
+        if settings.METRICS_DIR:
+            registry.flush(settings.METRICS_DIR)
+        return response
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render_metrics(samples: dict) -> str:
+    """Samples in the Prometheus text exposition format, grouped by metric."""
+    families = defaultdict(list)
+    for (name, labels), value in samples.items():
+        family = next((metric for metric in METRICS if name == metric or name.startswith(f'{metric}_')), name)
+        families[family].append((name, labels, value))
+    lines = []
+    for family in sorted(families):
+        kind, description = METRICS.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {description}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(families[family], key=_sample_order):
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if labels else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _sample_order(sample):
+    name, labels, _ = sample
+    # Buckets in ascending order, +Inf last, as the format expects.
+    le = dict(labels).get('le')
+    bound = float('inf') if le == '+Inf' else float(le) if le else 0.0
+    return name, [label for label in labels if label[0] != 'le'], bound
+
+
+def _authorised(request) -> bool:
+    token = settings.METRICS_TOKEN
+    if token:
+        header = request.headers.get('Authorization', '')
+        return hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@never_cache
+@require_safe
+def metrics_view(request):
+    """
+    /metrics for a Prometheus scraper: needs ``Authorization: Bearer
+    <METRICS_TOKEN>``, or a staff login when no token is configured.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404("Metrics are turned off.")
+    if not _authorised(request):
+        return HttpResponseForbidden("Metrics need a token.")
+
+    from venues.cache import directory_cache_stats
+
+    samples = dict(registry.collect(settings.METRICS_DIR))
+    # Kept in the shared cache already, so not counted per process.
+    stats = directory_cache_stats()
+    for result, stat in (('hit', 'hits'), ('miss', 'misses')):
+        samples[('dekat_directory_cache_requests_total', _labels(result=result))] = stats[stat]
+    return HttpResponse(render_metrics(samples), content_type=CONTENT_TYPE)
@@ -51,13 +51,18 @@ INSTALLED_APPS = [
     'django.contrib.sites',
     'venues',
     'merchants',
+    'jobs',
 ]
 
 SITE_ID = 1
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack; inactive unless PERF_INSTRUMENTATION is on.
+    'config.instrumentation.PerformanceMiddleware',
+    # Latency, status and query counters for /metrics; inactive unless METRICS_ENABLED is on.
+    'config.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
+    'config.static.AsyncWhiteNoiseMiddleware',  # WhiteNoise for static files, async-capable for ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -107,6 +112,37 @@ else:
     }
 
 
+# Cache
+# Local memory by default; set REDIS_URL so every worker shares the directory cache.
+REDIS_URL = config('REDIS_URL', default=None)
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Follower feed
+# With FEED_FANOUT on, published updates are copied into each follower's inbox
+# (run `manage.py backfill_feed_inbox` after enabling). Merchants with more
+# followers than the threshold are still read at request time.
+FEED_FANOUT = config('FEED_FANOUT', default=False, cast=bool)
+FEED_FANOUT_MAX_FOLLOWERS = config('FEED_FANOUT_MAX_FOLLOWERS', default=5000, cast=int)
+
+# Restock emails wait this many seconds after a merchant's first restock so
+# a burst of stock edits goes out as one email per follower.
+RESTOCK_NOTIFY_WINDOW = config('RESTOCK_NOTIFY_WINDOW', default=900, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -146,8 +182,9 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # WhiteNoise configuration for efficient static file serving
 STORAGES = {
+    # Uploads are stored once per distinct content and deleted when unused.
     "default": {
-        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "BACKEND": "venues.storage.ContentAddressedStorage",
     },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -157,6 +194,36 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are served by venues.media.serve_media. Set MEDIA_OFFLOAD to
+# 'x-accel-redirect' (nginx, with MEDIA_ACCEL_PREFIX as an internal location
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache, lighttpd) to have the front
+# server send the bytes. Blobs are cached for a year; older uploads, whose
+# names do not change with their content, for MEDIA_CACHE_MAX_AGE seconds.
+MEDIA_OFFLOAD = config('MEDIA_OFFLOAD', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=3600, cast=int)
+
+# Request timing (config.instrumentation): for PERF_SAMPLE_RATE of requests,
+# SQL, template and total time go out as a Server-Timing header (unless
+# PERF_SERVER_TIMING is off) and a JSON log line tagged with the URL name.
+# Requests repeating PERF_DUPLICATE_QUERY_WARNING or more identical queries
+# are logged as warnings. Off by default; when off it is not in the stack at all.
+PERF_INSTRUMENTATION = config('PERF_INSTRUMENTATION', default=False, cast=bool)
+PERF_SAMPLE_RATE = config('PERF_SAMPLE_RATE', default=1.0, cast=float)
+PERF_SERVER_TIMING = config('PERF_SERVER_TIMING', default=True, cast=bool)
+PERF_DUPLICATE_QUERY_WARNING = config('PERF_DUPLICATE_QUERY_WARNING', default=5, cast=int)
+
+# Prometheus metrics at /metrics: latency histograms, response and query
+# counts per URL name (HTMX partials apart from full pages) and directory
+# cache hits. Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; without
+# a token only staff can read the page. With several gunicorn workers set
+# METRICS_DIR to a directory they share so any worker reports all of them;
+# each writes its numbers there at most every METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = config('METRICS_ENABLED', default=False, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+
 
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend', 
@@ -223,6 +290,12 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        # One JSON line per measured request.
+        'config.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
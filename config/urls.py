@@ -14,12 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from venues import views as venue_views
+from venues.media import serve_media
+from config.metrics import metrics_view
 from accounts import views as accounts_views
 from django.conf import settings             # <-- Import this
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -42,6 +45,8 @@ urlpatterns = [
     path('owners/venue/<int:venue_id>/', venue_views.venue_dashboard, name='venue_dashboard'),
     path('owners/venue/<int:venue_id>/merchants/', venue_views.venue_merchants, name='venue_merchants'),
     path('owners/venue/<int:venue_id>/merchants/add/', venue_views.merchant_add, name='merchant_add'),
+    path('owners/venue/<int:venue_id>/merchants/import/', venue_views.merchant_import, name='merchant_import'),
+    path('owners/venue/<int:venue_id>/merchants/export/', venue_views.merchant_export, name='merchant_export'),
     path('owners/venue/<int:venue_id>/merchants/<int:merchant_id>/edit/', venue_views.merchant_edit, name='merchant_edit'),
     path('owners/venue/<int:venue_id>/merchants/<int:merchant_id>/delete/', venue_views.merchant_delete, name='merchant_delete'),
     path('owners/venue/<int:venue_id>/merchants/<int:merchant_id>/toggle-featured/', venue_views.merchant_toggle_featured, name='merchant_toggle_featured'),
@@ -52,6 +57,7 @@ urlpatterns = [
     path('pricing/', venue_views.pricing, name='pricing'),
     path('faq/', venue_views.faq, name='faq'),
     path('terms/', venue_views.terms, name='terms'),
+    path('metrics', metrics_view, name='metrics'),
     path('<slug:slug>/m/<int:merchant_id>/', venue_views.merchant_detail, name='merchant_detail'),
     path('<slug:slug>/m/<int:merchant_id>/follow/', venue_views.toggle_merchant_follow, name='merchant_follow'),
     path('<slug:slug>/m/<int:merchant_id>/updates/', venue_views.merchant_updates, name='merchant_updates'),
@@ -59,5 +65,7 @@ urlpatterns = [
 ]
 
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media, in production too; see MEDIA_OFFLOAD for handing the transfer to nginx.
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+]
@@ -0,0 +1,20 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created_at')
+    actions = ['retry_now']
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.QUEUED, run_after=timezone.now(), attempts=0,
+        )
+        self.message_user(request, f"{updated} jobs queued.")
@@ -0,0 +1,54 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from jobs.queue import claim, requeue_stale, run, worker_id
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs. Start one or more alongside the web process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help="Jobs claimed per poll.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once no jobs are due instead of polling.")
+
+    def handle(self, *args, **options):
+        worker = worker_id()
+        self.stopping = False
+        # Finish the jobs already claimed before exiting on a deploy or Ctrl+C.
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        self.stdout.write(f"Worker {worker} started")
+
+        ran = 0
+        last_sweep = 0.0
+        while not self.stopping:
+            close_old_connections()
+            try:
+                if time.monotonic() - last_sweep > 60:
+                    requeued = requeue_stale()
+                    if requeued:
+                        self.stdout.write(f"Requeued {requeued} abandoned jobs")
+                    last_sweep = time.monotonic()
+                jobs = claim(worker, options['batch_size'])
+            except OperationalError as exc:
+                # SQLite reports "database is locked" when another process is writing.
+                self.stderr.write(f"Could not claim jobs: {exc}")
+                jobs = []
+
+            for job in jobs:
+                run(job)
+                ran += 1
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(f"Worker {worker} stopped after {ran} jobs")
+
+    def _stop(self, signum, frame):
+        self.stopping = True
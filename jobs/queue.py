@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+from typing import Callable, Iterable, Optional, Union
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# A job still RUNNING after this long belongs to a worker that died; it is
+# queued again (counting the lost attempt).
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 3600
+
+_tasks: dict[str, Callable] = {}
+
+
+def task(name: Optional[str] = None, *, max_attempts: int = 5):
+    """
+    Register a function as a queue task. It is called with the job's JSON
+    payload as keyword arguments, and may run more than once (retries), so
+    it should be idempotent.
+    """
+    def register(func):
+        func.task_name = name or f"{func.__module__}.{func.__qualname__}"
+        func.max_attempts = max_attempts
+        _tasks[func.task_name] = func
+        return func
+    return register
+
+
+def _resolve(target: Union[str, Callable]) -> tuple[str, int]:
+    if callable(target):
+        return target.task_name, target.max_attempts
+    return target, _tasks[target].max_attempts if target in _tasks else 5
+
+
+def enqueue(
+    target: Union[str, Callable], *, run_after=None, key: str = '', using: str = 'default', **payload
+) -> Job:
+    """
+    Queue ``target(**payload)``. The job row is part of the current
+    transaction, so it only becomes visible to workers if that commits.
+
+    With a ``key``, an already queued job with the same key is returned
+    instead, which coalesces bursts of work into one run. Two transactions
+    racing can still queue one each, so keyed tasks must tolerate finding
+    nothing left to do.
+    """
+    name, max_attempts = _resolve(target)
+    if key:
+        pending = Job.objects.using(using).filter(key=key, status=Job.Status.QUEUED).first()
+        if pending is not None:
+            return pending
+    return Job.objects.using(using).create(
+        name=name, payload=payload, key=key, max_attempts=max_attempts, run_after=run_after or timezone.now(),
+    )
+
+
+def enqueue_batches(
+    target: Union[str, Callable], key: str, items: Iterable, *, batch_size: int = 100,
+    using: str = 'default', **payload,
+) -> int:
+    """
+    Queue one job per ``batch_size`` items, passing each chunk as ``key``
+    alongside ``payload``, e.g. a delivery job per hundred recipients
+    rather than one per recipient. Returns the number of jobs queued.
+    """
+    name, max_attempts = _resolve(target)
+    items = list(items)
+    now = timezone.now()
+    jobs = [
+        Job(name=name, payload={**payload, key: items[i:i + batch_size]}, max_attempts=max_attempts, run_after=now)
+        for i in range(0, len(items), batch_size)
+    ]
+    Job.objects.using(using).bulk_create(jobs, batch_size=500)
+    return len(jobs)
+
+
+def backoff(attempts: int) -> timedelta:
+    """Exponential delay before retry number ``attempts``, with jitter so failures do not retry in lockstep."""
+    seconds = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=seconds * random.uniform(0.5, 1.0))
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim(worker: str, limit: int, using: str = 'default') -> list[Job]:
+    """
+    Lock up to ``limit`` due jobs for ``worker``.
+
+    PostgreSQL workers skip rows another worker has locked. SQLite has no
+    row locks, so the status check in the UPDATE decides who gets a job and
+    the jobs are read back by this claim's timestamp.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        ids = list(
+            Job.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(status=Job.Status.QUEUED, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Job.objects.using(using).filter(pk__in=ids, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(
+        Job.objects.using(using)
+        .filter(pk__in=ids, status=Job.Status.RUNNING, locked_by=worker, locked_at=now)
+        .order_by('run_after', 'id')
+    )
+
+
+def run(job: Job, using: str = 'default') -> bool:
+    """Run a claimed job. It is deleted on success, retried later or marked failed otherwise."""
+    jobs = Job.objects.using(using).filter(pk=job.pk)
+    try:
+        func = _tasks.get(job.name)
+        if func is None:
+            raise LookupError(f"No task registered as {job.name!r}")
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.exception("Job %s failed for good after %s attempts", job, job.attempts)
+            jobs.update(status=Job.Status.FAILED, last_error=error, locked_by='', locked_at=None)
+        else:
+            retry_at = timezone.now() + backoff(job.attempts)
+            logger.warning("Job %s failed (attempt %s), retrying at %s", job, job.attempts, retry_at, exc_info=True)
+            jobs.update(status=Job.Status.QUEUED, run_after=retry_at, last_error=error, locked_by='', locked_at=None)
+        return False
+    jobs.delete()
+    return True
+
+
+def requeue_stale(using: str = 'default') -> int:
+    """Put jobs abandoned by dead workers back on the queue, or fail them if they are out of attempts."""
+    stale = Job.objects.using(using).filter(status=Job.Status.RUNNING, locked_at__lt=timezone.now() - LOCK_TIMEOUT)
+    reset = {'last_error': "Worker stopped before finishing the job.", 'locked_by': '', 'locked_at': None}
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.Status.FAILED, **reset)
+    return failed + stale.update(status=Job.Status.QUEUED, **reset)
+
+
+def run_pending(*, batch_size: int = 20, worker: Optional[str] = None, using: str = 'default') -> int:
+    """Run due jobs until none are left, including jobs they queue. Returns how many ran."""
+    worker = worker or worker_id()
+    ran = 0
+    while jobs := claim(worker, batch_size, using=using):
+        for job in jobs:
+            run(job, using=using)
+            ran += 1
+    return ran
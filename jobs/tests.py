@@ -0,0 +1,51 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import claim, enqueue, enqueue_batches, run, run_pending, task
+
+
+
+_job_calls = []
+
+
+@task('tests.record', max_attempts=2)
+def _record_job(values):
+    _job_calls.append(values)
+    if 'boom' in values:
+        raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        _job_calls.clear()
+
+    def test_batches_run_once_and_are_deleted(self):
+        self.assertEqual(enqueue_batches(_record_job, 'values', range(5), batch_size=2), 3)
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(_job_calls, [[0, 1], [2, 3], [4]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_then_fail(self):
+        job = enqueue(_record_job, values=['boom'])
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("RuntimeError: boom", job.last_error)
+        self.assertEqual(run_pending(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+
+    def test_workers_claim_disjoint_jobs(self):
+        for i in range(3):
+            enqueue(_record_job, values=[i])
+        first, second = claim('worker-1', 2), claim('worker-2', 5)
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertTrue(all(run(job) for job in first + second))
@@ -24,6 +24,7 @@ class MerchantCategoryAdmin(admin.ModelAdmin):
 @admin.register(Merchant)
 class MerchantAdmin(admin.ModelAdmin):
     list_display = ('name', 'lot_number', 'floor_display', 'category', 'is_featured', 'view_in_app')
+    list_select_related = ('floor__venue', 'category')
     list_filter = ('floor__venue', 'category', 'is_featured', 'is_halal')
     search_fields = ('name', 'lot_number', 'keywords')
 
@@ -58,6 +59,7 @@ class MerchantAdmin(admin.ModelAdmin):
 @admin.register(MerchantUpdate)
 class MerchantUpdateAdmin(admin.ModelAdmin):
     list_display = ('merchant', 'title', 'is_published', 'published_at')
+    list_select_related = ('merchant',)
     list_filter = ('is_published', 'published_at', 'merchant__floor__venue')
     search_fields = ('merchant__name', 'title', 'body')
 
@@ -65,6 +67,7 @@ class MerchantUpdateAdmin(admin.ModelAdmin):
 @admin.register(MerchantFollow)
 class MerchantFollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'merchant', 'notify_updates', 'notify_restock', 'created_at')
+    list_select_related = ('user', 'merchant')
     search_fields = ('user__username', 'user__email', 'merchant__name')
     list_filter = ('created_at', 'merchant__floor__venue')
 
@@ -72,6 +75,7 @@ class MerchantFollowAdmin(admin.ModelAdmin):
 @admin.register(MerchantMembership)
 class MerchantMembershipAdmin(admin.ModelAdmin):
     list_display = ('user', 'merchant', 'role', 'created_at')
+    list_select_related = ('user', 'merchant')
     list_filter = ('role', 'created_at', 'merchant__floor__venue')
     search_fields = ('user__username', 'user__email', 'merchant__name')
 
@@ -95,8 +99,9 @@ class ProductCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'merchant', 'is_active', 'updated_at')
-    list_filter = ('is_active', 'merchant__floor__venue', 'categories')
+    list_display = ('name', 'merchant', 'is_active', 'min_active_price_rm', 'in_stock', 'updated_at')
+    list_select_related = ('merchant',)
+    list_filter = ('is_active', 'in_stock', 'merchant__floor__venue', 'categories')
     search_fields = ('name', 'description', 'merchant__name')
     inlines = [ProductVariantInline, ProductImageInline]
     filter_horizontal = ('categories',)
@@ -5,3 +5,5 @@ class MerchantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'merchants'
 
+    def ready(self):
+        from . import signals  # noqa: F401
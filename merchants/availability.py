@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from django.db.models import Exists, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .utils import IN_LIST_CHUNK
+
+
+def availability_values(variants) -> dict:
+    """
+    ``Product`` update() values that recompute ``min_active_price_rm``,
+    ``total_stock`` and ``in_stock`` from ``variants`` (a ProductVariant
+    manager or queryset) in the same statement. Only active variants
+    count, and stock below zero counts as none.
+    """
+    active = variants.filter(product=OuterRef('pk'), is_active=True).order_by().values('product')
+    stocked = active.filter(stock_qty__gt=0)
+    return {
+        'min_active_price_rm': Subquery(active.annotate(price=Min('price_rm')).values('price')),
+        'total_stock': Coalesce(Subquery(stocked.annotate(stock=Sum('stock_qty')).values('stock')), Value(0)),
+        'in_stock': Exists(stocked),
+    }
+
+
+def refresh_product_availability(product_ids, using: str = 'default') -> int:
+    """
+    Recompute the denormalised price and stock columns of the given
+    products, a statement per 900 products. Call it in the transaction
+    that changed their variants so readers never see the two disagree.
+    """
+    from .models import Product, ProductVariant
+
+    product_ids = sorted(set(product_ids))
+    values = availability_values(ProductVariant.objects.using(using))
+    updated = 0
+    for i in range(0, len(product_ids), IN_LIST_CHUNK):
+        updated += Product.objects.using(using).filter(pk__in=product_ids[i:i + IN_LIST_CHUNK]).update(**values)
+    return updated
+
+
+def stale_products(products):
+    """
+    Primary keys from ``products`` (a Product queryset) whose stored price
+    and stock columns differ from their variants.
+    """
+    from .models import ProductVariant
+
+    expected = {
+        f'expected_{name}': expression
+        for name, expression in availability_values(ProductVariant.objects.using(products.db)).items()
+    }
+    rows = products.annotate(**expected).values_list(
+        'pk', 'min_active_price_rm', 'total_stock', 'in_stock', *expected,
+    )
+    return [pk for pk, *stored in rows if stored[:3] != stored[3:]]
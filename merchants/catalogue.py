@@ -0,0 +1,647 @@
+from __future__ import annotations
+
+import csv
+import io
+import ipaddress
+import json
+import os
+import socket
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from io import BytesIO
+from itertools import islice
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils._os import safe_join
+from PIL import Image
+
+from jobs.queue import enqueue
+
+from .availability import refresh_product_availability
+from .models import Product, ProductCategory, ProductImage, ProductVariant
+from .restock import record_restocks
+from .search import refresh_product_search
+from .utils import parse_bool
+
+
+# CSV feeds have one row per variant; consecutive rows with the same
+# ``product`` are one product. Product columns may be given on any of its
+# rows. Columns left out of the header are left unchanged on re-import.
+CSV_COLUMNS = ['product', 'description', 'categories', 'images', 'sku', 'variant', 'price_rm', 'stock_qty', 'is_active']
+
+# Separates several categories or images in one CSV cell.
+LIST_SEPARATOR = '|'
+
+PRODUCTS_PER_BATCH = 200
+MAX_REPORTED = 200
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+_MAX_REDIRECTS = 3
+# ProductVariant.stock_qty is a 32-bit IntegerField.
+_MAX_STOCK = 2 ** 31 - 1
+
+# Variant fields compared on re-import, in the order changes are listed.
+_VARIANT_FIELDS = ['product_id', 'name', 'price_rm', 'stock_qty', 'is_active']
+
+
+class CatalogueFileError(ValueError):
+    """The feed as a whole cannot be read."""
+
+
+@dataclass
+class CatalogueResult:
+    products_created: int = 0
+    products_updated: int = 0
+    variants_created: int = 0
+    variants_updated: int = 0
+    variants_unchanged: int = 0
+    categories_added: int = 0
+    categories_removed: int = 0
+    images_added: int = 0
+    images_removed: int = 0
+    failed: int = 0
+    # (line, message) for rejected rows and a readable diff, each capped at MAX_REPORTED.
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    changes: list[str] = field(default_factory=list)
+    dry_run: bool = False
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED:
+            self.errors.append((line, message))
+
+    def add_change(self, text: str) -> None:
+        if len(self.changes) < MAX_REPORTED:
+            self.changes.append(text)
+
+    @property
+    def changed(self) -> bool:
+        return any((
+            self.products_created, self.products_updated, self.variants_created, self.variants_updated,
+            self.categories_added, self.categories_removed, self.images_added, self.images_removed,
+        ))
+
+
+# Reading feeds
+
+def _split(value):
+    return [part.strip() for part in value.split(LIST_SEPARATOR) if part.strip()]
+
+
+def _csv_products(fh):
+    text = io.TextIOWrapper(fh, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = [cell.strip().lower().replace(' ', '_') for cell in next(reader, [])]
+        missing = {'product', 'sku', 'price_rm'} - set(header)
+        if missing:
+            raise CatalogueFileError(f"The header row is missing: {', '.join(sorted(missing))}.")
+
+        product = None
+        for cells in reader:
+            if not any(cells):
+                continue
+            row = dict(zip(header, (cell.strip() for cell in cells)))
+            name = row.get('product', '')
+            # A row without a product name stands alone, to be reported as invalid.
+            if product is None or not name or name.lower() != product['name'].lower():
+                if product is not None:
+                    yield product
+                product = {
+                    'line': reader.line_num, 'name': name, 'variants': [], 'is_active': None,
+                    'description': '' if 'description' in header else None,
+                    'categories': [] if 'categories' in header else None,
+                    'images': [] if 'images' in header else None,
+                }
+            if row.get('description') and not product['description']:
+                product['description'] = row['description']
+            for column in ('categories', 'images'):
+                if row.get(column) and not product[column]:
+                    product[column] = _split(row[column])
+            variant = {key: row[key] for key in ('sku', 'price_rm', 'stock_qty', 'is_active') if key in row}
+            variant.update(line=reader.line_num, name=row.get('variant', ''))
+            product['variants'].append(variant)
+        if product is not None:
+            yield product
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise CatalogueFileError(f"Could not read the CSV file ({exc}). Save it as UTF-8 CSV and try again.")
+    finally:
+        text.detach()
+
+
+def _json_product(line, item):
+    if not isinstance(item, dict):
+        raise CatalogueFileError(f"Item {line} is not an object.")
+    variants = item.get('variants')
+    categories, images = item.get('categories'), item.get('images')
+    if isinstance(variants, list):
+        variants = [
+            {key: '' if value is None else str(value).strip() for key, value in variant.items()} | {'line': line}
+            for variant in variants if isinstance(variant, dict)
+        ]
+    # Lists of the wrong type are left for CatalogueImporter._clean() to report.
+    return {
+        'line': line,
+        'name': str(item.get('name') or '').strip(),
+        'description': item.get('description'),
+        'is_active': item.get('is_active'),
+        'categories': _split(categories) if isinstance(categories, str) else categories,
+        'images': _split(images) if isinstance(images, str) else images,
+        'variants': [] if variants is None else variants,
+    }
+
+
+def _json_products(fh, lines):
+    text = io.TextIOWrapper(fh, encoding='utf-8-sig')
+    try:
+        if lines:
+            # JSON Lines: one product object per line, read as it streams in.
+            for number, raw in enumerate(text, start=1):
+                if raw.strip():
+                    yield _json_product(number, json.loads(raw))
+            return
+        data = json.load(text)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise CatalogueFileError(f"Could not read the JSON feed ({exc}).")
+    finally:
+        text.detach()
+    items = data.get('products') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise CatalogueFileError("A JSON feed must be a list of products or {\"products\": [...]}.")
+    # Checked before the first product is yielded, so a bad item imports nothing.
+    for number, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            raise CatalogueFileError(f"Item {number} is not an object.")
+    for number, item in enumerate(items, start=1):
+        yield _json_product(number, item)
+
+
+def read_feed(fh, filename: str):
+    """
+    Yield products, each ``{'line', 'name', 'description', 'categories',
+    'images', 'variants': [{'line', 'sku', 'name', 'price_rm', ...}]}``,
+    from a CSV, JSON Lines (``.jsonl``/``.ndjson``) or JSON (``.json``)
+    feed. CSV and JSON Lines are read incrementally; a ``.json`` array is
+    parsed whole. Values are left as text for the importer to validate;
+    ``None`` means the feed does not set that field.
+
+    Raises CatalogueFileError before yielding anything if any part of the
+    file cannot be read, so an import never stops halfway through a feed.
+    """
+    name = filename.lower()
+    if name.endswith('.json'):
+        fh.seek(0)
+        return _json_products(fh, lines=False)
+    reader = partial(_json_products, lines=True) if name.endswith(('.jsonl', '.ndjson')) else _csv_products
+    # Streamed formats are read through once first; only the current
+    # product is held in memory either time.
+    fh.seek(0)
+    for _ in reader(fh):
+        pass
+    fh.seek(0)
+    return reader(fh)
+
+
+# Images
+
+def _public_address(url):
+    """The address to fetch ``url`` from; raises ValidationError unless every address of its host is public."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValidationError(f"{url} is not an http(s) URL.")
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), type=socket.SOCK_STREAM)
+    except OSError:
+        raise ValidationError(f"Cannot resolve {parts.hostname}.")
+    addresses = [info[4][0].split('%')[0] for info in infos]
+    for address in addresses:
+        if not ipaddress.ip_address(address).is_global:
+            # Feeds must not make the server fetch from its own network.
+            raise ValidationError(f"{url} points to a private address.")
+    return addresses[0]
+
+
+class _PinnedAdapter(HTTPAdapter):
+    """
+    Connects to the address that was checked rather than resolving the host
+    again, which a DNS server could answer differently the second time.
+    TLS still verifies the certificate against the URL's host name.
+    """
+
+    def __init__(self, address, **kwargs):
+        self.address = address
+        super().__init__(**kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        hostname = host_params['host']
+        host_params['host'] = self.address
+        if host_params['scheme'] == 'https':
+            pool_kwargs.update(server_hostname=hostname, assert_hostname=hostname)
+        return host_params, pool_kwargs
+
+
+def _fetch(url, address):
+    parts = urlsplit(url)
+    session = requests.Session()
+    # A proxy would resolve the host itself.
+    session.trust_env = False
+    session.mount(f"{parts.scheme}://", _PinnedAdapter(address))
+    host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    return session.get(url, headers={'Host': host}, timeout=(5, 30), stream=True, allow_redirects=False)
+
+
+def download_image(url: str) -> bytes:
+    """
+    Fetch an image URL, following a few redirects and refusing private
+    addresses and bodies over MAX_IMAGE_BYTES. Raises ValidationError for
+    problems retrying will not fix and requests.RequestException otherwise.
+    """
+    for _ in range(_MAX_REDIRECTS + 1):
+        # Every hop is checked and pinned, redirects included.
+        with _fetch(url, _public_address(url)) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers['Location'])
+                continue
+            if 400 <= response.status_code < 500:
+                raise ValidationError(f"{url} returned HTTP {response.status_code}.")
+            response.raise_for_status()
+            body = BytesIO()
+            for chunk in response.iter_content(64 * 1024):
+                body.write(chunk)
+                if body.tell() > MAX_IMAGE_BYTES:
+                    raise ValidationError(f"{url} is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB.")
+            return body.getvalue()
+    raise ValidationError(f"{url} redirects too many times.")
+
+
+def attach_image(product_id: int, source: str, sort_order: int, content: bytes) -> ProductImage:
+    """Save image bytes from a feed as a ProductImage, through the default storage."""
+    try:
+        with Image.open(BytesIO(content)) as image:
+            image.verify()
+            extension = (image.format or 'jpeg').lower().replace('jpeg', 'jpg')
+    except Exception:
+        raise ValidationError(f"{source} is not an image.")
+    stem = os.path.splitext(os.path.basename(urlsplit(source).path))[0] or 'image'
+    product_image = ProductImage(product_id=product_id, source=source, sort_order=sort_order)
+    product_image.image.save(f"{stem[:80]}.{extension}", ContentFile(content), save=True)
+    return product_image
+
+
+# Importing
+
+def _is_url(reference):
+    return urlsplit(reference).scheme in ('http', 'https')
+
+
+class CatalogueImporter:
+    """
+    Upsert one merchant's catalogue from a feed (see read_feed()).
+
+    Variants are matched by SKU within the merchant, so importing the same
+    feed twice changes nothing the second time. A product is the one its
+    SKUs already belong to, else the merchant's product with that name,
+    else a new one. Products are handled ``batch_size`` at a time: each
+    batch costs a fixed number of queries for lookups and ``bulk_create``
+    / grouped ``update()`` writes in one transaction, plus the search
+    index refresh. Rows that fail validation are reported and skipped.
+
+    Images listed as URLs are fetched by a background job; with
+    ``images_dir``, other references are read from that directory. Only
+    images that came from a feed are removed when a feed stops listing
+    them.
+
+    With ``dry_run`` everything runs in a transaction that is rolled back,
+    so the result is an exact diff of what an import would do.
+    """
+
+    def __init__(self, merchant, *, dry_run: bool = False, images_dir: str | None = None,
+                 batch_size: int = PRODUCTS_PER_BATCH):
+        self.merchant = merchant
+        self.dry_run = dry_run
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.categories = {}
+        for category in ProductCategory.objects.all():
+            self.categories.setdefault(category.slug.lower(), category)
+            self.categories.setdefault(category.name.strip().lower(), category)
+        self.result = CatalogueResult(dry_run=dry_run)
+        self._skus = set()
+        # Products written by this import, by lower-cased name, so a product
+        # split across batches lands in one place.
+        self._products = {}
+
+    def run(self, products) -> CatalogueResult:
+        products = iter(products)
+        if not self.dry_run:
+            self._run(products)
+            return self.result
+        with transaction.atomic():
+            self._run(products)
+            transaction.set_rollback(True)
+        return self.result
+
+    def _run(self, products):
+        while batch := list(islice(products, self.batch_size)):
+            self._import_batch(batch)
+
+    def _clean(self, product):
+        """Validate a feed product in place; returns False if it must be skipped."""
+        errors = []
+        if not product['name']:
+            errors.append("Product name is required.")
+        elif len(product['name']) > 160:
+            errors.append("Product name is longer than 160 characters.")
+        for key in ('categories', 'images', 'variants'):
+            if product[key] is not None and not isinstance(product[key], list):
+                errors.append(f"{key} must be a list.")
+                product[key] = None if key != 'variants' else []
+        if product['categories'] is not None:
+            unknown = [name for name in product['categories'] if str(name).lower() not in self.categories]
+            if unknown:
+                errors.append(f"Unknown categories: {', '.join(map(str, unknown))}.")
+            product['categories'] = {self.categories[str(name).lower()].pk for name in product['categories']} if not unknown else set()
+        if product['images'] is not None:
+            product['images'] = [str(reference).strip() for reference in product['images'] if str(reference).strip()]
+            for reference in product['images']:
+                if len(reference) > 500:
+                    errors.append("Image references are limited to 500 characters.")
+                elif not _is_url(reference) and self.images_dir is None:
+                    errors.append(f"{reference} is not an http(s) URL.")
+        if product['is_active'] is not None:
+            try:
+                product['is_active'] = parse_bool(product['is_active'], True)
+            except ValidationError:
+                errors.append("is_active: use yes or no.")
+        if errors:
+            self.result.add_error(product['line'], " ".join(errors))
+            return False
+
+        variants = []
+        for variant in product['variants']:
+            try:
+                variants.append(self._clean_variant(variant))
+            except ValidationError as exc:
+                self.result.add_error(variant['line'], " ".join(exc.messages))
+        product['variants'] = variants
+        return bool(variants)
+
+    def _clean_variant(self, variant):
+        sku = variant.get('sku', '')
+        if not sku:
+            raise ValidationError("SKU is required.")
+        if len(sku) > 64:
+            raise ValidationError(f"SKU {sku} is longer than 64 characters.")
+        if sku in self._skus:
+            raise ValidationError(f"SKU {sku} appears more than once in the feed.")
+        self._skus.add(sku)
+        try:
+            price = Decimal(variant.get('price_rm', ''))
+        except InvalidOperation:
+            raise ValidationError(f"{sku}: price_rm must be a number.")
+        if not price.is_finite() or price < 0 or price != price.quantize(Decimal('0.01')) or price >= 10 ** 8:
+            raise ValidationError(f"{sku}: price_rm must be a positive amount with at most 2 decimal places.")
+        try:
+            stock = int(variant.get('stock_qty') or 0)
+        except ValueError:
+            raise ValidationError(f"{sku}: stock_qty must be a whole number.")
+        if not 0 <= stock <= _MAX_STOCK:
+            raise ValidationError(f"{sku}: stock_qty must be between 0 and {_MAX_STOCK}.")
+        name = variant.get('name', '')
+        if len(name) > 120:
+            raise ValidationError(f"{sku}: variant name is longer than 120 characters.")
+        try:
+            is_active = parse_bool(variant.get('is_active', ''), True)
+        except ValidationError:
+            raise ValidationError(f"{sku}: is_active must be yes or no.")
+        return {'sku': sku, 'name': name, 'price_rm': price.quantize(Decimal('0.01')), 'stock_qty': stock, 'is_active': is_active}
+
+    def _lookup(self, batch):
+        skus = [variant['sku'] for product in batch for variant in product['variants']]
+        variants = {}
+        for variant in (
+            ProductVariant.objects.filter(product__merchant=self.merchant, sku__in=skus)
+            .only(*_VARIANT_FIELDS, 'sku').order_by('pk')
+        ):
+            variants.setdefault(variant.sku, variant)
+
+        names = {product['name'].lower() for product in batch}
+        product_ids = {variant.product_id for variant in variants.values()}
+        product_ids |= {self._products[name] for name in names if name in self._products}
+        products = {}
+        by_name = {}
+        for product in (
+            Product.objects.filter(merchant=self.merchant)
+            .annotate(lower_name=Lower('name'))
+            .filter(Q(pk__in=product_ids) | Q(lower_name__in=names))
+            .only('pk', 'name', 'description', 'is_active').order_by('pk')
+        ):
+            products[product.pk] = product
+            by_name.setdefault(product.lower_name, product)
+        return variants, products, by_name
+
+    def _import_batch(self, batch):
+        batch = [product for product in batch if self._clean(product)]
+        if not batch:
+            return
+        variants, products, by_name = self._lookup(batch)
+        now = timezone.now()
+
+        new_products = []
+        product_updates = defaultdict(list)
+        resolved = []
+        for product in batch:
+            key = product['name'].lower()
+            existing = None
+            if key in self._products:
+                existing = products.get(self._products[key])
+            if existing is None:
+                existing = next(
+                    (products[variants[v['sku']].product_id] for v in product['variants']
+                     if v['sku'] in variants and variants[v['sku']].product_id in products),
+                    None,
+                ) or by_name.get(key)
+            if existing is None:
+                instance = Product(
+                    merchant=self.merchant, name=product['name'], description=product['description'] or '',
+                    is_active=True if product['is_active'] is None else product['is_active'],
+                )
+                new_products.append(instance)
+                self.result.add_change(f"+ product {instance.name} ({len(product['variants'])} variants)")
+            else:
+                instance = existing
+                changed = {'name': product['name']}
+                if product['description'] is not None:
+                    changed['description'] = product['description']
+                if product['is_active'] is not None:
+                    changed['is_active'] = product['is_active']
+                changed = {name: value for name, value in changed.items() if getattr(instance, name) != value}
+                if changed:
+                    for name, value in changed.items():
+                        setattr(instance, name, value)
+                    product_updates[tuple(sorted(changed.items()))].append(instance.pk)
+                    self.result.add_change(f"~ product {instance.name}: {', '.join(changed)}")
+            resolved.append((product, instance))
+
+        with transaction.atomic():
+            Product.objects.bulk_create(new_products, batch_size=500)
+            for values, pks in product_updates.items():
+                Product.objects.filter(pk__in=pks).update(**dict(values), updated_at=now)
+            for product, instance in resolved:
+                self._products[product['name'].lower()] = instance.pk
+            self.result.products_created += len(new_products)
+            self.result.products_updated += sum(len(pks) for pks in product_updates.values())
+
+            reindex = {instance.pk for instance in new_products}
+            reindex.update(pk for values, pks in product_updates.items() for pk in pks
+                           if any(name in ('name', 'description') for name, _ in values))
+            variants_reindex, availability_changed = self._write_variants(resolved, variants, {instance.pk for instance in new_products})
+            reindex |= variants_reindex
+            # bulk_create() and update() skip the signals that keep these columns current.
+            refresh_product_availability(availability_changed)
+            self._write_categories(resolved)
+            local_images = self._write_images(resolved)
+            refresh_product_search(reindex)
+
+        for product_id, reference, sort_order in local_images:
+            self._attach_local(product_id, reference, sort_order)
+
+    def _write_variants(self, resolved, variants, new_product_ids):
+        new_variants, updates, restocked, reindex, availability_changed = [], defaultdict(list), [], set(), set()
+        for product, instance in resolved:
+            for data in product['variants']:
+                data = {'product_id': instance.pk, **data}
+                variant = variants.get(data['sku'])
+                if variant is None:
+                    new_variants.append(ProductVariant(**data))
+                    reindex.add(instance.pk)
+                    availability_changed.add(instance.pk)
+                    if instance.pk not in new_product_ids:
+                        self.result.add_change(f"+ variant {data['sku']} on {instance.name}")
+                    continue
+                changed = {name: data[name] for name in _VARIANT_FIELDS if getattr(variant, name) != data[name]}
+                if not changed:
+                    self.result.variants_unchanged += 1
+                    continue
+                self.result.add_change(
+                    f"~ variant {data['sku']}: "
+                    + ", ".join(f"{name} {getattr(variant, name)} → {value}" for name, value in changed.items() if name != 'product_id')
+                    + (f" moved to {instance.name}" if 'product_id' in changed else '')
+                )
+                if 'name' in changed or 'product_id' in changed:
+                    reindex.update({instance.pk, variant.product_id})
+                if changed.keys() - {'name'}:
+                    availability_changed.update({instance.pk, variant.product_id})
+                if variant.stock_qty <= 0 < data['stock_qty']:
+                    restocked.append(variant.pk)
+                updates[tuple(changed.items())].append(variant.pk)
+
+        ProductVariant.objects.bulk_create(new_variants, batch_size=500)
+        # One statement per distinct set of new values: a price list often shares a few prices.
+        for values, pks in updates.items():
+            ProductVariant.objects.filter(pk__in=pks).update(**dict(values))
+        if restocked:
+            # update() skips the signal that announces variants coming back into stock.
+            record_restocks(ProductVariant.objects.filter(pk__in=restocked))
+        self.result.variants_created += len(new_variants)
+        self.result.variants_updated += sum(len(pks) for pks in updates.values())
+        return reindex, availability_changed
+
+    def _write_categories(self, resolved):
+        wanted = {instance.pk: product['categories'] for product, instance in resolved if product['categories'] is not None}
+        if not wanted:
+            return
+        Through = Product.categories.through
+        current = defaultdict(dict)
+        for pk, product_id, category_id in Through.objects.filter(product_id__in=wanted).values_list(
+            'pk', 'product_id', 'productcategory_id'
+        ):
+            current[product_id][category_id] = pk
+
+        names = {category.pk: category.name for category in self.categories.values()}
+        added, removed = [], []
+        for product, instance in resolved:
+            if instance.pk not in wanted:
+                continue
+            categories = wanted[instance.pk]
+            for category_id in sorted(categories - current[instance.pk].keys()):
+                added.append(Through(product_id=instance.pk, productcategory_id=category_id))
+                self.result.add_change(f"+ category {names[category_id]} on {instance.name}")
+            for category_id in sorted(current[instance.pk].keys() - categories):
+                removed.append(current[instance.pk][category_id])
+                self.result.add_change(f"- category {names[category_id]} on {instance.name}")
+        Through.objects.bulk_create(added, batch_size=1000, ignore_conflicts=True)
+        if removed:
+            Through.objects.filter(pk__in=removed).delete()
+        self.result.categories_added += len(added)
+        self.result.categories_removed += len(removed)
+
+    def _write_images(self, resolved):
+        wanted = {instance.pk: product['images'] for product, instance in resolved if product['images'] is not None}
+        if not wanted:
+            return []
+        current = defaultdict(dict)
+        for image in ProductImage.objects.filter(product_id__in=wanted).exclude(source='').only('pk', 'product_id', 'source', 'sort_order'):
+            current[image.product_id][image.source] = image
+
+        remote, local, stale, reorder = defaultdict(list), [], [], []
+        for product, instance in resolved:
+            if instance.pk not in wanted:
+                continue
+            references = wanted[instance.pk]
+            for sort_order, reference in enumerate(references):
+                image = current[instance.pk].get(reference)
+                if image is not None:
+                    if image.sort_order != sort_order:
+                        image.sort_order = sort_order
+                        reorder.append(image)
+                    continue
+                self.result.add_change(f"+ image {reference} on {instance.name}")
+                self.result.images_added += 1
+                if _is_url(reference):
+                    remote[instance.pk].append([reference, sort_order])
+                else:
+                    local.append((instance.pk, reference, sort_order))
+            for reference, image in current[instance.pk].items():
+                if reference not in references:
+                    stale.append(image.pk)
+                    self.result.add_change(f"- image {reference} on {instance.name}")
+
+        if reorder:
+            ProductImage.objects.bulk_update(reorder, ['sort_order'])
+        if stale:
+            # Deleted one by one so the stored files are released (see venues.signals).
+            self.result.images_removed += len(stale)
+            for image in ProductImage.objects.filter(pk__in=stale):
+                image.delete()
+        for product_id, images in remote.items():
+            enqueue('merchants.fetch_product_images', product_id=product_id, images=images)
+        return [] if self.dry_run else local
+
+    def _attach_local(self, product_id, reference, sort_order):
+        try:
+            path = safe_join(self.images_dir, reference)
+            with open(path, 'rb') as fh:
+                content = fh.read(MAX_IMAGE_BYTES + 1)
+            if len(content) > MAX_IMAGE_BYTES:
+                raise ValidationError(f"{reference} is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB.")
+            attach_image(product_id, reference, sort_order, content)
+        except (OSError, SuspiciousFileOperation) as exc:
+            self.result.add_error(0, f"Image {reference}: {exc}")
+        except ValidationError as exc:
+            self.result.add_error(0, " ".join(exc.messages))
+
+
+def import_catalogue(merchant, fh, filename: str, **options) -> CatalogueResult:
+    """Import a catalogue feed for ``merchant``; raises CatalogueFileError for unreadable files."""
+    return CatalogueImporter(merchant, **options).run(read_feed(fh, filename))
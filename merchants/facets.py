@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, Value, When
+from django.utils.http import urlencode
+from django.db.models.functions import Cast
+
+
+# Price ranges offered on item search, in RM: lower bound inclusive, upper
+# bound exclusive (None for open-ended). Prices have two decimal places,
+# so "under 10" is the filter min_price=0, max_price=9.99.
+PRICE_BUCKETS = [(0, 10), (10, 25), (25, 50), (50, 100), (100, None)]
+
+FACETS = ('category', 'merchant', 'floor', 'price')
+
+# Merchants beyond this many are left out of the facet list (the busiest are kept).
+MAX_MERCHANT_FACETS = 12
+
+_CENT = Decimal('0.01')
+
+
+def facet_url(params: dict, **changes) -> str:
+    """
+    Link to the current search (``params``) with ``changes`` applied, for
+    a facet option that toggles a filter. ``None`` or blank values drop
+    the parameter.
+    """
+    linked = {**params, **changes}
+    return '?' + urlencode({key: value for key, value in linked.items() if value not in (None, '')})
+
+
+@dataclass
+class ItemFilters:
+    """The facet selections of an item search; ``None`` means not filtered."""
+    category: str | None = None
+    merchant: int | None = None
+    floor: int | None = None
+    min_price: Decimal | None = None
+    max_price: Decimal | None = None
+    in_stock: bool = False
+
+    def apply(self, products, skip: str | None = None):
+        """Filter a Product queryset by every selection except the ``skip`` facet."""
+        if self.category and skip != 'category':
+            products = products.filter(categories__slug=self.category)
+        if self.merchant is not None and skip != 'merchant':
+            products = products.filter(merchant_id=self.merchant)
+        if self.floor is not None and skip != 'floor':
+            products = products.filter(merchant__floor_id=self.floor)
+        if skip != 'price':
+            if self.min_price is not None:
+                products = products.filter(min_active_price_rm__gte=self.min_price)
+            if self.max_price is not None:
+                products = products.filter(min_active_price_rm__lte=self.max_price)
+        if self.in_stock:
+            products = products.filter(in_stock=True)
+        return products
+
+
+def price_bucket_key(low, high) -> str:
+    return f"{low}-{'' if high is None else high}"
+
+
+def _price_bucket_expression():
+    return Case(
+        *[
+            When(
+                min_active_price_rm__gte=low,
+                **({} if high is None else {'min_active_price_rm__lt': high}),
+                then=Value(price_bucket_key(low, high)),
+            )
+            for low, high in PRICE_BUCKETS
+        ],
+        default=None,
+        output_field=CharField(),
+    )
+
+
+def _grouped(products, facet, key, label):
+    return (
+        products.order_by()
+        .values(facet=Value(facet, output_field=CharField()), key=Cast(key, CharField()), label=label)
+        .annotate(count=Count('pk', distinct=True))
+    )
+
+
+def item_facets(products, filters: ItemFilters) -> dict[str, list[dict]]:
+    """
+    Counts of ``products`` (a Product queryset restricted by venue, text
+    and distance but not by ``filters``) per category, merchant, floor and
+    price range, each counted with the other facets' selections applied so
+    shoppers can switch within a facet. One UNION ALL query, however many
+    categories or merchants the venue has.
+
+    Returns ``{facet: [{'key', 'label', 'count', 'selected'}, ...]}``.
+    """
+    parts = [
+        _grouped(
+            filters.apply(products, skip='category').filter(categories__is_active=True),
+            'category', 'categories__slug', Cast('categories__name', CharField()),
+        ),
+        _grouped(filters.apply(products, skip='merchant'), 'merchant', 'merchant_id', Cast('merchant__name', CharField())),
+        _grouped(filters.apply(products, skip='floor'), 'floor', 'merchant__floor_id', Cast('merchant__floor__name', CharField())),
+        _grouped(
+            filters.apply(products, skip='price').filter(min_active_price_rm__isnull=False),
+            'price', _price_bucket_expression(), Value('', output_field=CharField()),
+        ),
+    ]
+    facets = {facet: [] for facet in FACETS}
+    for row in parts[0].union(*parts[1:], all=True):
+        facets[row['facet']].append(row)
+
+    selected = {
+        'category': filters.category,
+        'merchant': None if filters.merchant is None else str(filters.merchant),
+        'floor': None if filters.floor is None else str(filters.floor),
+    }
+    for facet in ('category', 'merchant', 'floor'):
+        for row in facets[facet]:
+            row['selected'] = row['key'] == selected[facet]
+    facets['category'].sort(key=lambda row: row['label'].lower())
+    facets['floor'].sort(key=lambda row: row['label'].lower())
+    facets['merchant'].sort(key=lambda row: (not row['selected'], -row['count'], row['label'].lower()))
+    del facets['merchant'][MAX_MERCHANT_FACETS:]
+
+    counts = {row['key']: row['count'] for row in facets['price']}
+    facets['price'] = []
+    for low, high in PRICE_BUCKETS:
+        key = price_bucket_key(low, high)
+        if key not in counts:
+            continue
+        max_price = None if high is None else Decimal(high) - _CENT
+        facets['price'].append({
+            'key': key,
+            'label': f"RM{low}+" if high is None else f"RM{low}–{high}",
+            'count': counts[key],
+            'min_price': Decimal(low),
+            'max_price': max_price,
+            'selected': filters.min_price == low and filters.max_price == max_price,
+        })
+    return facets
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from venues.pagination import CursorPage, cursor_paginate, encode_cursor
+
+from .models import FeedEntry, MerchantFollow, MerchantUpdate
+
+
+def update_recipients(update):
+    """Follows that should see ``update``: opted in, and interested in its category if it has one."""
+    follows = MerchantFollow.objects.filter(merchant_id=update.merchant_id, notify_updates=True)
+    if update.category_id is not None:
+        follows = follows.filter(Q(categories__isnull=True) | Q(categories=update.category_id))
+    return follows
+
+
+def _visible_updates(user):
+    """Published updates from merchants the user follows, per their follow preferences."""
+    follows = MerchantFollow.objects.filter(user=user, notify_updates=True)
+    return MerchantUpdate.objects.filter(is_published=True).filter(
+        Q(merchant_id__in=follows.filter(categories__isnull=True).values('merchant_id'))
+        | Q(category__isnull=True, merchant_id__in=follows.values('merchant_id'))
+        | Exists(follows.filter(merchant=OuterRef('merchant_id'), categories=OuterRef('category_id')))
+    )
+
+
+def fan_out_update(update_id: int, using: str = 'default') -> int:
+    """
+    Copy a published update into its followers' inboxes, replacing any
+    earlier copies. Merchants with more than ``FEED_FANOUT_MAX_FOLLOWERS``
+    followers are left to fan-out on read. Returns the number of entries written.
+    """
+    update = MerchantUpdate.objects.using(using).filter(pk=update_id).first()
+    if update is None:
+        return 0
+
+    with transaction.atomic(using=using):
+        FeedEntry.objects.using(using).filter(update_id=update_id).delete()
+        user_ids = []
+        if update.is_published:
+            # One past the threshold is enough to know the merchant is too big.
+            limit = settings.FEED_FANOUT_MAX_FOLLOWERS + 1
+            user_ids = list(update_recipients(update).using(using).values_list('user_id', flat=True).distinct()[:limit])
+        fanned_out = len(user_ids) <= settings.FEED_FANOUT_MAX_FOLLOWERS
+        if fanned_out:
+            FeedEntry.objects.using(using).bulk_create(
+                [FeedEntry(user_id=user_id, update_id=update_id, published_at=update.published_at) for user_id in user_ids],
+                batch_size=1000,
+            )
+        MerchantUpdate.objects.using(using).filter(pk=update_id).update(fanned_out=fanned_out)
+    return len(user_ids) if fanned_out else 0
+
+
+def refresh_follow_inbox(user_id: int, merchant_id: int, using: str = 'default') -> None:
+    """Rebuild one user's inbox entries for one merchant after they (un)follow or change preferences."""
+    with transaction.atomic(using=using):
+        FeedEntry.objects.using(using).filter(user_id=user_id, update__merchant_id=merchant_id).delete()
+        visible = (
+            _visible_updates(user_id).using(using)
+            .filter(merchant_id=merchant_id, fanned_out=True)
+            .values_list('pk', 'published_at')
+        )
+        FeedEntry.objects.using(using).bulk_create(
+            [FeedEntry(user_id=user_id, update_id=pk, published_at=published_at) for pk, published_at in visible],
+            batch_size=1000,
+        )
+
+
+def feed_page(user, cursor: str | None, per_page: int) -> CursorPage:
+    """
+    One page of the user's feed, newest first.
+
+    With ``FEED_FANOUT`` on, fanned-out updates come from the user's inbox
+    and the rest (merchants above the follower threshold, or updates not
+    backfilled yet) are read from the merchants they follow; the two sorted
+    streams are merged under a shared ``(published_at, update id)`` cursor.
+    """
+    on_read = _visible_updates(user).select_related('merchant', 'merchant__floor', 'merchant__floor__venue')
+    if not settings.FEED_FANOUT:
+        return cursor_paginate(on_read, cursor, per_page)
+
+    inbox = cursor_paginate(
+        FeedEntry.objects.filter(user=user, update__is_published=True)
+        .select_related('update__merchant__floor__venue'),
+        cursor,
+        per_page,
+        id_field='update_id',
+    )
+    read = cursor_paginate(on_read.filter(fanned_out=False), cursor, per_page)
+
+    merged = sorted(
+        [entry.update for entry in inbox] + list(read),
+        key=lambda update: (update.published_at, update.pk),
+        reverse=True,
+    )
+    rows = merged[:per_page]
+    next_cursor = None
+    if rows and (len(merged) > per_page or inbox.has_next or read.has_next):
+        next_cursor = encode_cursor(rows[-1].published_at, rows[-1].pk)
+    return CursorPage(object_list=rows, next_cursor=next_cursor)
@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from merchants.feed import fan_out_update
+from merchants.models import MerchantFollow, MerchantUpdate
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy published updates that are not fanned out yet into followers' feed inboxes. "
+        "Resumable and safe to run while the site is live."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches to go easy on the database.")
+
+    def handle(self, *args, **options):
+        if not settings.FEED_FANOUT:
+            # Follow changes only maintain inboxes while fan-out is on, so entries written now could go stale.
+            raise CommandError("Set FEED_FANOUT=True before backfilling feed inboxes.")
+
+        hot_merchants = list(
+            MerchantFollow.objects.values('merchant_id')
+            .annotate(followers=Count('id'))
+            .filter(followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+            .values_list('merchant_id', flat=True)
+        )
+        pending = (
+            MerchantUpdate.objects.filter(is_published=True, fanned_out=False)
+            .exclude(merchant_id__in=hot_merchants)
+            .order_by('pk')
+        )
+
+        last_pk = 0
+        updates = entries = 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            for pk in batch:
+                entries += fan_out_update(pk)
+            updates += len(batch)
+            last_pk = batch[-1]
+            self.stdout.write(f"{updates} updates, {entries} entries written")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {updates} updates ({entries} entries); {len(hot_merchants)} merchants stay fan-out on read."
+        ))
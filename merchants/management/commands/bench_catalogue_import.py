@@ -0,0 +1,91 @@
+import csv
+import io
+import random
+import resource
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from merchants.catalogue import CSV_COLUMNS, import_catalogue
+from merchants.models import Merchant, ProductCategory
+from venues.models import Floor, Venue
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Ingest a generated catalogue feed on throwaway data (dry run, import, re-import, price update) and report throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skus', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back, so the
+        # configured database is left untouched.
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        owner = get_user_model().objects.create(username="bench-catalogue-owner")
+        venue = Venue.objects.create(owner=owner, name="Bench Mall", slug="bench-catalogue-mall")
+        merchant = Merchant.objects.create(floor=Floor.objects.create(venue=venue, name="G"), name="Bench Shop")
+        categories = ProductCategory.objects.bulk_create(
+            [ProductCategory(name=f"Bench {i}", slug=f"bench-catalogue-{i}") for i in range(20)]
+        )
+
+        for label, feed_options in (
+            ("dry run", {'dry_run': True}),
+            ("import", {}),
+            # The same feed again: every SKU matches and nothing changes.
+            ("re-import", {}),
+            ("price update", {'repriced': 0.1}),
+        ):
+            repriced = feed_options.pop('repriced', 0)
+            with tempfile.TemporaryFile() as fh:
+                self._write_feed(fh, random.Random(options['seed']), options['skus'], categories, repriced)
+                self._measure(label, options['skus'], lambda: import_catalogue(merchant, fh, 'feed.csv', **feed_options))
+
+    def _write_feed(self, fh, rng, skus, categories, repriced):
+        text = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow([column for column in CSV_COLUMNS if column != 'images'])
+        written = product = 0
+        while written < skus:
+            product += 1
+            tags = "|".join(category.name for category in rng.sample(categories, 2))
+            for size in ['S', 'M', 'L', 'XL'][:rng.randint(1, 4)]:
+                price = rng.randint(500, 20_000) / 100
+                if rng.random() < repriced:
+                    price += 1
+                writer.writerow([
+                    f"Product {product}", f"Description of product {product}", tags,
+                    f"SKU-{product}-{size}", size, f"{price:.2f}", rng.randint(0, 50), 'yes',
+                ])
+                written += 1
+        text.flush()
+        text.detach()
+
+    def _measure(self, label, skus, func):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        # Peak resident size of the whole process so far (KiB on Linux).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(
+            f"{label}: products +{result.products_created} ~{result.products_updated}, "
+            f"variants +{result.variants_created} ~{result.variants_updated} ={result.variants_unchanged}, "
+            f"categories +{result.categories_added}, {result.failed} failed; "
+            f"{elapsed * 1000:.0f} ms ({skus / elapsed:.0f} SKUs/s), {len(queries)} queries, peak RSS {peak / 1024:.0f} MiB"
+        )
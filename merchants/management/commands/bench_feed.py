@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from merchants.feed import fan_out_update, feed_page
+from merchants.models import Merchant, MerchantFollow, MerchantUpdate
+from venues.models import Floor, Venue
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare fan-out on read with the fan-out-on-write feed inbox on throwaway follows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2_000)
+        parser.add_argument('--merchants', type=int, default=1_000)
+        parser.add_argument('--follows', type=int, default=100_000)
+        parser.add_argument('--heavy-users', type=int, default=20, help="Users who follow 500 merchants each.")
+        parser.add_argument('--updates-per-merchant', type=int, default=5)
+        parser.add_argument('--threshold', type=int, default=1_000, help="FEED_FANOUT_MAX_FOLLOWERS for the run.")
+        parser.add_argument('--requests', type=int, default=30, help="Feed requests per user group and page.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back, so the
+        # configured database is left untouched.
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        users, heavy_users = self._seed(rng, options)
+
+        groups = {
+            'typical': rng.sample(users, min(options['requests'], len(users))),
+            'heavy': heavy_users,
+        }
+
+        with override_settings(FEED_FANOUT=False, FEED_FANOUT_MAX_FOLLOWERS=options['threshold']):
+            self._report('on read', groups, options)
+
+        with override_settings(FEED_FANOUT=True, FEED_FANOUT_MAX_FOLLOWERS=options['threshold']):
+            update_ids = list(MerchantUpdate.objects.values_list('pk', flat=True))
+            started = time.perf_counter()
+            entries = sum(fan_out_update(pk) for pk in update_ids)
+            seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"fan-out on write: {len(update_ids)} updates, {entries} entries in {seconds:.1f}s "
+                f"({seconds / len(update_ids) * 1000:.2f} ms/update)"
+            )
+            self._report('hybrid inbox', groups, options)
+
+    def _seed(self, rng, options):
+        User = get_user_model()
+        owner = User.objects.create(username="bench-feed-owner")
+        venue = Venue.objects.create(owner=owner, name="Bench Mall", slug="bench-feed-mall")
+        floor = Floor.objects.create(venue=venue, name="G")
+        merchants = Merchant.objects.bulk_create(
+            [Merchant(floor=floor, name=f"Shop {i}") for i in range(options['merchants'])], batch_size=2000
+        )
+        users = User.objects.bulk_create(
+            [User(username=f"bench-feed-{i}") for i in range(options['users'])], batch_size=2000
+        )
+        merchant_ids = [m.pk for m in merchants]
+        heavy = users[:options['heavy_users']]
+
+        # Merchant 0 is followed by everyone, which puts it over the fan-out threshold.
+        pairs = {(u.pk, merchant_ids[0]) for u in users}
+        for user in heavy:
+            pairs.update((user.pk, m) for m in rng.sample(merchant_ids, min(500, len(merchant_ids))))
+        while len(pairs) < options['follows']:
+            pairs.add((rng.choice(users).pk, rng.choice(merchant_ids)))
+        MerchantFollow.objects.bulk_create(
+            [MerchantFollow(user_id=u, merchant_id=m) for u, m in pairs], batch_size=5000
+        )
+
+        now = timezone.now()
+        updates = MerchantUpdate.objects.bulk_create(
+            [
+                MerchantUpdate(merchant_id=m, title=f"Update {i}")
+                for m in merchant_ids
+                for i in range(options['updates_per_merchant'])
+            ],
+            batch_size=5000,
+        )
+        for update in updates:
+            update.published_at = now - timedelta(minutes=rng.randrange(60 * 24 * 60))
+        MerchantUpdate.objects.bulk_update(updates, ['published_at'], batch_size=5000)
+
+        self.stdout.write(
+            f"seeded {len(users)} users, {len(merchants)} merchants, {len(pairs)} follows, {len(updates)} updates"
+        )
+        return users, heavy
+
+    def _report(self, label, groups, options):
+        for group, users in groups.items():
+            for depth in (1, 5):
+                timings = []
+                for user in users[:options['requests']]:
+                    cursor = None
+                    for _ in range(depth - 1):
+                        cursor = feed_page(user, cursor, 20).next_cursor
+                    started = time.perf_counter()
+                    feed_page(user, cursor, 20)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+                self.stdout.write(
+                    f"{label:<13} {group:<8} page {depth}: p50 {statistics.median(timings):7.2f} ms  p95 {p95:7.2f} ms"
+                )
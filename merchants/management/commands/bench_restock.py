@@ -0,0 +1,113 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from jobs.queue import run_pending
+from merchants.models import Merchant, MerchantFollow, Product, ProductCategory, ProductVariant, RestockEvent
+from merchants.restock import update_stock
+from venues.models import Floor, Venue
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Restock thousands of variants in one bulk update on throwaway data and time the notification pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variants', type=int, default=10_000)
+        parser.add_argument('--merchants', type=int, default=50)
+        parser.add_argument('--users', type=int, default=2_000)
+        parser.add_argument('--follows-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back, so the
+        # configured database is left untouched.
+        try:
+            with transaction.atomic(), override_settings(
+                RESTOCK_NOTIFY_WINDOW=0, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            ):
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        merchant_ids = self._seed(rng, options)
+
+        variants = ProductVariant.objects.filter(product__merchant_id__in=merchant_ids)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            updated = update_stock(variants, 5)
+            capture = time.perf_counter() - started
+        self.stdout.write(
+            f"capture: {updated} variants updated, {RestockEvent.objects.count()} restocks recorded "
+            f"in {capture * 1000:.0f} ms, {len(queries)} queries"
+        )
+
+        mail.outbox = []
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            jobs = run_pending(batch_size=50)
+            notify = time.perf_counter() - started
+        self.stdout.write(
+            f"notify: {jobs} jobs, {len(mail.outbox)} emails in {notify * 1000:.0f} ms, {len(queries)} queries"
+        )
+
+    def _seed(self, rng, options):
+        User = get_user_model()
+        owner = User.objects.create(username="bench-restock-owner")
+        venue = Venue.objects.create(owner=owner, name="Bench Mall", slug="bench-restock-mall")
+        floor = Floor.objects.create(venue=venue, name="G")
+        merchants = Merchant.objects.bulk_create(
+            [Merchant(floor=floor, name=f"Shop {i}") for i in range(options['merchants'])]
+        )
+        categories = ProductCategory.objects.bulk_create(
+            [ProductCategory(name=f"Category {i}", slug=f"bench-restock-{i}") for i in range(20)]
+        )
+
+        products = Product.objects.bulk_create(
+            [Product(merchant=merchants[i % len(merchants)], name=f"Item {i}") for i in range(options['variants'])],
+            batch_size=2000,
+        )
+        Product.categories.through.objects.bulk_create(
+            [Product.categories.through(product_id=p.pk, productcategory_id=rng.choice(categories).pk) for p in products],
+            batch_size=5000,
+        )
+        ProductVariant.objects.bulk_create(
+            [ProductVariant(product=p, price_rm="10.00", stock_qty=0) for p in products], batch_size=2000
+        )
+
+        users = User.objects.bulk_create(
+            [User(username=f"bench-restock-{i}", email=f"bench-restock-{i}@example.com") for i in range(options['users'])],
+            batch_size=2000,
+        )
+        follows = MerchantFollow.objects.bulk_create(
+            [
+                MerchantFollow(user=user, merchant=merchant, notify_restock=True)
+                for user in users
+                for merchant in rng.sample(merchants, min(options['follows_per_user'], len(merchants)))
+            ],
+            batch_size=5000,
+        )
+        # Half the follows only care about a couple of categories.
+        MerchantFollow.categories.through.objects.bulk_create(
+            [
+                MerchantFollow.categories.through(merchantfollow_id=follow.pk, productcategory_id=category.pk)
+                for follow in follows[::2]
+                for category in rng.sample(categories, 2)
+            ],
+            batch_size=5000,
+        )
+        self.stdout.write(
+            f"seeded {len(products)} variants across {len(merchants)} merchants, {len(follows)} follows"
+        )
+        return [m.pk for m in merchants]
@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from merchants.catalogue import CatalogueFileError, import_catalogue
+from merchants.models import Merchant
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert a merchant's products from a CSV, JSON or JSON Lines feed, matching variants by SKU. "
+        "Safe to re-run; use --dry-run to see the changes first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('merchant_id', type=int)
+        parser.add_argument('feed', help="Path to a .csv, .json, .jsonl or .ndjson file.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without saving anything.")
+        parser.add_argument('--images-dir', help="Directory that image references which are not URLs are relative to.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Products written per transaction.")
+
+    def handle(self, *args, **options):
+        merchant = Merchant.objects.filter(pk=options['merchant_id']).first()
+        if merchant is None:
+            raise CommandError(f"Merchant {options['merchant_id']} does not exist.")
+        if options['images_dir'] and not os.path.isdir(options['images_dir']):
+            raise CommandError(f"{options['images_dir']} is not a directory.")
+
+        try:
+            with open(options['feed'], 'rb') as fh:
+                result = import_catalogue(
+                    merchant, fh, options['feed'], dry_run=options['dry_run'],
+                    images_dir=options['images_dir'], batch_size=options['batch_size'],
+                )
+        except (OSError, CatalogueFileError) as exc:
+            raise CommandError(str(exc))
+
+        for change in result.changes:
+            self.stdout.write(change)
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}" if line else message)
+        verb = "Would change" if result.dry_run else "Changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: {result.products_created} products created, {result.products_updated} updated; "
+            f"{result.variants_created} variants created, {result.variants_updated} updated, "
+            f"{result.variants_unchanged} unchanged; categories +{result.categories_added}/-{result.categories_removed}; "
+            f"images +{result.images_added}/-{result.images_removed}; {result.failed} rows rejected."
+        ))
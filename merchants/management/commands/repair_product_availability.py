@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from merchants.availability import refresh_product_availability, stale_products
+from merchants.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Find products whose min_active_price_rm, total_stock or in_stock disagree with their variants "
+        "(after raw SQL or a bulk write that skipped the signals) and recompute them. Safe to run while the site is live."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help="Only report the products that are out of step.")
+
+    def handle(self, *args, **options):
+        products = Product.objects.order_by('pk')
+        last_pk = checked = repaired = 0
+        while True:
+            batch = list(products.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic():
+                stale = stale_products(Product.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]))
+                if stale and not options['dry_run']:
+                    refresh_product_availability(stale)
+            for pk in stale:
+                self.stdout.write(f"Product {pk} was out of step")
+            checked += len(batch)
+            repaired += len(stale)
+            last_pk = batch[-1]
+
+        verb = "need repairing" if options['dry_run'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} products; {repaired} {verb}."))
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+
+
+def backfill_search_documents(apps, schema_editor):
+    Merchant = apps.get_model('merchants', 'Merchant')
+    batch = []
+    for merchant in Merchant.objects.select_related('category').iterator(chunk_size=1000):
+        parts = [
+            merchant.name,
+            merchant.lot_number,
+            merchant.category.name if merchant.category_id else '',
+            merchant.keywords or '',
+            merchant.description,
+        ]
+        merchant.search_document = "\n".join(part for part in parts if part)
+        batch.append(merchant)
+        if len(batch) >= 1000:
+            Merchant.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    if batch:
+        Merchant.objects.bulk_update(batch, ['search_document'])
+
+
+def install_search_index(apps, schema_editor):
+    from merchants.search import install_merchant_search_index
+
+    install_merchant_search_index(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from merchants.search import uninstall_merchant_search_index
+
+    uninstall_merchant_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0003_merchant_latitude_merchant_longitude_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchant',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def install_search_index(apps, schema_editor):
+    from merchants.search import install_product_search_index
+
+    install_product_search_index(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from merchants.search import uninstall_product_search_index
+
+    uninstall_product_search_index(schema_editor)
+
+
+def backfill_search_documents(apps, schema_editor):
+    from merchants.search import product_document, trigrams
+
+    Product = apps.get_model('merchants', 'Product')
+    ProductSearchTrigram = apps.get_model('merchants', 'ProductSearchTrigram')
+    use_trigram_table = schema_editor.connection.vendor != 'postgresql'
+
+    products = Product.objects.select_related('merchant').prefetch_related('variants')
+    batch = []
+    for product in products.iterator(chunk_size=500):
+        product.search_document = product_document(product, product.variants.all())
+        batch.append(product)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['search_document'])
+
+    if use_trigram_table:
+        rows = []
+        for product_id, document in Product.objects.values_list('id', 'search_document').iterator(chunk_size=500):
+            rows.extend(ProductSearchTrigram(product_id=product_id, trigram=gram) for gram in trigrams(document))
+            if len(rows) >= 5000:
+                ProductSearchTrigram.objects.bulk_create(rows)
+                rows = []
+        if rows:
+            ProductSearchTrigram.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0004_merchant_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.CreateModel(
+            name='ProductSearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_trigrams', to='merchants.product')),
+            ],
+            options={
+                'unique_together': {('trigram', 'product')},
+            },
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:32
+
+from django.db import migrations, models
+
+
+def backfill_schedule(apps, schema_editor):
+    from venues.utils import parse_operating_hours
+
+    Merchant = apps.get_model('merchants', 'Merchant')
+    merchants = Merchant.objects.exclude(operating_hours__isnull=True).exclude(operating_hours='')
+    batch = []
+    for merchant in merchants.only('id', 'operating_hours').iterator(chunk_size=1000):
+        window = parse_operating_hours(merchant.operating_hours)
+        if window is None:
+            continue
+        merchant.opens_minute = window.opens_minute
+        merchant.closes_minute = window.closes_minute
+        merchant.is_overnight = window.is_overnight
+        merchant.open_days = window.days
+        batch.append(merchant)
+        if len(batch) >= 1000:
+            Merchant.objects.bulk_update(batch, ['opens_minute', 'closes_minute', 'is_overnight', 'open_days'])
+            batch = []
+    if batch:
+        Merchant.objects.bulk_update(batch, ['opens_minute', 'closes_minute', 'is_overnight', 'open_days'])
+
+
+def install_search_index(apps, schema_editor):
+    # SQLite rebuilt venues_merchant for the new columns, dropping the FTS triggers.
+    from merchants.search import install_merchant_search_index
+
+    install_merchant_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0005_product_search'),
+        ('venues', '0009_venue_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchant',
+            name='closes_minute',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='merchant',
+            name='is_overnight',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='merchant',
+            name='open_days',
+            field=models.PositiveSmallIntegerField(default=127, editable=False),
+        ),
+        migrations.AddField(
+            model_name='merchant',
+            name='opens_minute',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='merchant',
+            index=models.Index(fields=['opens_minute', 'closes_minute'], name='venues_merchant_hours_idx'),
+        ),
+        migrations.RunPython(backfill_schedule, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
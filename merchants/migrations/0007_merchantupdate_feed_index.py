@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0006_merchant_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='merchantupdate',
+            index=models.Index(fields=['is_published', 'merchant', 'published_at'], name='venues_update_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0007_merchantupdate_feed_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchantupdate',
+            name='category',
+            field=models.ForeignKey(blank=True, help_text='Only followers interested in this category see it (leave empty for everyone).', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='updates', to='merchants.productcategory'),
+        ),
+        migrations.AddField(
+            model_name='merchantupdate',
+            name='fanned_out',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_at', models.DateTimeField()),
+                ('update', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='merchants.merchantupdate')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'published_at', 'update'], name='merchants_feedentry_page_idx')],
+                'unique_together': {('user', 'update')},
+            },
+        ),
+    ]
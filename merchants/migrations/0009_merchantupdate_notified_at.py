@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:46
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_notified(apps, schema_editor):
+    # Updates published before notifications existed must not email anyone when next edited.
+    MerchantUpdate = apps.get_model('merchants', 'MerchantUpdate')
+    MerchantUpdate.objects.filter(is_published=True).update(notified_at=F('published_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0008_feed_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchantupdate',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+    ]
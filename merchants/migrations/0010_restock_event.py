@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0009_merchantupdate_notified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestockEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restock_events', to='merchants.merchant')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restock_events', to='merchants.product')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='restock_events', to='merchants.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['merchant', 'notified_at'], name='merchants_restock_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+def install_search_index(apps, schema_editor):
+    # SQLite rebuilt venues_merchant for the new columns, dropping the FTS triggers.
+    from merchants.search import install_merchant_search_index
+
+    install_merchant_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0010_restock_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchant',
+            name='logo_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='merchant',
+            name='storefront_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0011_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+    ]
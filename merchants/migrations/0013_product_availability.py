@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:19
+
+from django.db import migrations, models
+
+
+def backfill_availability(apps, schema_editor):
+    from merchants.availability import availability_values
+
+    alias = schema_editor.connection.alias
+    Product = apps.get_model('merchants', 'Product')
+    ProductVariant = apps.get_model('merchants', 'ProductVariant')
+    Product.objects.using(alias).update(**availability_values(ProductVariant.objects.using(alias)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0012_product_image_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_active_price_rm',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['min_active_price_rm'], name='merchants_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'min_active_price_rm'], name='merchants_product_stock_idx'),
+        ),
+        migrations.RunPython(backfill_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchants', '0013_product_availability'),
+        ('venues', '0011_stored_file'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='merchant',
+            index=models.Index(fields=['floor', 'is_featured', 'name'], name='venues_merchant_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='merchant',
+            index=models.Index(condition=models.Q(('is_halal', True)), fields=['floor', 'name'], name='venues_merchant_halal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='merchant',
+            index=models.Index(condition=models.Q(('accepts_ewallet', True)), fields=['floor', 'name'], name='venues_merchant_ewallet_idx'),
+        ),
+    ]
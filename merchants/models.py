@@ -1,5 +1,8 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+from venues.utils import ALL_DAYS, parse_operating_hours, parse_operating_hours_cached, schedule_is_open
 
 
 class MerchantCategory(models.Model):
@@ -25,6 +28,9 @@ class Merchant(models.Model):
 
     logo = models.ImageField(upload_to='logos/', blank=True, null=True)
     storefront_image = models.ImageField(upload_to='storefronts/', blank=True, null=True)
+    # Resized WebP/AVIF/JPEG copies, filled in by a background job (see venues.images).
+    logo_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    storefront_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     description = models.TextField(blank=True)
     operating_hours = models.CharField(max_length=100, blank=True, null=True, help_text="e.g. 10:00 AM - 10:00 PM")
@@ -42,12 +48,79 @@ class Merchant(models.Model):
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
 
+    # Denormalised text the full-text index is built from (see merchants.search).
+    search_document = models.TextField(blank=True, default='', editable=False)
+
+    # operating_hours parsed at save time (minutes since midnight, weekday
+    # bitmask with Monday as bit 0) so "open now" is a plain SQL filter.
+    opens_minute = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    closes_minute = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    is_overnight = models.BooleanField(default=False, editable=False)
+    open_days = models.PositiveSmallIntegerField(default=ALL_DAYS, editable=False)
+
     class Meta:
         db_table = "venues_merchant"
+        indexes = [
+            models.Index(fields=['opens_minute', 'closes_minute'], name='venues_merchant_hours_idx'),
+            # The directory lists a venue's floors featured first, then by name.
+            models.Index(fields=['floor', 'is_featured', 'name'], name='venues_merchant_listing_idx'),
+            # Partial indexes for the directory's halal and e-wallet filters.
+            models.Index(fields=['floor', 'name'], condition=models.Q(is_halal=True), name='venues_merchant_halal_idx'),
+            models.Index(fields=['floor', 'name'], condition=models.Q(accepts_ewallet=True), name='venues_merchant_ewallet_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.lot_number})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        merchant = super().from_db(db, field_names, values)
+        # Remembered so a rename can rebuild its products' search documents (see merchants.signals).
+        merchant._loaded_name = merchant.__dict__.get('name')
+        return merchant
+
+    def build_search_document(self):
+        parts = [
+            self.name,
+            self.lot_number,
+            self.category.name if self.category_id else '',
+            self.keywords or '',
+            self.description,
+        ]
+        return "\n".join(part for part in parts if part)
+
+    def apply_operating_hours(self):
+        window = parse_operating_hours(self.operating_hours)
+        if window is None:
+            self.opens_minute = self.closes_minute = None
+            self.is_overnight = False
+            self.open_days = ALL_DAYS
+        else:
+            self.opens_minute = window.opens_minute
+            self.closes_minute = window.closes_minute
+            self.is_overnight = window.is_overnight
+            self.open_days = window.days
+
+    def is_open_now(self, now=None):
+        """True/False from the stored schedule, or None when the hours are unknown."""
+        now = now or timezone.localtime()
+        if self.opens_minute is not None:
+            return schedule_is_open(self.opens_minute, self.closes_minute, self.is_overnight, self.open_days, now)
+        # Rows written without save() (bulk_create, queryset.update) have no columns yet.
+        window = parse_operating_hours_cached(self.operating_hours)
+        return window.is_open(now) if window else None
+
+    def save(self, *args, **kwargs):
+        self.search_document = self.build_search_document()
+        self.apply_operating_hours()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'search_document'}
+            if 'operating_hours' in update_fields:
+                update_fields |= {'opens_minute', 'closes_minute', 'is_overnight', 'open_days'}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 class ProductCategory(models.Model):
     name = models.CharField(max_length=80)
     slug = models.SlugField(unique=True)
@@ -60,6 +133,10 @@ class ProductCategory(models.Model):
         return self.name
 
 
+# Product columns kept in step with the variants by merchants.availability.
+AVAILABILITY_FIELDS = ('min_active_price_rm', 'total_stock', 'in_stock')
+
+
 class Product(models.Model):
     merchant = models.ForeignKey(Merchant, related_name='products', on_delete=models.CASCADE)
     categories = models.ManyToManyField(ProductCategory, blank=True, related_name='products')
@@ -68,21 +145,56 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
 
+    # Flattened product, merchant and variant text for item search (see merchants.search).
+    search_document = models.TextField(blank=True, default='', editable=False)
+
+    # Derived from the active variants whenever they change (see merchants.availability).
+    min_active_price_rm = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    total_stock = models.PositiveIntegerField(default=0, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['min_active_price_rm'], name='merchants_product_price_idx'),
+            models.Index(fields=['in_stock', 'min_active_price_rm'], name='merchants_product_stock_idx'),
+        ]
 
     def __str__(self):
         return f"{self.merchant.name}: {self.name}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # The derived columns are only written by merchants.availability, so a
+            # product loaded before its variants changed cannot save them back stale.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in AVAILABILITY_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class ProductSearchTrigram(models.Model):
+    """Trigram index over Product.search_document for databases without pg_trgm."""
+
+    product = models.ForeignKey(Product, related_name='search_trigrams', on_delete=models.CASCADE)
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = (('trigram', 'product'),)
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/')
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     alt_text = models.CharField(max_length=140, blank=True)
     sort_order = models.PositiveIntegerField(default=0)
+    # URL or file name a catalogue import took the image from (see merchants.catalogue); blank for uploads.
+    source = models.CharField(max_length=500, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['sort_order', 'id']
@@ -106,6 +218,32 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.name or 'Default'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        variant = super().from_db(db, field_names, values)
+        # Remembered so saving can spot an out-of-stock variant coming back (see merchants.restock).
+        variant._loaded_stock_qty = variant.__dict__.get('stock_qty')
+        # Moving a variant changes the availability of the product it left as well.
+        variant._loaded_product_id = variant.__dict__.get('product_id')
+        return variant
+
+
+class RestockEvent(models.Model):
+    """A variant that went from no stock to some, waiting to be announced to followers."""
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='restock_events')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='restock_events')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='restock_events')
+    created_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['merchant', 'notified_at'], name='merchants_restock_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant} restocked"
+
 
 class MerchantUpdate(models.Model):
     merchant = models.ForeignKey(Merchant, related_name='updates', on_delete=models.CASCADE)
@@ -114,10 +252,23 @@ class MerchantUpdate(models.Model):
     link = models.URLField(blank=True)
     is_published = models.BooleanField(default=True)
     published_at = models.DateTimeField(auto_now_add=True)
+    category = models.ForeignKey(
+        ProductCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='updates',
+        help_text="Only followers interested in this category see it (leave empty for everyone).",
+    )
+    # True once copied into followers' FeedEntry inboxes (see merchants.feed);
+    # otherwise the feed reads it from the merchant at request time.
+    fanned_out = models.BooleanField(default=False, editable=False)
+    # Set when follower emails are queued (see merchants.signals), so edits never notify twice.
+    notified_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-published_at']
         db_table = "venues_merchantupdate"
+        indexes = [
+            # Serves feed and per-merchant cursor pages: filter, then seek on published_at.
+            models.Index(fields=['is_published', 'merchant', 'published_at'], name='venues_update_feed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.merchant.name}: {self.title}"
@@ -139,6 +290,23 @@ class MerchantFollow(models.Model):
         return f"{self.user} follows {self.merchant}"
 
 
+class FeedEntry(models.Model):
+    """A published update copied into one follower's feed (fan-out on write)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feed_entries')
+    update = models.ForeignKey(MerchantUpdate, on_delete=models.CASCADE, related_name='feed_entries')
+    # Copy of update.published_at so a feed page is one index range scan.
+    published_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('user', 'update'),)
+        indexes = [
+            models.Index(fields=['user', 'published_at', 'update'], name='merchants_feedentry_page_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.update}"
+
+
 class MerchantMembership(models.Model):
     class Role(models.TextChoices):
         OWNER = 'OWNER', 'Owner'
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from jobs.queue import enqueue
+
+from .availability import refresh_product_availability
+from .models import MerchantFollow, ProductCategory, ProductVariant, RestockEvent
+from .utils import IN_LIST_CHUNK
+
+
+def _record(rows, using):
+    RestockEvent.objects.using(using).bulk_create(
+        [RestockEvent(variant_id=variant_id, product_id=product_id, merchant_id=merchant_id)
+         for variant_id, product_id, merchant_id in rows],
+        batch_size=1000,
+    )
+    # The first restock opens a window per merchant; later ones join its job.
+    run_after = timezone.now() + timedelta(seconds=settings.RESTOCK_NOTIFY_WINDOW)
+    for merchant_id in sorted({merchant_id for _, _, merchant_id in rows}):
+        enqueue(
+            'merchants.notify_restock_followers', key=f"restock:{merchant_id}", run_after=run_after,
+            using=using, merchant_id=merchant_id,
+        )
+    return len(rows)
+
+
+def _restock_rows(variants):
+    return list(
+        variants.filter(stock_qty__gt=0, is_active=True, product__is_active=True)
+        .values_list('pk', 'product_id', 'product__merchant_id')
+    )
+
+
+def record_restocks(variants, using: str = 'default') -> int:
+    """
+    Record ``variants`` (a ProductVariant queryset that just went from no
+    stock to some) as restocked and schedule their merchants' notifications.
+    Inactive variants and products are skipped. Returns the events recorded.
+    """
+    return _record(_restock_rows(variants.using(using)), using)
+
+
+def update_stock(queryset, stock_qty) -> int:
+    """
+    ``queryset.update(stock_qty=stock_qty)`` that also records every variant
+    going from no stock to some. ``stock_qty`` may be an expression such as
+    ``F('stock_qty') + 5``. Costs a few queries per 900 restocked variants
+    or changed products, not per row. Returns the number of variants updated.
+    """
+    using = queryset.db
+    with transaction.atomic(using=using):
+        empty = list(
+            queryset.filter(stock_qty__lte=0).select_for_update(of=('self',)).values_list('pk', flat=True)
+        )
+        # Read before the update, which may change what the queryset matches.
+        products = set(queryset.values_list('product_id', flat=True))
+        updated = queryset.update(stock_qty=stock_qty)
+        refresh_product_availability(products, using=using)
+        rows = []
+        for i in range(0, len(empty), IN_LIST_CHUNK):
+            rows += _restock_rows(ProductVariant.objects.using(using).filter(pk__in=empty[i:i + IN_LIST_CHUNK]))
+        if rows:
+            _record(rows, using)
+    return updated
+
+
+def restock_recipients(merchant_id: int, events):
+    """
+    Follows to tell about ``events`` (a RestockEvent queryset) in a single
+    query: opted in to restock news, with no category preference or one
+    that matches a category of a restocked product.
+    """
+    restocked_categories = ProductCategory.objects.filter(products__restock_events__in=events).values('pk')
+    return (
+        MerchantFollow.objects.filter(merchant_id=merchant_id, notify_restock=True)
+        .filter(Q(categories__isnull=True) | Q(categories__in=restocked_categories))
+        .exclude(user__email='')
+    )
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import re
+from math import ceil
+
+from django.db import connections
+from django.db.models import BooleanField, Count, FloatField, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+MERCHANT_FTS_TABLE = "venues_merchant_fts"
+
+_SQLITE_MERCHANT_INDEX = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {MERCHANT_FTS_TABLE}
+    USING fts5(name, search_document, content='venues_merchant', content_rowid='id')
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {MERCHANT_FTS_TABLE}_ai AFTER INSERT ON venues_merchant BEGIN
+        INSERT INTO {MERCHANT_FTS_TABLE}(rowid, name, search_document)
+        VALUES (new.id, new.name, new.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {MERCHANT_FTS_TABLE}_ad AFTER DELETE ON venues_merchant BEGIN
+        INSERT INTO {MERCHANT_FTS_TABLE}({MERCHANT_FTS_TABLE}, rowid, name, search_document)
+        VALUES ('delete', old.id, old.name, old.search_document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {MERCHANT_FTS_TABLE}_au AFTER UPDATE OF name, search_document ON venues_merchant BEGIN
+        INSERT INTO {MERCHANT_FTS_TABLE}({MERCHANT_FTS_TABLE}, rowid, name, search_document)
+        VALUES ('delete', old.id, old.name, old.search_document);
+        INSERT INTO {MERCHANT_FTS_TABLE}(rowid, name, search_document)
+        VALUES (new.id, new.name, new.search_document);
+    END
+    """,
+    f"INSERT INTO {MERCHANT_FTS_TABLE}({MERCHANT_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+# Name matches weigh more than the rest of the document on both backends.
+# The query must repeat the indexed expression for the planner to use the index.
+_POSTGRES_MERCHANT_VECTOR = (
+    "(setweight(to_tsvector('simple'::regconfig, {table}name), 'A')"
+    " || to_tsvector('simple'::regconfig, {table}search_document))"
+)
+
+_POSTGRES_MERCHANT_INDEX = [
+    "CREATE INDEX IF NOT EXISTS venues_merchant_search_gin ON venues_merchant "
+    f"USING gin ({_POSTGRES_MERCHANT_VECTOR.format(table='')})",
+]
+
+_SQLITE_MERCHANT_RANK = f"-bm25({MERCHANT_FTS_TABLE}, 10.0, 1.0)"
+
+_POSTGRES_PRODUCT_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS merchants_product_search_trgm "
+    "ON merchants_product USING gin (search_document gin_trgm_ops)",
+]
+
+# Share of the query's trigrams a product must contain to count as a match.
+PRODUCT_SIMILARITY_THRESHOLD = 0.5
+
+_fts_ready: dict[str, bool] = {}
+
+
+def search_terms(query: str | None) -> list[str]:
+    return [term.lower() for term in _TERM_RE.findall(query or "")]
+
+
+def install_merchant_search_index(schema_editor) -> None:
+    """
+    Create the backend-specific full-text index over ``Merchant.search_document``.
+
+    Safe to run repeatedly. On SQLite, Django rebuilds a table when altering
+    some columns, which drops the FTS triggers, so any later migration that
+    rebuilds ``venues_merchant`` should call this again.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        statements = _POSTGRES_MERCHANT_INDEX
+    elif vendor == "sqlite":
+        statements = _SQLITE_MERCHANT_INDEX
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+    _fts_ready.pop(schema_editor.connection.alias, None)
+
+
+def uninstall_merchant_search_index(schema_editor) -> None:
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS venues_merchant_search_gin")
+    elif vendor == "sqlite":
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {MERCHANT_FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {MERCHANT_FTS_TABLE}")
+    _fts_ready.pop(schema_editor.connection.alias, None)
+
+
+def _sqlite_fts_ready(alias: str) -> bool:
+    if alias not in _fts_ready:
+        with connections[alias].cursor() as cursor:
+            _fts_ready[alias] = MERCHANT_FTS_TABLE in connections[alias].introspection.table_names(cursor)
+    return _fts_ready[alias]
+
+
+def _legacy_merchant_filter(queryset, query: str):
+    return queryset.filter(
+        Q(name__icontains=query)
+        | Q(description__icontains=query)
+        | Q(lot_number__icontains=query)
+        | Q(category__name__icontains=query)
+        | Q(keywords__icontains=query)
+    )
+
+
+def search_merchants(queryset, query: str):
+    """
+    Filter a ``Merchant`` queryset by a free-text query, best matches first.
+
+    Every term is matched as a prefix so results update while the shopper is
+    still typing. Uses the PostgreSQL GIN index or the SQLite FTS5 table and
+    falls back to the old ``icontains`` scan when neither is available.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        document = _POSTGRES_MERCHANT_VECTOR.format(table='venues_merchant.')
+        queryset = queryset.filter(
+            RawSQL(f"{document} @@ to_tsquery('simple'::regconfig, %s)", [tsquery], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f"ts_rank({document}, to_tsquery('simple'::regconfig, %s))", [tsquery], output_field=FloatField())
+        )
+    elif vendor == "sqlite" and _sqlite_fts_ready(queryset.db):
+        match = " AND ".join(f'"{term}"*' for term in terms)
+        # Join the FTS table once; bm25() only works inside the MATCH query
+        # itself, so a correlated subquery per row would re-run the search.
+        queryset = queryset.extra(
+            tables=[MERCHANT_FTS_TABLE],
+            where=[f"{MERCHANT_FTS_TABLE}.rowid = venues_merchant.id", f"{MERCHANT_FTS_TABLE} MATCH %s"],
+            params=[match],
+            # bm25() is lower-is-better; negate it so both backends sort descending.
+            select={'search_rank': _SQLITE_MERCHANT_RANK},
+        )
+    else:
+        return _legacy_merchant_filter(queryset, query).order_by('-is_featured', 'name')
+
+    return queryset.order_by('-search_rank', '-is_featured', 'name')
+
+
+def trigrams(text: str | None) -> set[str]:
+    """Word trigrams padded the way pg_trgm pads them (two spaces before, one after)."""
+    grams = set()
+    for term in search_terms(text):
+        padded = f"  {term} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def product_document(product, variants) -> str:
+    parts = [product.name, product.description, product.merchant.name]
+    for variant in variants:
+        parts.extend([variant.name, variant.sku])
+    return "\n".join(part for part in parts if part)
+
+
+def install_product_search_index(schema_editor) -> None:
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in _POSTGRES_PRODUCT_INDEX:
+            schema_editor.execute(statement)
+
+
+def uninstall_product_search_index(schema_editor) -> None:
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS merchants_product_search_trgm")
+
+
+def refresh_product_search(product_ids, using: str = "default") -> None:
+    """Rebuild the search document (and trigram rows, off PostgreSQL) for the given products."""
+    from .models import Product, ProductSearchTrigram
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    products = list(
+        Product.objects.using(using).filter(pk__in=product_ids).select_related('merchant').prefetch_related('variants')
+    )
+    for product in products:
+        product.search_document = product_document(product, product.variants.all())
+    Product.objects.using(using).bulk_update(products, ['search_document'], batch_size=500)
+
+    if connections[using].vendor == "postgresql":
+        return
+    ProductSearchTrigram.objects.using(using).filter(product_id__in=product_ids).delete()
+    ProductSearchTrigram.objects.using(using).bulk_create(
+        [
+            ProductSearchTrigram(product_id=product.pk, trigram=gram)
+            for product in products
+            for gram in trigrams(product.search_document)
+        ],
+        batch_size=2000,
+    )
+
+
+def search_products(queryset, query: str):
+    """
+    Typo-tolerant filter for a ``Product`` queryset, most similar first.
+
+    Matches against the flattened ``search_document``, so no joins to
+    variants (and no DISTINCT) are needed. PostgreSQL uses pg_trgm word
+    similarity over a GIN index; other databases score the share of the
+    query's trigrams found in ``ProductSearchTrigram``. Annotates
+    ``search_rank`` (0..1).
+    """
+    from .models import ProductSearchTrigram
+
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    text = " ".join(terms)
+    if connections[queryset.db].vendor == "postgresql":
+        return queryset.filter(
+            RawSQL("%s <%% merchants_product.search_document", [text], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL("word_similarity(%s, merchants_product.search_document)", [text], output_field=FloatField())
+        ).order_by('-search_rank')
+
+    grams = trigrams(text)
+    needed = max(1, ceil(len(grams) * PRODUCT_SIMILARITY_THRESHOLD))
+    hits = (
+        ProductSearchTrigram.objects.using(queryset.db).filter(trigram__in=grams)
+        .values('product_id')
+        .annotate(hits=Count('id'))
+    )
+    return queryset.filter(
+        pk__in=hits.filter(hits__gte=needed).values('product_id')
+    ).annotate(
+        search_rank=Cast(
+            Subquery(hits.filter(product_id=OuterRef('pk')).values('hits')), FloatField()
+        ) / len(grams)
+    ).order_by('-search_rank')
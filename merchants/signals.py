@@ -0,0 +1,121 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from jobs.queue import enqueue
+
+from . import tasks
+from .availability import refresh_product_availability
+from .feed import refresh_follow_inbox
+from .models import Merchant, MerchantCategory, MerchantFollow, MerchantUpdate, Product, ProductVariant
+from .restock import record_restocks
+from .search import refresh_product_search
+
+
+@receiver(post_save, sender=MerchantCategory)
+def refresh_category_search_documents(sender, instance, created, **kwargs):
+    if created:
+        return
+    merchants = list(Merchant.objects.filter(category=instance).select_related('category'))
+    for merchant in merchants:
+        merchant.search_document = merchant.build_search_document()
+    Merchant.objects.bulk_update(merchants, ['search_document'], batch_size=500)
+
+
+def _refresh_merchant_product_search(merchant_id, using):
+    refresh_product_search(
+        Product.objects.using(using).filter(merchant_id=merchant_id).values_list('pk', flat=True), using=using
+    )
+
+
+@receiver(post_save, sender=Merchant)
+def refresh_merchant_product_search(sender, instance, created, raw=False, using='default', update_fields=None, **kwargs):
+    if created or raw or (update_fields is not None and 'name' not in update_fields):
+        return
+    # Unknown when the merchant was not loaded from the database; rebuild to be safe.
+    before = getattr(instance, '_loaded_name', None)
+    instance._loaded_name = instance.name
+    if before != instance.name:
+        transaction.on_commit(partial(_refresh_merchant_product_search, instance.pk, using), using=using)
+
+
+# Product documents are rebuilt on commit: variants are saved after their
+# product, and a cascading delete must not recreate trigram rows mid-delete.
+@receiver(post_save, sender=Product)
+def refresh_product_search_on_save(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        transaction.on_commit(partial(refresh_product_search, [instance.pk], using=using), using=using)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def refresh_product_search_on_variant_change(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        transaction.on_commit(partial(refresh_product_search, [instance.product_id], using=using), using=using)
+
+
+# Unlike the search document, availability is updated inside the saving
+# transaction: listings filter and sort on it.
+@receiver(post_save, sender=ProductVariant)
+def refresh_availability_on_variant_save(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_loaded_product_id', None)
+    instance._loaded_product_id = instance.product_id
+    refresh_product_availability({instance.product_id, before} - {None}, using=using)
+
+
+@receiver(post_delete, sender=ProductVariant)
+def refresh_availability_on_variant_delete(sender, instance, using='default', origin=None, **kwargs):
+    # A product or merchant deleted with its variants has nothing left to refresh.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is ProductVariant:
+        refresh_product_availability([instance.product_id], using=using)
+
+
+@receiver(post_save, sender=ProductVariant)
+def record_variant_restock(sender, instance, created, raw=False, using='default', **kwargs):
+    before = getattr(instance, '_loaded_stock_qty', None)
+    instance._loaded_stock_qty = instance.stock_qty
+    # Bulk changes go through merchants.restock.update_stock instead.
+    if not (raw or created) and before is not None and before <= 0 < instance.stock_qty:
+        record_restocks(ProductVariant.objects.filter(pk=instance.pk), using=using)
+
+
+# Queued in the same transaction as the save, so a rollback drops the jobs too.
+@receiver(post_save, sender=MerchantUpdate)
+def queue_update_jobs(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if settings.FEED_FANOUT:
+        enqueue(tasks.fan_out_update, update_id=instance.pk, using=using)
+    if instance.is_published and instance.notified_at is None:
+        # Stamped here rather than in the job so this instance cannot clear it on its next save.
+        instance.notified_at = timezone.now()
+        MerchantUpdate.objects.using(using).filter(pk=instance.pk).update(notified_at=instance.notified_at)
+        enqueue(tasks.notify_update_followers, update_id=instance.pk, using=using)
+
+
+@receiver(post_save, sender=MerchantFollow)
+def refresh_inbox_on_follow(sender, instance, raw=False, using='default', **kwargs):
+    if settings.FEED_FANOUT and not raw:
+        transaction.on_commit(partial(refresh_follow_inbox, instance.user_id, instance.merchant_id, using=using), using=using)
+
+
+@receiver(post_delete, sender=MerchantFollow)
+def refresh_inbox_on_unfollow(sender, instance, using='default', origin=None, **kwargs):
+    # Deleting a user or merchant cascades to their feed entries already.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if settings.FEED_FANOUT and origin_model is MerchantFollow:
+        transaction.on_commit(partial(refresh_follow_inbox, instance.user_id, instance.merchant_id, using=using), using=using)
+
+
+@receiver(m2m_changed, sender=MerchantFollow.categories.through)
+def refresh_inbox_on_follow_categories(sender, instance, action, reverse, using='default', **kwargs):
+    if settings.FEED_FANOUT and not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(partial(refresh_follow_inbox, instance.user_id, instance.merchant_id, using=using), using=using)
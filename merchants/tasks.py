@@ -0,0 +1,173 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from jobs.queue import enqueue_batches, task
+
+from . import catalogue, feed
+from .models import Merchant, MerchantFollow, MerchantUpdate, Product, ProductImage, RestockEvent
+from .restock import restock_recipients
+
+
+logger = logging.getLogger(__name__)
+
+# Recipients per delivery job; one mail connection is reused for the batch.
+NOTIFY_BATCH_SIZE = 100
+
+# Products listed in one restock email; the rest are summarised.
+RESTOCK_EMAIL_PRODUCTS = 10
+
+# Announced restock events are kept this long, then purged.
+RESTOCK_EVENT_RETENTION = timedelta(days=7)
+
+
+def _absolute_url(path):
+    scheme = 'http' if settings.DEBUG else 'https'
+    return f"{scheme}://{Site.objects.get_current().domain}{path}"
+
+
+@task('merchants.fan_out_update')
+def fan_out_update(update_id):
+    feed.fan_out_update(update_id)
+
+
+@task('merchants.notify_update_followers')
+def notify_update_followers(update_id):
+    """Split an update's email recipients into delivery jobs."""
+    update = MerchantUpdate.objects.filter(pk=update_id, is_published=True).first()
+    if update is None:
+        return
+    user_ids = (
+        feed.update_recipients(update)
+        .exclude(user__email='')
+        .order_by('user_id')
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    # All or nothing, so a retry never queues the same recipients twice.
+    with transaction.atomic():
+        enqueue_batches(
+            deliver_update_notifications, 'user_ids', user_ids, batch_size=NOTIFY_BATCH_SIZE, update_id=update_id
+        )
+
+
+@task('merchants.deliver_update_notifications')
+def deliver_update_notifications(update_id, user_ids):
+    update = (
+        MerchantUpdate.objects.select_related('merchant__floor__venue')
+        .filter(pk=update_id, is_published=True)
+        .first()
+    )
+    if update is None:
+        return
+
+    merchant = update.merchant
+    path = reverse('merchant_updates', args=[merchant.floor.venue.slug, merchant.pk])
+    url = _absolute_url(path)
+    subject = f"{merchant.name}: {update.title}"
+
+    users = get_user_model().objects.filter(pk__in=user_ids).exclude(email='').only('username', 'email')
+    messages = [
+        EmailMessage(
+            subject,
+            render_to_string('merchants/emails/update_notification.txt', {'user': user, 'update': update, 'url': url}),
+            to=[user.email],
+        )
+        for user in users
+    ]
+    get_connection().send_messages(messages)
+
+
+@task('merchants.notify_restock_followers')
+def notify_restock_followers(merchant_id):
+    """Announce every restock a merchant collected during its window (see merchants.restock)."""
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = RestockEvent.objects.filter(merchant_id=merchant_id, notified_at__isnull=True).update(notified_at=now)
+        if claimed:
+            events = RestockEvent.objects.filter(merchant_id=merchant_id, notified_at=now)
+            user_ids = restock_recipients(merchant_id, events).order_by('user_id').values_list('user_id', flat=True).distinct()
+            enqueue_batches(
+                deliver_restock_notifications, 'user_ids', user_ids, batch_size=NOTIFY_BATCH_SIZE,
+                merchant_id=merchant_id, restocked_at=now.isoformat(),
+            )
+        RestockEvent.objects.filter(merchant_id=merchant_id, notified_at__lt=now - RESTOCK_EVENT_RETENTION).delete()
+
+
+@task('merchants.deliver_restock_notifications')
+def deliver_restock_notifications(merchant_id, restocked_at, user_ids):
+    merchant = Merchant.objects.select_related('floor__venue').filter(pk=merchant_id).first()
+    if merchant is None:
+        return
+    slug = merchant.floor.venue.slug
+    products = list(
+        Product.objects.filter(
+            restock_events__merchant_id=merchant_id,
+            restock_events__notified_at=parse_datetime(restocked_at),
+            is_active=True,
+        ).distinct().order_by('name')
+    )
+    product_categories = defaultdict(set)
+    for product_id, category_id in Product.categories.through.objects.filter(
+        product_id__in=[p.pk for p in products]
+    ).values_list('product_id', 'productcategory_id'):
+        product_categories[product_id].add(category_id)
+    follow_categories = defaultdict(set)
+    for user_id, category_id in MerchantFollow.categories.through.objects.filter(
+        merchantfollow__merchant_id=merchant_id, merchantfollow__user_id__in=user_ids
+    ).values_list('merchantfollow__user_id', 'productcategory_id'):
+        follow_categories[user_id].add(category_id)
+
+    links = {p.pk: _absolute_url(reverse('product_detail', args=[slug, p.pk])) for p in products}
+    merchant_url = _absolute_url(reverse('merchant_detail', args=[slug, merchant.pk]))
+
+    messages = []
+    for user in get_user_model().objects.filter(pk__in=user_ids).exclude(email='').only('username', 'email'):
+        wanted = follow_categories.get(user.pk)
+        relevant = [p for p in products if not wanted or wanted & product_categories[p.pk]]
+        if not relevant:
+            continue
+        shown = relevant[:RESTOCK_EMAIL_PRODUCTS]
+        context = {
+            'user': user,
+            'merchant': merchant,
+            'products': [(p, links[p.pk]) for p in shown],
+            'more': len(relevant) - len(shown),
+            'url': merchant_url,
+        }
+        messages.append(EmailMessage(
+            f"Back in stock at {merchant.name}",
+            render_to_string('merchants/emails/restock_notification.txt', context),
+            to=[user.email],
+        ))
+    get_connection().send_messages(messages)
+
+
+@task('merchants.fetch_product_images', max_attempts=5)
+def fetch_product_images(product_id, images):
+    """
+    Download catalogue image URLs (``[[url, sort_order], ...]``) the product
+    does not have yet. Broken links are logged and skipped; network errors
+    fail the job so it retries, without refetching what was already saved.
+    """
+    if not Product.objects.filter(pk=product_id).exists():
+        return
+    existing = set(ProductImage.objects.filter(product_id=product_id).values_list('source', flat=True))
+    for url, sort_order in images:
+        if url in existing:
+            continue
+        try:
+            catalogue.attach_image(product_id, url, sort_order, catalogue.download_image(url))
+        except ValidationError as exc:
+            logger.warning("Skipped catalogue image for product %s: %s", product_id, " ".join(exc.messages))
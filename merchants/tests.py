@@ -0,0 +1,652 @@
+import json
+import random
+import tempfile
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from math import asin, atan2, cos, degrees, pi, radians, sin
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from accounts.models import UserProfile
+from jobs.models import Job
+from jobs.queue import enqueue, run_pending
+from merchants import catalogue, search
+from merchants import utils as geo
+from merchants.catalogue import CatalogueFileError, download_image, import_catalogue
+from merchants.facets import ItemFilters, item_facets
+from merchants.feed import feed_page
+from merchants.models import (
+    FeedEntry,
+    Merchant,
+    MerchantCategory,
+    MerchantFollow,
+    MerchantMembership,
+    MerchantUpdate,
+    Product,
+    ProductCategory,
+    ProductVariant,
+    RestockEvent,
+)
+from merchants.restock import update_stock
+from merchants.search import refresh_product_search, search_merchants, search_products
+from venues.models import Floor
+from venues.testing import create_floor, create_venue
+
+
+
+class GeohashTests(SimpleTestCase):
+    def assertCovered(self, box, points):
+        cover = geo.geohash_cover(*box)
+        self.assertTrue(cover)
+        for lat, lon in points:
+            self.assertTrue(geo.geohash_encode(lat, lon).startswith(tuple(cover)), (box, lat, lon, cover))
+
+    def test_encode_known_vectors(self):
+        for (lat, lon, precision), expected in [
+            ((57.64911, 10.40744, 11), "u4pruydqqvj"),
+            ((42.6, -5.6, 5), "ezs42"),
+            ((0.0, 0.0, 12), "s00000000000"),
+            ((-90.0, -180.0, 12), "000000000000"),
+            ((90.0, 180.0, 12), "zzzzzzzzzzzz"),
+        ]:
+            self.assertEqual(geo.geohash_encode(lat, lon, precision), expected)
+
+    def test_cover_contains_every_point_of_the_box(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            lat, lon = rng.uniform(-89, 89), rng.uniform(-179, 179)
+            box = (lat, min(lat + rng.uniform(0, 1), 90.0), lon, min(lon + rng.uniform(0, 1), 180.0))
+            corners = [(box[i], box[j]) for i in (0, 1) for j in (2, 3)]
+            inside = [(rng.uniform(box[0], box[1]), rng.uniform(box[2], box[3])) for _ in range(20)]
+            self.assertCovered(box, corners + inside)
+
+    def test_cover_at_cell_edges_and_poles(self):
+        # Edges of the "s" cell and its precision 2 children.
+        self.assertCovered((0.0, 45.0, 0.0, 45.0), [(0.0, 0.0), (45.0, 45.0), (0.0, 45.0), (45.0, 0.0)])
+        self.assertCovered((5.625, 11.25, 11.25, 22.5), [(5.625, 11.25), (11.25, 22.5)])
+        self.assertCovered((89.5, 90.0, -180.0, 180.0), [(90.0, -180.0), (90.0, 180.0), (89.5, 0.0)])
+        self.assertCovered((-90.0, -89.0, 170.0, 180.0), [(-90.0, 180.0), (-89.0, 170.0)])
+        # Boxes crossing the antimeridian leave the filtering to the bounding box.
+        self.assertEqual(geo.geohash_cover(0.0, 1.0, 179.5, 180.5), [])
+        self.assertEqual(geo.geohash_cover(0.0, 1.0, -180.5, -179.5), [])
+
+    def test_bounding_box_holds_the_whole_circle(self):
+        rng = random.Random(11)
+        for lat, lon, radius in [(3.139, 101.6869, 30), (60.0, 10.0, 500), (10.0, 179.9, 100), (89.8, 0.0, 50), (-89.9, 45.0, 20)]:
+            box = geo.bounding_box(lat, lon, radius)
+            for _ in range(500):
+                # A point up to ``radius`` away in a random direction.
+                angle, bearing = rng.uniform(0, 0.999) * radius / geo.EARTH_RADIUS_KM, rng.uniform(0, 2 * pi)
+                p_lat = asin(sin(radians(lat)) * cos(angle) + cos(radians(lat)) * sin(angle) * cos(bearing))
+                p_lon = radians(lon) + atan2(sin(bearing) * sin(angle) * cos(radians(lat)), cos(angle) - sin(radians(lat)) * sin(p_lat))
+                p_lat, p_lon = degrees(p_lat), (degrees(p_lon) + 180) % 360 - 180
+                self.assertLessEqual(geo.haversine_km(lat, lon, p_lat, p_lon), radius)
+                wrapped = p_lon + 360 if p_lon < box[2] else p_lon - 360 if p_lon > box[3] else p_lon
+                self.assertTrue(box[0] <= p_lat <= box[1] and box[2] <= wrapped <= box[3], (lat, lon, p_lat, p_lon))
+
+
+class DistanceExpressionTests(TestCase):
+    origin = (3.139, 101.6869)
+
+    @classmethod
+    def setUpTestData(cls):
+        floor = create_floor()
+        rng = random.Random(5)
+        points = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(60)]
+        # Both ends of the clamp: the origin itself and its antipode.
+        points += [cls.origin, (-cls.origin[0], cls.origin[1] - 180)]
+        Merchant.objects.bulk_create(
+            Merchant(floor=floor, name=f"M{i}", latitude=lat, longitude=lon) for i, (lat, lon) in enumerate(points)
+        )
+        Merchant.objects.create(floor=floor, name="Unmapped")
+
+    def test_sql_distance_matches_haversine_and_orders_and_filters(self):
+        merchants = Merchant.objects.annotate(distance=geo.haversine_expression('latitude', 'longitude', *self.origin))
+        expected = {
+            m.name: geo.haversine_km(*self.origin, m.latitude, m.longitude) for m in merchants.exclude(latitude=None)
+        }
+        for merchant in merchants.exclude(latitude=None):
+            self.assertAlmostEqual(merchant.distance, expected[merchant.name], delta=1e-6)
+        self.assertIsNone(merchants.get(name="Unmapped").distance)
+
+        nearest = [m.name for m in merchants.exclude(latitude=None).order_by('distance')]
+        self.assertEqual(nearest, sorted(expected, key=expected.get))
+        within = {m.name for m in merchants.filter(distance__lte=5000)}
+        self.assertEqual(within, {name for name, distance in expected.items() if distance <= 5000})
+
+
+@override_settings(FEED_FANOUT=True, FEED_FANOUT_MAX_FOLLOWERS=2)
+class FeedInboxTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        floor = create_floor()
+        self.shopper, self.muted, self.other = (User.objects.create_user(name, password='pw') for name in ('shopper', 'muted', 'other'))
+        self.shoes = ProductCategory.objects.create(name="Shoes", slug="shoes")
+        bags = ProductCategory.objects.create(name="Bags", slug="bags")
+        self.kopi, self.boots, self.hot = (Merchant.objects.create(floor=floor, name=name) for name in ("Kopi", "Boots", "Hot"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MerchantFollow.objects.create(user=self.shopper, merchant=self.kopi)
+            MerchantFollow.objects.create(user=self.muted, merchant=self.kopi, notify_updates=False)
+            MerchantFollow.objects.create(user=self.shopper, merchant=self.boots).categories.add(self.shoes)
+            # Three followers puts "Hot" over the threshold, so it is read at request time.
+            for user in (self.shopper, self.muted, self.other):
+                MerchantFollow.objects.create(user=user, merchant=self.hot)
+            for i in range(12):
+                MerchantUpdate.objects.create(merchant=self.kopi, title=f"Kopi {i}")
+                MerchantUpdate.objects.create(merchant=self.hot, title=f"Hot {i}")
+            MerchantUpdate.objects.create(merchant=self.boots, title="New boots", category=self.shoes)
+            MerchantUpdate.objects.create(merchant=self.boots, title="New bags", category=bags)
+            MerchantUpdate.objects.create(merchant=self.boots, title="Sale")
+        run_pending()
+
+    def _walk(self, user):
+        seen, cursor = [], None
+        while True:
+            page = feed_page(user, cursor, 5)
+            seen.extend(page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_hybrid_feed_matches_fan_out_on_read(self):
+        self.assertFalse(MerchantUpdate.objects.filter(merchant=self.hot, fanned_out=True).exists())
+        self.assertFalse(FeedEntry.objects.filter(update__merchant=self.hot).exists())
+        self.assertEqual(FeedEntry.objects.filter(user=self.shopper).count(), 12 + 2)
+
+        seen = self._walk(self.shopper)
+        with override_settings(FEED_FANOUT=False):
+            self.assertEqual(seen, self._walk(self.shopper))
+        self.assertEqual(len(seen), 12 + 12 + 2)
+        self.assertNotIn("New bags", [update.title for update in seen])
+        self.assertEqual([update.merchant for update in self._walk(self.muted)], [self.hot] * 12)
+
+    def test_unfollow_and_preferences_update_the_inbox(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MerchantFollow.objects.get(user=self.shopper, merchant=self.kopi).delete()
+            MerchantFollow.objects.get(user=self.shopper, merchant=self.boots).categories.clear()
+        titles = [update.title for update in self._walk(self.shopper)]
+        self.assertFalse(any(title.startswith("Kopi") for title in titles))
+        self.assertIn("New bags", titles)
+        self.assertFalse(FeedEntry.objects.filter(user=self.shopper, update__merchant=self.kopi).exists())
+
+
+class UpdateNotificationTests(TestCase):
+    def test_update_notifications_are_sent_once(self):
+        User = get_user_model()
+        floor = create_floor()
+        merchant = Merchant.objects.create(floor=floor, name="Kopi Corner")
+        for name, email, notify in [('a', 'a@example.com', True), ('b', 'b@example.com', True),
+                                    ('muted', 'm@example.com', False), ('no-email', '', True)]:
+            user = User.objects.create_user(name, email=email, password='pw')
+            MerchantFollow.objects.create(user=user, merchant=merchant, notify_updates=notify)
+
+        update = MerchantUpdate.objects.create(merchant=merchant, title="Raya sale")
+        run_pending()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com'])
+        self.assertEqual(mail.outbox[0].subject, "Kopi Corner: Raya sale")
+
+        update.title = "Raya sale extended"
+        update.save()
+        run_pending()
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@override_settings(RESTOCK_NOTIFY_WINDOW=0)
+class RestockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        floor = create_floor()
+        cls.merchant = Merchant.objects.create(floor=floor, name="Kasut Lane")
+        shoes = ProductCategory.objects.create(name="Shoes", slug="shoes")
+        cls.bags = ProductCategory.objects.create(name="Bags", slug="bags")
+        cls.product = Product.objects.create(merchant=cls.merchant, name="Runner")
+        cls.product.categories.add(shoes)
+        cls.variants = ProductVariant.objects.bulk_create(
+            [ProductVariant(product=cls.product, name=f"Size {i}", price_rm="99.00") for i in range(10)]
+        )
+
+        for name, notify, categories in [('everything', True, []), ('shoes', True, [shoes]),
+                                         ('bags', True, [cls.bags]), ('quiet', False, [])]:
+            user = User.objects.create_user(name, email=f"{name}@example.com", password='pw')
+            follow = MerchantFollow.objects.create(user=user, merchant=cls.merchant, notify_restock=notify)
+            follow.categories.set(categories)
+
+    def test_only_transitions_from_empty_are_recorded(self):
+        variant = ProductVariant.objects.get(pk=self.variants[0].pk)
+        variant.stock_qty = 5
+        variant.save()
+        variant.stock_qty = 8
+        variant.save()
+        self.assertEqual(RestockEvent.objects.count(), 1)
+
+    def test_bulk_restock_is_coalesced_and_matched_by_category(self):
+        ProductVariant.objects.filter(pk=self.variants[0].pk).update(stock_qty=3)
+        # Savepoint, select, product ids, update, availability, select, insert, job lookup, job insert, release.
+        with self.assertNumQueries(10):
+            updated = update_stock(ProductVariant.objects.filter(product=self.product), F('stock_qty') + 2)
+        self.assertEqual(updated, 10)
+        self.assertEqual(RestockEvent.objects.count(), 9)
+        self.assertEqual(Product.objects.filter(pk=self.product.pk, in_stock=True).values_list('total_stock', flat=True).get(), 23)
+        self.assertEqual(Job.objects.count(), 1)
+
+        run_pending()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['everything@example.com', 'shoes@example.com'])
+        self.assertIn("Runner", mail.outbox[0].body)
+
+        # Already announced, so another pass sends nothing.
+        enqueue('merchants.notify_restock_followers', merchant_id=self.merchant.pk)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class ProductAvailabilityTests(TestCase):
+    def setUp(self):
+        self.venue = create_venue()
+        self.merchant = Merchant.objects.create(floor=create_floor(self.venue), name="Kopi Corner")
+
+    def product(self, name, *variants):
+        product = Product.objects.create(merchant=self.merchant, name=name)
+        for price, stock, active in variants:
+            ProductVariant.objects.create(product=product, price_rm=price, stock_qty=stock, is_active=active)
+        return Product.objects.get(pk=product.pk)
+
+    def availability(self, product):
+        return Product.objects.filter(pk=product.pk).values_list('min_active_price_rm', 'total_stock', 'in_stock').get()
+
+    def test_variant_changes_are_reflected_on_the_product(self):
+        kopi = self.product("Kopi", ("4.50", 0, True), ("3.00", 5, False), ("6.00", 2, True))
+        self.assertEqual(self.availability(kopi), (Decimal('4.50'), 2, True))
+
+        variant = kopi.variants.get(price_rm='6.00')
+        variant.stock_qty = -1
+        variant.save()
+        self.assertEqual(self.availability(kopi), (Decimal('4.50'), 0, False))
+
+        # Saving a product loaded before the variant changed keeps the new values.
+        kopi.name = "Kopi O"
+        kopi.save()
+        self.assertEqual(self.availability(kopi), (Decimal('4.50'), 0, False))
+
+        teh = self.product("Teh")
+        self.assertEqual(self.availability(teh), (None, 0, False))
+        variant.product, variant.stock_qty = teh, 7
+        variant.save()
+        self.assertEqual(self.availability(teh), (Decimal('6.00'), 7, True))
+        kopi.variants.get(price_rm='4.50').delete()
+        self.assertEqual(self.availability(kopi), (None, 0, False))
+
+    def test_repair_command_and_item_search_filters(self):
+        self.product("Kopi Peng", ("3.50", 4, True))
+        dear = self.product("Kopi Luwak", ("45.00", 0, True), ("60.00", 1, True))
+        self.product("Kopi Tarik", ("5.00", 0, True))
+        # update() skips the signals; the repair command catches what it leaves behind.
+        ProductVariant.objects.filter(product=dear, price_rm='60.00').update(stock_qty=0)
+        out = StringIO()
+        call_command('repair_product_availability', stdout=out)
+        self.assertIn(f"Product {dear.pk} was out of step", out.getvalue())
+        self.assertIn("Checked 3 products; 1 repaired.", out.getvalue())
+        self.assertEqual(self.availability(dear), (Decimal('45.00'), 0, False))
+
+        url = reverse('venue_item_search', args=[self.venue.slug])
+        names = lambda **params: [p.name for p in self.client.get(url, params).context['products']]
+        self.assertEqual(names(sort='price'), ["Kopi Peng", "Kopi Tarik", "Kopi Luwak"])
+        self.assertEqual(names(sort='-price', max_price='10'), ["Kopi Tarik", "Kopi Peng"])
+        self.assertEqual(names(min_price='4', in_stock='1'), [])
+        self.assertEqual(names(in_stock='1', min_price='abc'), ["Kopi Peng"])
+
+
+class ItemFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venue = create_venue()
+        ground = Floor.objects.create(venue=cls.venue, name="Ground")
+        cls.upper = Floor.objects.create(venue=cls.venue, name="Upper")
+        cafe = Merchant.objects.create(floor=ground, name="Cafe", latitude=3.14, longitude=101.69)
+        cls.boutique = Merchant.objects.create(floor=cls.upper, name="Boutique", latitude=3.30, longitude=101.69)
+        drinks = ProductCategory.objects.create(name="Drinks", slug="drinks")
+        cls.clothes = ProductCategory.objects.create(name="Clothes", slug="clothes")
+        for merchant, name, price, category in [
+            (cafe, "Kopi", "4.50", drinks), (cafe, "Kopi Cup", "24.99", drinks),
+            (cls.boutique, "Kopi Tee", "39.00", cls.clothes), (cls.boutique, "Scarf", "120.00", cls.clothes),
+        ]:
+            product = Product.objects.create(merchant=merchant, name=name)
+            product.categories.add(category)
+            ProductVariant.objects.create(product=product, price_rm=price, stock_qty=1)
+        refresh_product_search(Product.objects.values_list('pk', flat=True))
+        for i in range(30):
+            ProductCategory.objects.create(name=f"Unused {i}", slug=f"unused-{i}")
+
+    def counts(self, facets, name):
+        return {row['label']: row['count'] for row in facets[name]}
+
+    def test_counts_follow_the_search_and_the_other_facets(self):
+        url = reverse('venue_item_search', args=[self.venue.slug])
+        response = self.client.get(url, {'q': 'kopi', 'category': 'clothes'})
+        facets = response.context['facets']
+        self.assertEqual([p.name for p in response.context['products']], ["Kopi Tee"])
+        # A facet ignores its own selection, so the other categories stay reachable.
+        self.assertEqual(self.counts(facets, 'category'), {"Clothes": 1, "Drinks": 2})
+        self.assertEqual(self.counts(facets, 'merchant'), {"Boutique": 1})
+        self.assertEqual(self.counts(facets, 'price'), {"RM25–50": 1})
+        self.assertEqual(facets['category'][0]['url'], "?q=kopi")
+        self.assertEqual(facets['floor'][0]['url'], f"?q=kopi&category=clothes&floor={self.upper.pk}")
+
+        facets = self.client.get(url, {'min_price': '10', 'max_price': '24.99'}).context['facets']
+        self.assertEqual(self.counts(facets, 'price'), {"RM0–10": 1, "RM10–25": 1, "RM25–50": 1, "RM100+": 1})
+        self.assertEqual([row['selected'] for row in facets['price']], [False, True, False, False])
+        self.assertEqual(self.counts(facets, 'floor'), {"Ground": 1})
+
+        with self.assertNumQueries(1):
+            item_facets(Product.objects.filter(merchant__floor__venue=self.venue), ItemFilters(category='drinks'))
+
+    def test_sorting_by_price_newest_and_distance(self):
+        url = reverse('venue_item_search', args=[self.venue.slug])
+        names = lambda **params: [p.name for p in self.client.get(url, params).context['products']]
+        self.assertEqual(names(sort='-price', floor=self.upper.pk), ["Scarf", "Kopi Tee"])
+        self.assertEqual(names(sort='newest')[0], "Scarf")
+        self.assertEqual(names(merchant=self.boutique.pk, sort='price'), ["Kopi Tee", "Scarf"])
+
+        shopper = get_user_model().objects.create_user('shopper', password='pw')
+        shopper.userprofile.latitude, shopper.userprofile.longitude = 3.31, 101.69
+        shopper.userprofile.save()
+        self.client.force_login(shopper)
+        self.assertEqual(names(sort='distance', q='kopi'), ["Kopi Tee", "Kopi Cup", "Kopi"])
+        response = self.client.get(url, {'near': '1', 'radius': '5', 'sort': 'price'})
+        self.assertEqual([p.name for p in response.context['products']], ["Kopi Tee", "Scarf"])
+        self.assertEqual(self.counts(response.context['facets'], 'merchant'), {"Boutique": 2})
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        floor = create_floor()
+        Merchant.objects.create(floor=floor, name="Kopi Corner", lot_number="G-01")
+        Merchant.objects.create(floor=floor, name="Kopitiam Heritage")
+        Merchant.objects.create(floor=floor, name="Tea House", keywords="kopi, teh")
+        cls.stall = Merchant.objects.create(floor=floor, name="Warung Pak Ali")
+        for name, variant in [("Iced Kopi", "Large"), ("Kopi Tarik", ""), ("Teh Tarik", ""), ("Scarf", "Red")]:
+            product = Product.objects.create(merchant=cls.stall, name=name)
+            ProductVariant.objects.create(product=product, name=variant, price_rm="5.00")
+        refresh_product_search(Product.objects.values_list('pk', flat=True))
+
+    def merchants(self, query):
+        return [m.name for m in search_merchants(Merchant.objects.all(), query)]
+
+    def products(self, query):
+        return [p.name for p in search_products(Product.objects.all(), query)]
+
+    def test_merchant_search_ranks_name_matches_first(self):
+        results = self.merchants("kopi")
+        self.assertCountEqual(results[:2], ["Kopi Corner", "Kopitiam Heritage"])
+        self.assertEqual(results[2:], ["Tea House"])
+        self.assertEqual(self.merchants("kopi cor"), ["Kopi Corner"])
+        self.assertEqual(self.merchants("g-01"), ["Kopi Corner"])
+        self.assertEqual(self.merchants("  "), [])
+
+    def test_merchant_search_without_the_index_scans(self):
+        with mock.patch.dict(search._fts_ready, {'default': False}):
+            self.assertEqual(self.merchants("kopi"), ["Kopi Corner", "Kopitiam Heritage", "Tea House"])
+
+    def test_merchant_index_follows_edits_and_deletes(self):
+        if connection.vendor == 'sqlite':
+            self.assertTrue(search._sqlite_fts_ready(connection.alias))
+        corner = Merchant.objects.get(name="Kopi Corner")
+        corner.name, corner.keywords = "Roti Corner", "canai"
+        corner.save()
+        self.assertEqual(self.merchants("kopi"), ["Kopitiam Heritage", "Tea House"])
+        self.assertEqual(self.merchants("canai"), ["Roti Corner"])
+
+        category = MerchantCategory.objects.create(name="Bakery")
+        corner.category = category
+        corner.save()
+        category.name = "Patisserie"
+        category.save()
+        self.assertEqual(self.merchants("patis"), ["Roti Corner"])
+        self.assertEqual(self.merchants("bakery"), [])
+
+        Merchant.objects.filter(pk=corner.pk).update(name="Nasi Corner")
+        self.assertEqual(self.merchants("nasi"), ["Nasi Corner"])
+        corner.delete()
+        self.assertEqual(self.merchants("corner"), [])
+
+    def test_product_search_tolerates_typos_and_ranks_by_similarity(self):
+        self.assertEqual(self.products("kopi tarik")[0], "Kopi Tarik")
+        self.assertCountEqual(self.products("kopii"), ["Iced Kopi", "Kopi Tarik"])
+        self.assertEqual(self.products("scraf red"), ["Scarf"])
+        self.assertEqual(self.products("iced large"), ["Iced Kopi"])
+        ranks = [p.search_rank for p in search_products(Product.objects.all(), "kopi tarik")]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertEqual(ranks[0], 1.0)
+
+    def test_renaming_a_merchant_refreshes_its_products(self):
+        self.assertEqual(len(self.products("pak ali")), 4)
+        # The new name is part of the old one, so every document still contains it.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stall.name = "Warung"
+            self.stall.save()
+        self.assertEqual(self.products("pak ali"), [])
+        self.assertFalse(Product.objects.filter(search_document__contains="Pak Ali").exists())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.stall.lot_number = "G-02"
+            self.stall.save()
+        self.assertNotIn('_refresh_merchant_product_search', [callback.func.__name__ for callback in callbacks])
+
+
+class CatalogueImportTests(TestCase):
+    feed = (
+        "product,description,categories,images,sku,variant,price_rm,stock_qty\n"
+        "Iced Kopi,Strong and sweet,Drinks,,KOPI-S,Small,5.50,0\n"
+        "Iced Kopi,,,,KOPI-L,Large,7.00,10\n"
+        "Kaya Toast,,Food|Drinks,,TOAST,,4.00,3\n"
+        "Broken,,,,KOPI-S,,1.00,1\n"
+        "Bad Price,,,,BAD,,abc,1\n"
+        "Mystery,,Gadgets,,MYST,,1.00,1\n"
+    )
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('seller', password='pw')
+        user.userprofile.role = UserProfile.Role.MERCHANT
+        user.userprofile.save()
+        self.merchant = Merchant.objects.create(floor=create_floor(create_venue(user)), name="Kopi Corner")
+        MerchantMembership.objects.create(user=user, merchant=self.merchant)
+        self.drinks = ProductCategory.objects.create(name="Drinks", slug="drinks")
+        self.food = ProductCategory.objects.create(name="Food", slug="food")
+        self.client.force_login(user)
+
+    def upload(self, content, name='feed.csv', dry_run=False):
+        data = {'feed': SimpleUploadedFile(name, content.encode())}
+        if dry_run:
+            data['dry_run'] = '1'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('merchant_catalogue_import'), data)
+        return response.context['result']
+
+    def test_dry_run_import_and_idempotent_reimport(self):
+        preview = self.upload(self.feed, dry_run=True)
+        self.assertFalse(Product.objects.exists())
+        self.assertIn("+ product Iced Kopi (2 variants)", preview.changes)
+
+        result = self.upload(self.feed)
+        self.assertEqual((preview.products_created, preview.variants_created, preview.categories_added), (2, 3, 3))
+        self.assertEqual((result.products_created, result.variants_created, result.categories_added), (2, 3, 3))
+        self.assertEqual([line for line, _ in result.errors], [5, 6, 7])
+        self.assertIn("more than once", result.errors[0][1])
+
+        kopi = Product.objects.get(name="Iced Kopi")
+        self.assertEqual(kopi.description, "Strong and sweet")
+        self.assertEqual(sorted(kopi.variants.values_list('sku', 'price_rm')), [('KOPI-L', Decimal('7.00')), ('KOPI-S', Decimal('5.50'))])
+        self.assertEqual(list(kopi.categories.all()), [self.drinks])
+        self.assertEqual([p.name for p in search_products(Product.objects.all(), 'kopi large')][:1], ["Iced Kopi"])
+
+        again = self.upload(self.feed)
+        self.assertFalse(again.changed)
+        self.assertEqual(again.variants_unchanged, 3)
+
+        # Renamed through its SKUs, restocked, repriced and recategorised in place.
+        result = self.upload(
+            "product,categories,sku,variant,price_rm,stock_qty\n"
+            "Iced Kopi O,Food,KOPI-S,Small,6.00,4\n"
+        )
+        self.assertEqual((result.products_updated, result.variants_updated, result.categories_added, result.categories_removed), (1, 1, 1, 1))
+        kopi.refresh_from_db()
+        self.assertEqual((kopi.name, list(kopi.categories.all())), ("Iced Kopi O", [self.food]))
+        self.assertEqual(kopi.variants.get(sku='KOPI-S').stock_qty, 4)
+        self.assertEqual(RestockEvent.objects.get().variant.sku, 'KOPI-S')
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_json_feed_images(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        images = tempfile.TemporaryDirectory()
+        self.addCleanup(images.cleanup)
+        for name in ('front.jpg', 'back.jpg'):
+            Image.new('RGB', (40, 40), 'blue' if name == 'front.jpg' else 'green').save(f"{images.name}/{name}")
+
+        def run(*references):
+            feed = f"{images.name}/feed.jsonl"
+            with open(feed, 'w') as fh:
+                fh.write(json.dumps({
+                    'name': "Tote Bag", 'images': list(references),
+                    'variants': [{'sku': 'TOTE', 'price_rm': 25}],
+                }) + "\n")
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_catalogue', self.merchant.pk, feed, images_dir=images.name, stdout=StringIO())
+
+        run('front.jpg', 'https://cdn.example.com/side.jpg', 'back.jpg')
+        run('front.jpg', 'https://cdn.example.com/side.jpg', 'back.jpg')
+        product = Product.objects.get()
+        self.assertEqual(list(product.images.values_list('source', 'sort_order')), [('front.jpg', 0), ('back.jpg', 2)])
+        self.assertTrue(product.images.first().image.name.startswith('blobs/'))
+        # URLs are downloaded by the worker, once per import that adds them.
+        self.assertEqual(Job.objects.filter(name='merchants.fetch_product_images').count(), 2)
+
+        back = product.images.get(source='back.jpg').image.name
+        run('front.jpg')
+        self.assertEqual(list(product.images.values_list('source', flat=True)), ['front.jpg'])
+        self.assertFalse(default_storage.exists(back))
+
+    def test_unreadable_feeds_import_nothing(self):
+        lines = [json.dumps({'name': f"Item {i}", 'variants': [{'sku': f"SKU-{i}", 'price_rm': 1}]}) for i in range(3)]
+        feed = BytesIO("\n".join([*lines, '{"name": "Broken"', *lines]).encode())
+        with self.assertRaisesMessage(CatalogueFileError, "Could not read the JSON feed"):
+            import_catalogue(self.merchant, feed, 'feed.jsonl', batch_size=1)
+        self.assertFalse(Product.objects.exists())
+
+        items = [json.loads(line) for line in lines]
+        feed = BytesIO(json.dumps({'products': [*items, "Broken", *items]}).encode())
+        with self.assertRaisesMessage(CatalogueFileError, "Item 4 is not an object"):
+            import_catalogue(self.merchant, feed, 'feed.json', batch_size=1)
+        self.assertFalse(Product.objects.exists())
+
+        result = self.upload(
+            "sku,price_rm,product\n"
+            "TOAST,4.00,Kaya Toast\n"
+            "\n"
+            "SHORT,4.00\n"
+        )
+        self.assertEqual(result.products_created, 1)
+        self.assertEqual(result.errors, [(4, "Product name is required.")])
+
+
+    def test_lists_of_the_wrong_shape_are_row_errors(self):
+        good = {'variants': [{'sku': 'TOTE', 'price_rm': 25}]}
+        items = [
+            {'name': "Tote Bag", **good},
+            {'name': "Five", 'variants': 5},
+            {'name': "Mapped", 'variants': {'sku': 'MAP', 'price_rm': 1}},
+            {'name': "Counted", 'categories': 3, **good},
+            {'name': "Pictured", 'images': {'url': 'https://cdn.example.com/a.jpg'}, **good},
+        ]
+        for name, lines in (('feed.json', [json.dumps(items)]), ('feed.jsonl', map(json.dumps, items))):
+            with self.subTest(name):
+                result = self.upload("\n".join(lines), name=name)
+                self.assertEqual(result.errors, [
+                    (2, "variants must be a list."),
+                    (3, "variants must be a list."),
+                    (4, "categories must be a list."),
+                    (5, "images must be a list."),
+                ])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ["Tote Bag"])
+
+    def test_stock_must_fit_the_column(self):
+        result = self.upload(
+            "product,sku,price_rm,stock_qty\n"
+            "Kopi,NEG,1.00,-3\n"
+            "Kopi,HUGE,1.00,2147483648\n"
+            "Kopi,HALF,1.00,1.5\n"
+            "Kopi,MAX,1.00,2147483647\n"
+        )
+        self.assertEqual(result.errors, [
+            (2, "NEG: stock_qty must be between 0 and 2147483647."),
+            (3, "HUGE: stock_qty must be between 0 and 2147483647."),
+            (4, "HALF: stock_qty must be a whole number."),
+        ])
+        self.assertEqual(list(ProductVariant.objects.values_list('sku', 'stock_qty')), [('MAX', 2147483647)])
+        self.assertEqual(Product.objects.get().total_stock, 2147483647)
+
+class DownloadImageTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        requests_seen = cls.requests_seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests_seen.append((self.path, self.headers['Host']))
+                if self.path == '/moved.jpg':
+                    self.send_response(302)
+                    self.send_header('Location', '/logo.jpg')
+                elif self.path == '/escape.jpg':
+                    self.send_response(302)
+                    self.send_header('Location', 'http://127.0.0.1/secret.jpg')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', '5')
+                self.end_headers()
+                self.wfile.write(b'image')
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.requests_seen.clear()
+        self.host = f"images.example:{self.server.server_port}"
+        check = catalogue._public_address
+        # images.example does not resolve; anything else is checked as usual.
+        self.enterContext(mock.patch.object(
+            catalogue, '_public_address',
+            lambda url: '127.0.0.1' if url.startswith(f"http://{self.host}/") else check(url),
+        ))
+
+    def test_connects_to_the_checked_address(self):
+        self.assertEqual(download_image(f"http://{self.host}/moved.jpg"), b'image')
+        self.assertEqual(self.requests_seen, [('/moved.jpg', self.host), ('/logo.jpg', self.host)])
+
+    def test_refuses_private_addresses_and_redirects_to_them(self):
+        with self.assertRaisesMessage(ValidationError, "private address"):
+            download_image('http://127.0.0.1/secret.jpg')
+        with self.assertRaisesMessage(ValidationError, "private address"):
+            download_image(f"http://{self.host}/escape.jpg")
+        self.assertEqual(self.requests_seen, [('/escape.jpg', self.host)])
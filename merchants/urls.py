@@ -8,4 +8,5 @@ urlpatterns = [
     path('<slug:slug>/items/<int:product_id>/', views.product_detail, name='product_detail'),
     path('merchant/portal/', views.merchant_portal, name='merchant_portal'),
     path('merchant/portal/products/new/', views.merchant_product_create, name='merchant_product_create'),
+    path('merchant/portal/products/import/', views.merchant_catalogue_import, name='merchant_catalogue_import'),
 ]
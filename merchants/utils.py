@@ -1,10 +1,38 @@
 from __future__ import annotations
 
-from math import asin, cos, radians, sin, sqrt
+from math import asin, cos, degrees, floor, radians, sin, sqrt
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# Keeps "pk IN (...)" lists under SQLite's parameter limit.
+IN_LIST_CHUNK = 900
+
+# Spellings of yes and no accepted in imported spreadsheets and feeds.
+_TRUE = {'1', 'true', 'yes', 'y'}
+_FALSE = {'0', 'false', 'no', 'n'}
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def parse_bool(value, default=None):
+    """A yes/no cell as a bool, ``default`` when it is blank; raises ValidationError otherwise."""
+    value = str(value).strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    if value in ('', 'none'):
+        return default
+    raise ValidationError("Use yes or no.")
 
 
 def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    r = 6371.0
+    r = EARTH_RADIUS_KM
     d_lat = radians(lat2 - lat1)
     d_lon = radians(lon2 - lon1)
     a = sin(d_lat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(d_lon / 2) ** 2
@@ -13,8 +41,111 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
 
 
 def bounding_box(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
-    # Approximate degrees per km.
-    lat_delta = radius_km / 111.0
-    lon_delta = radius_km / (111.0 * max(cos(radians(lat)), 0.01))
-    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+    """
+    Latitude and longitude ranges holding every point within ``radius_km``.
+
+    Longitudes are not wrapped: a box crossing the antimeridian has
+    ``min_lon`` below -180 or ``max_lon`` above 180 (see bounding_box_q).
+    A box that reaches a pole spans every longitude.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_delta = degrees(angle)
+    min_lat, max_lat = lat - lat_delta, lat + lat_delta
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    # The widest point of the circle is nearer the pole than its centre.
+    lon_delta = degrees(asin(min(sin(angle) / cos(radians(lat)), 1.0)))
+    return min_lat, max_lat, lon - lon_delta, lon + lon_delta
+
+
+def bounding_box_q(lat_field: str, lon_field: str, box: tuple[float, float, float, float]) -> Q:
+    min_lat, max_lat, min_lon, max_lon = box
+    q = Q(**{f"{lat_field}__gte": min_lat, f"{lat_field}__lte": max_lat})
+    # Across the antimeridian the box is two longitude ranges.
+    if min_lon < -180.0:
+        return q & (Q(**{f"{lon_field}__gte": min_lon + 360.0}) | Q(**{f"{lon_field}__lte": max_lon}))
+    if max_lon > 180.0:
+        return q & (Q(**{f"{lon_field}__gte": min_lon}) | Q(**{f"{lon_field}__lte": max_lon - 360.0}))
+    return q & Q(**{f"{lon_field}__gte": min_lon, f"{lon_field}__lte": max_lon})
+
+
+def haversine_expression(lat_field: str, lon_field: str, lat: float, lon: float):
+    """Great-circle distance in km from (lat, lon) as a database expression."""
+    d_lat = Radians(F(lat_field)) - radians(lat)
+    d_lon = Radians(F(lon_field)) - radians(lon)
+    a = Power(Sin(d_lat / 2), 2) + cos(radians(lat)) * Cos(Radians(F(lat_field))) * Power(Sin(d_lon / 2), 2)
+    # Clamp rounding noise so ASIN never sees a value above 1.
+    c = 2 * ASin(Least(Sqrt(a), Value(1.0), output_field=FloatField()))
+    return c * EARTH_RADIUS_KM
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 12) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def _geohash_cell_size(precision: int) -> tuple[float, float]:
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def geohash_cover(
+    min_lat: float, max_lat: float, min_lon: float, max_lon: float, *, max_cells: int = 16
+) -> list[str]:
+    """
+    Geohash prefixes whose cells together cover the bounding box.
+
+    Picks the finest precision that needs at most ``max_cells`` prefixes, so the
+    result can be turned into a handful of indexed ``startswith`` lookups.
+    Returns an empty list when even a single-character prefix is too coarse to
+    help (e.g. boxes crossing the antimeridian).
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    if min_lon < -180.0 or max_lon > 180.0:
+        return []
+
+    best: list[str] = []
+    for precision in range(1, 9):
+        lat_step, lon_step = _geohash_cell_size(precision)
+        # A box ending on the last edge (90 or 180) stays in the last cell.
+        last_lat, last_lon = round(180.0 / lat_step) - 1, round(360.0 / lon_step) - 1
+        lat_cells = range(floor((min_lat + 90.0) / lat_step), min(floor((max_lat + 90.0) / lat_step), last_lat) + 1)
+        lon_cells = range(floor((min_lon + 180.0) / lon_step), min(floor((max_lon + 180.0) / lon_step), last_lon) + 1)
+        if len(lat_cells) * len(lon_cells) > max_cells:
+            break
+        best = [
+            geohash_encode((i + 0.5) * lat_step - 90.0, (j + 0.5) * lon_step - 180.0, precision)
+            for i in lat_cells
+            for j in lon_cells
+        ]
+    return best
+
 
+def geohash_q(field: str, prefixes: list[str]) -> Q:
+    # Range lookups rather than ``startswith`` so a plain B-tree index is used on every backend.
+    q = Q()
+    for prefix in prefixes:
+        q |= Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + "~"})
+    return q
@@ -1,94 +1,165 @@
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Min, Q
+from django.db.models import F
 from django.http import HttpResponseForbidden
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, get_object_or_404
+from django.utils.http import urlencode
 
 from venues.models import Venue
+from venues.pagination import aget_page
 from accounts.models import UserProfile
-from .models import MerchantMembership, Product, ProductCategory, ProductVariant
-from .utils import bounding_box, haversine_km
-
-
-def venue_item_search(request, slug):
-    venue = get_object_or_404(Venue, slug=slug)
+from .catalogue import CatalogueFileError, import_catalogue
+from .facets import ItemFilters, facet_url, item_facets
+from .models import MerchantMembership, Product, ProductVariant
+from .search import search_products
+from .utils import bounding_box, bounding_box_q, haversine_expression
+
+
+# Item search orderings besides the default (relevance, distance or recency).
+PRODUCT_SORTS = {
+    'price': (F('min_active_price_rm').asc(nulls_last=True), '-updated_at'),
+    '-price': (F('min_active_price_rm').desc(nulls_last=True), '-updated_at'),
+    'newest': ('-created_at',),
+    'distance': ('distance', '-updated_at'),
+}
+
+
+def _price_param(request, name):
+    try:
+        price = Decimal(request.GET.get(name, ''))
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def _id_param(request, name):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else None
+
+
+def _link_facets(facets, params):
+    for facet, rows in facets.items():
+        for row in rows:
+            if facet == 'price':
+                selected = row['selected']
+                row['url'] = facet_url(
+                    params,
+                    min_price=None if selected else row['min_price'],
+                    max_price=None if selected else row['max_price'],
+                )
+            else:
+                row['url'] = facet_url(params, **{facet: None if row['selected'] else row['key']})
+    return facets
+
+
+async def venue_item_search(request, slug):
+    # Async like venues.views.venue_directory: both are requested on every keystroke.
+    venue = await aget_object_or_404(Venue, slug=slug)
+    request.user = user = await request.auser()
     query = request.GET.get('q', '').strip()
-    category_slug = request.GET.get('category')
     near = request.GET.get('near') == '1'
     radius_km = float(request.GET.get('radius', '15') or 15)
+    filters = ItemFilters(
+        category=request.GET.get('category') or None,
+        merchant=_id_param(request, 'merchant'),
+        floor=_id_param(request, 'floor'),
+        min_price=_price_param(request, 'min_price'),
+        max_price=_price_param(request, 'max_price'),
+        in_stock=request.GET.get('in_stock') == '1',
+    )
+    sort = request.GET.get('sort') if request.GET.get('sort') in PRODUCT_SORTS else ''
 
     user_lat = user_lon = None
-    if near and request.user.is_authenticated:
-        profile = getattr(request.user, 'userprofile', None)
+    if (near or sort == 'distance') and user.is_authenticated:
+        profile = await UserProfile.objects.filter(user=user).afirst()
+        if profile is not None:
+            user.userprofile = profile  # Cached for the templates.
         if profile and profile.latitude is not None and profile.longitude is not None:
             user_lat, user_lon = profile.latitude, profile.longitude
+    has_location = user_lat is not None and user_lon is not None
+    if sort == 'distance' and not has_location:
+        sort = ''
 
-    products = (
-        Product.objects.filter(merchant__floor__venue=venue, is_active=True)
-        .select_related('merchant', 'merchant__floor')
-        .prefetch_related('images', 'variants', 'categories')
-    )
-
-    if category_slug:
-        products = products.filter(categories__slug=category_slug)
-
+    products = Product.objects.filter(merchant__floor__venue=venue, is_active=True)
     if query:
+        products = search_products(products, query)
+    if near and has_location:
         products = products.filter(
-            Q(name__icontains=query)
-            | Q(description__icontains=query)
-            | Q(merchant__name__icontains=query)
-            | Q(variants__name__icontains=query)
-            | Q(variants__sku__icontains=query)
-        ).distinct()
-
-    products = products.annotate(min_price=Min('variants__price_rm'))
-
-    categories = ProductCategory.objects.filter(products__merchant__floor__venue=venue, is_active=True).distinct().order_by('name')
-
-    distance_map = {}
-    if near and user_lat is not None and user_lon is not None:
-        min_lat, max_lat, min_lon, max_lon = bounding_box(user_lat, user_lon, radius_km)
-        products = products.filter(
+            bounding_box_q('merchant__latitude', 'merchant__longitude', bounding_box(user_lat, user_lon, radius_km)),
             merchant__latitude__isnull=False,
             merchant__longitude__isnull=False,
-            merchant__latitude__gte=min_lat,
-            merchant__latitude__lte=max_lat,
-            merchant__longitude__gte=min_lon,
-            merchant__longitude__lte=max_lon,
         )
+    if has_location:
+        # Distance is computed, filtered and ordered in SQL so only the current
+        # page is fetched (and prefetched).
+        products = products.annotate(
+            distance=haversine_expression('merchant__latitude', 'merchant__longitude', user_lat, user_lon)
+        )
+        if near:
+            products = products.filter(distance__lte=radius_km)
+
+    # Facets count the text and distance matches, before the facet
+    # selections narrow them; load-more requests don't show them.
+    params = {
+        'q': query, 'near': '1' if near else None, 'radius': int(radius_km) if near else None,
+        'category': filters.category, 'merchant': filters.merchant, 'floor': filters.floor,
+        'min_price': filters.min_price, 'max_price': filters.max_price,
+        'in_stock': '1' if filters.in_stock else None, 'sort': sort,
+    }
+    facets = None if request.headers.get('HX-Request') else _link_facets(
+        await sync_to_async(item_facets)(products, filters), params
+    )
 
-        product_list = list(products)
-        filtered = []
-        for p in product_list:
-            if p.merchant.latitude is None or p.merchant.longitude is None:
-                continue
-            d = haversine_km(user_lat, user_lon, p.merchant.latitude, p.merchant.longitude)
-            if d <= radius_km:
-                distance_map[p.id] = d
-                filtered.append(p)
-        filtered.sort(key=lambda p: distance_map.get(p.id, 10**9))
-        paginator = Paginator(filtered, 24)
+    # Price and stock are stored on the product (see merchants.availability), so
+    # these filters and the price sorts need no join or GROUP BY over variants.
+    products = (
+        filters.apply(products)
+        .select_related('merchant', 'merchant__floor')
+        .prefetch_related('images', 'variants', 'categories')
+    )
+    if sort:
+        products = products.order_by(*PRODUCT_SORTS[sort])
+    elif near and has_location:
+        products = products.order_by('distance', '-updated_at')
+    elif query:
+        products = products.order_by('-search_rank', '-updated_at')
     else:
-        paginator = Paginator(products, 24)
+        products = products.order_by('-updated_at')
 
-    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj = await aget_page(products, 24, request.GET.get('page'))
+    distance_map = {p.id: p.distance for p in page_obj.object_list} if has_location else {}
 
     context = {
         'venue': venue,
         'products': page_obj,
         'search_query': query,
-        'categories': categories,
-        'current_category': category_slug,
+        'facets': facets,
+        'facet_groups': [] if facets is None else [
+            ("Price", facets['price']), ("Floor", facets['floor']), ("Shop", facets['merchant']),
+        ],
+        'filters': filters,
+        'current_category': filters.category,
         'near': near,
         'radius_km': int(radius_km),
-        'has_location': user_lat is not None and user_lon is not None,
+        'has_location': has_location,
         'distance_map': distance_map,
+        'min_price': '' if filters.min_price is None else filters.min_price,
+        'max_price': '' if filters.max_price is None else filters.max_price,
+        'in_stock': filters.in_stock,
+        'sort': sort,
+        # The selections the search box, category and "near me" links don't set themselves.
+        'filter_params': urlencode({
+            key: value for key, value in params.items()
+            if key not in ('q', 'category', 'near', 'radius') and value not in (None, '')
+        }),
     }
 
     if request.headers.get('HX-Request'):
-        return render(request, 'merchants/partials/product_list.html', context)
+        return await sync_to_async(render)(request, 'merchants/partials/product_list.html', context)
 
-    return render(request, 'merchants/venue_item_search.html', context)
+    return await sync_to_async(render)(request, 'merchants/venue_item_search.html', context)
 
 
 def product_detail(request, slug, product_id):
@@ -100,8 +171,7 @@ def product_detail(request, slug, product_id):
         merchant__floor__venue=venue,
         is_active=True,
     )
-    min_price = product.variants.filter(is_active=True).aggregate(min_price=Min('price_rm'))['min_price']
-    return render(request, 'merchants/product_detail.html', {'venue': venue, 'product': product, 'min_price': min_price})
+    return render(request, 'merchants/product_detail.html', {'venue': venue, 'product': product})
 
 
 @login_required
@@ -151,3 +221,29 @@ def merchant_product_create(request):
             return render(request, 'merchants/portal/product_created.html', {'product': product, 'merchant': merchant})
 
     return render(request, 'merchants/portal/product_create.html', {'merchant': merchant, 'memberships': memberships})
+
+
+@login_required
+def merchant_catalogue_import(request):
+    role = getattr(getattr(request.user, 'userprofile', None), 'role', None)
+    if role != UserProfile.Role.MERCHANT:
+        return HttpResponseForbidden("Merchant portal is for merchant accounts.")
+
+    memberships = MerchantMembership.objects.filter(user=request.user).select_related('merchant')
+    if not memberships:
+        return HttpResponseForbidden("No merchant linked to your account.")
+
+    merchant = get_object_or_404(memberships, merchant_id=request.GET.get('merchant') or memberships[0].merchant_id).merchant
+
+    result = error = None
+    if request.method == "POST":
+        feed = request.FILES.get('feed')
+        if feed is None:
+            error = "Choose a CSV, JSON or JSON Lines file."
+        else:
+            try:
+                result = import_catalogue(merchant, feed, feed.name, dry_run=bool(request.POST.get('dry_run')))
+            except CatalogueFileError as exc:
+                error = str(exc)
+
+    return render(request, 'merchants/portal/catalogue_import.html', {'merchant': merchant, 'result': result, 'error': error})
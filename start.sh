@@ -4,5 +4,17 @@
 echo "Running database migrations..."
 python manage.py migrate --noinput
 
-echo "Starting gunicorn..."
-gunicorn config.wsgi:application --bind 0.0.0.0:$PORT
+# Metrics files of the previous deploy's workers would otherwise be added to this one's.
+if [ -n "$METRICS_DIR" ]; then
+    rm -rf "$METRICS_DIR"
+    mkdir -p "$METRICS_DIR"
+fi
+
+# SERVER_MODE=asgi serves the async search views with uvicorn workers (see DEPLOYMENT.md).
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting gunicorn with uvicorn workers..."
+    gunicorn config.asgi:application --worker-class uvicorn_worker.UvicornWorker --bind 0.0.0.0:$PORT
+else
+    echo "Starting gunicorn..."
+    gunicorn config.wsgi:application --bind 0.0.0.0:$PORT
+fi
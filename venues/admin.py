@@ -13,6 +13,7 @@ class FloorInline(admin.TabularInline):
 @admin.register(Venue)
 class VenueAdmin(admin.ModelAdmin):
     list_display = ('name', 'venue_type', 'owner', 'subscription_summary', 'view_live_button')
+    list_select_related = ('owner', 'subscription__plan')
     prepopulated_fields = {'slug': ('name',)}
     inlines = [FloorInline]
 
@@ -45,6 +46,7 @@ class PlanAdmin(admin.ModelAdmin):
 @admin.register(VenueSubscription)
 class VenueSubscriptionAdmin(admin.ModelAdmin):
     list_display = ('venue', 'plan', 'status', 'current_period_end', 'cancel_at_period_end', 'updated_at')
+    list_select_related = ('venue', 'plan')
     list_filter = ('status', 'plan', 'cancel_at_period_end')
     search_fields = ('venue__name', 'venue__slug')
 
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class VenuesConfig(AppConfig):
     name = 'venues'
+
+    def ready(self):
+        from . import signals  # noqa: F401
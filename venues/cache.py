@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+
+# Fragments also expire on their own so "open now" badges and stray entries
+# for venues that never change again do not live forever.
+DIRECTORY_CACHE_TIMEOUT = 300
+
+_STATS = ("hits", "misses")
+
+
+def _generation_key(venue_id: int) -> str:
+    return f"directory:gen:{venue_id}"
+
+
+async def adirectory_generation(venue_id: int) -> int:
+    """
+    Current cache generation for a venue's directory.
+
+    New generations start from the clock rather than 1, so a generation
+    evicted from the cache can never come back and revive old fragments.
+    """
+    key = _generation_key(venue_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        generation = time.time_ns()
+        if not await cache.aadd(key, generation, timeout=None):
+            generation = await cache.aget(key, generation)
+    return generation
+
+
+def bump_directory_generation(venue_id: int) -> None:
+    try:
+        cache.incr(_generation_key(venue_id))
+    except ValueError:
+        # No generation yet, so nothing is cached for this venue.
+        pass
+
+
+async def _acount(stat: str) -> None:
+    key = f"directory:stats:{stat}"
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+def directory_cache_stats() -> dict[str, int]:
+    values = cache.get_many([f"directory:stats:{stat}" for stat in _STATS])
+    return {stat: values.get(f"directory:stats:{stat}", 0) for stat in _STATS}
+
+
+def reset_directory_cache_stats() -> None:
+    cache.delete_many([f"directory:stats:{stat}" for stat in _STATS])
+
+
+async def acached_directory_fragment(
+    venue_id: int, parts: tuple, render: Callable[[], Awaitable[Any]], *, timeout: Optional[int] = None
+) -> Any:
+    """
+    Return ``await render()`` for this venue and ``parts``, caching it until
+    the venue's generation changes (see ``venues.signals``) or ``timeout``
+    passes. For the async directory view, so the cache is read without
+    blocking the event loop.
+
+    Works with any Django cache backend. The local-memory cache is per
+    process, so production deployments with several workers should point
+    ``REDIS_URL`` at a shared cache.
+    """
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    key = f"directory:{venue_id}:{await adirectory_generation(venue_id)}:{digest}"
+    value = await cache.aget(key)
+    if value is not None:
+        await _acount("hits")
+        return value
+
+    await _acount("misses")
+    value = await render()
+    await cache.aset(key, value, DIRECTORY_CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
+
+def seconds_until_schedule_change(boundaries, now=None) -> int:
+    """
+    Seconds until the next minute in ``boundaries`` (minutes since midnight
+    when some merchant opens or closes), capped at ``DIRECTORY_CACHE_TIMEOUT``.
+    """
+    now = now or timezone.localtime()
+    elapsed = now.hour * 3600 + now.minute * 60 + now.second
+    # Midnight always counts: weekday-specific schedules flip then.
+    upcoming = [minute * 60 for minute in boundaries if minute * 60 > elapsed] or [24 * 3600]
+    return max(1, min(DIRECTORY_CACHE_TIMEOUT, min(upcoming) - elapsed))
@@ -0,0 +1,449 @@
+"""
+Deterministic synthetic data for benchmarks, shaped like production:
+venues clustered around Malaysian cities, one to eight floors each, a
+long tail of venue sizes, products with up to a dozen variants, operating
+hours in every format the parser knows (overnight windows included) and
+follows skewed towards a few popular merchants.
+
+Rows are generated and written one batch at a time with bulk_create, so
+memory stays flat however large the scale; only the merchant ids and
+popularity weights are kept for choosing follows. Each part of the data
+draws from its own random generator, derived from ``seed``, so the same
+seed always gives the same rows.
+
+The number of venues grows with the scale. The first venue, the one the
+benchmarks use, grows with its square root so per-venue pages get heavier
+as well. Every seeded user's name starts with ``seed-``; venues are owned
+by ``seed-owner`` and ``seed-shopper`` follows merchants and has a
+location, for the pages that need a login.
+"""
+from __future__ import annotations
+
+import math
+import random
+from array import array
+from bisect import bisect
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core import serializers
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from merchants.models import (
+    Merchant,
+    MerchantCategory,
+    MerchantFollow,
+    MerchantUpdate,
+    Product,
+    ProductCategory,
+    ProductSearchTrigram,
+    ProductVariant,
+)
+from merchants.search import product_document, trigrams
+from .cache import bump_directory_generation
+from .models import Floor, Venue
+
+
+PREFIX = 'seed-'
+OWNER = f'{PREFIX}owner'
+SHOPPER = f'{PREFIX}shopper'
+
+# Named scales and their multipliers. "small" is about 200 merchants and
+# 8,000 rows, "medium" 80,000 rows and "large" 400 venues and 800,000 rows,
+# plus about a hundred trigram rows per product off PostgreSQL.
+SCALES = {'tiny': 0.05, 'small': 1, 'medium': 10, 'large': 100, 'huge': 1000}
+
+# (name, latitude, longitude, share of venues, spread in degrees)
+CITIES = (
+    ('Kuala Lumpur', 3.1390, 101.6869, 0.40, 0.12),
+    ('Penang', 5.4141, 100.3288, 0.14, 0.06),
+    ('Johor Bahru', 1.4927, 103.7414, 0.14, 0.08),
+    ('Ipoh', 4.5975, 101.0901, 0.07, 0.04),
+    ('Melaka', 2.1896, 102.2501, 0.07, 0.04),
+    ('Kota Kinabalu', 5.9804, 116.0735, 0.06, 0.05),
+    ('Kuching', 1.5533, 110.3592, 0.06, 0.05),
+    ('Kuantan', 3.8077, 103.3260, 0.06, 0.04),
+)
+
+# The shopper's location, next to the first venue.
+HOME = CITIES[0][1:3]
+
+VENUE_TYPES = (Venue.VenueType.MALL,) * 7 + (Venue.VenueType.CAMPUS, Venue.VenueType.EXPO, Venue.VenueType.OFFICE)
+
+WORDS = (
+    "kopi nasi lemak roti canai teh tarik batik songket durian cendol laksa satay "
+    "phone repair optical bookstore pharmacy bakery sushi fashion sneakers watch "
+    "gold jewellery toys gadget laptop boutique salon spa florist bank"
+).split()
+
+MERCHANT_CATEGORIES = ('Food', 'Fashion', 'Electronics', 'Beauty', 'Books', 'Services')
+PRODUCT_CATEGORIES = ('Drinks', 'Meals', 'Clothing', 'Accessories', 'Gadgets', 'Gifts')
+SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL')
+COLOURS = ('Black', 'White', 'Red', 'Blue', 'Green', 'Gold')
+
+# With how often each appears; "Open 24 hours" and "" are unknown hours.
+OPERATING_HOURS = (
+    ("10:00 AM - 10:00 PM", 30),
+    ("10:00 AM - 10:00 PM, closed Tuesday", 5),
+    ("11:00 AM - 11:00 PM", 10),
+    ("9:00 AM - 9:00 PM", 10),
+    ("Mon-Fri 9:00 - 18:00", 8),
+    ("Mon-Sat 10:00 - 22:00", 8),
+    ("7:30 AM - 3:00 PM, closed Sunday", 4),
+    ("Sat-Sun 8:00 AM - 1:00 PM", 2),
+    ("8:00 PM - 2:00 AM", 5),
+    ("Fri-Sun 9:00 PM - 4:00 AM", 3),
+    ("00:00 - 23:59", 3),
+    ("Open 24 hours", 2),
+    ("", 10),
+)
+
+# Updates are published over this many days.
+UPDATE_DAYS = 60
+
+BATCH_SIZE = 2000
+
+
+def parse_scale(value) -> float:
+    """A scale name from SCALES, or a positive multiplier."""
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        scale = float(value)
+    except (TypeError, ValueError):
+        scale = 0
+    if scale <= 0:
+        raise ValueError(f"Scale must be one of {', '.join(SCALES)} or a positive number, not {value!r}.")
+    return scale
+
+
+@dataclass
+class Sizes:
+    """Averages; venues, merchants and products each vary around them."""
+    venues: int
+    flagship_merchants: int
+    merchants_per_venue: int = 50
+    products_per_merchant: float = 5
+    variants_per_product: float = 3
+    shoppers: int = 200
+    follows_per_shopper: float = 10
+    updates_per_merchant: float = 3
+
+    @classmethod
+    def for_scale(cls, scale: float) -> Sizes:
+        return cls(
+            venues=max(1, round(4 * scale)),
+            flagship_merchants=max(1, round(50 * math.sqrt(scale))),
+            shoppers=max(1, round(200 * scale)),
+        )
+
+
+@dataclass
+class Dataset:
+    owner: object
+    shopper: object
+    venues: list = field(default_factory=list)
+    counts: dict = field(default_factory=dict)
+
+    @classmethod
+    def load(cls) -> Dataset:
+        """The dataset already in the database, as left by ``seed()``."""
+        User = get_user_model()
+        owner = User.objects.get(username=OWNER)
+        return cls(
+            owner=owner,
+            shopper=User.objects.get(username=SHOPPER),
+            venues=list(Venue.objects.filter(owner=owner).order_by('pk')),
+        )
+
+
+def seeded_rows():
+    """Querysets of every seeded row, in an order that can be loaded back."""
+    User = get_user_model()
+    return [
+        User.objects.filter(username__startswith=PREFIX),
+        UserProfile.objects.filter(user__username__startswith=PREFIX),
+        MerchantCategory.objects.filter(slug__startswith=PREFIX),
+        ProductCategory.objects.filter(slug__startswith=PREFIX),
+        Venue.objects.filter(owner__username=OWNER),
+        Floor.objects.filter(venue__owner__username=OWNER),
+        Merchant.objects.filter(floor__venue__owner__username=OWNER),
+        Product.objects.filter(merchant__floor__venue__owner__username=OWNER).prefetch_related('categories'),
+        ProductVariant.objects.filter(product__merchant__floor__venue__owner__username=OWNER),
+        ProductSearchTrigram.objects.filter(product__merchant__floor__venue__owner__username=OWNER),
+        MerchantFollow.objects.filter(user__username__startswith=PREFIX),
+        MerchantUpdate.objects.filter(merchant__floor__venue__owner__username=OWNER),
+    ]
+
+
+def write_fixture(stream) -> None:
+    """Write the seeded rows to ``stream`` as a JSON Lines fixture for loaddata, a batch at a time."""
+    for queryset in seeded_rows():
+        serializers.serialize('jsonl', queryset.order_by('pk').iterator(chunk_size=BATCH_SIZE), stream=stream)
+
+
+def clear() -> int:
+    """Delete every seeded row, one venue at a time; venues and everything below them go with their owner."""
+    deleted = 0
+    for venue in Venue.objects.filter(owner__username=OWNER).order_by('pk').iterator():
+        deleted += venue.delete()[0]
+    deleted += get_user_model().objects.filter(username__startswith=PREFIX).delete()[0]
+    return deleted
+
+
+def _rng(seed, part):
+    return random.Random(f'{seed}:{part}')
+
+
+def _between(rng, mean, low, high):
+    return max(low, min(high, round(rng.expovariate(1 / mean)))) if mean else low
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _venues(rng, sizes, owner):
+    weights = [city[3] for city in CITIES]
+    for i in range(sizes.venues):
+        if i == 0:
+            lat, lon = HOME[0] + 0.01, HOME[1] + 0.01
+            merchants = sizes.flagship_merchants
+        else:
+            _, city_lat, city_lon, _, spread = rng.choices(CITIES, weights)[0]
+            lat, lon = rng.gauss(city_lat, spread), rng.gauss(city_lon, spread)
+            # Long tailed: most venues have a few dozen merchants, a few have hundreds.
+            merchants = max(3, min(800, round(rng.lognormvariate(math.log(sizes.merchants_per_venue) - 0.4, 0.9))))
+        venue = Venue(
+            owner=owner,
+            name=f"Seed {rng.choice(('Mall', 'Plaza', 'Square', 'Galleria', 'Centre'))} {i}",
+            slug=f'{PREFIX}venue-{i}',
+            venue_type=rng.choice(VENUE_TYPES),
+            latitude=lat,
+            longitude=lon,
+        )
+        yield venue, merchants
+
+
+def _floor_names(count):
+    # A basement under the bigger venues, then G, L1, L2...
+    levels = range(-1, count - 1) if count >= 4 else range(count)
+    for level in levels:
+        yield level, 'B1' if level < 0 else 'G' if level == 0 else f'L{level}'
+
+
+def _merchant(rng, venue, floors, categories, i):
+    merchant = Merchant(
+        floor=rng.choice(floors),
+        category=rng.choice(categories),
+        name=" ".join(rng.sample(WORDS, 2)).title() + f" {i}",
+        lot_number=f"{rng.choice('GL')}-{rng.randint(1, 300)}",
+        description=" ".join(rng.choices(WORDS, k=12)),
+        keywords=", ".join(rng.sample(WORDS, 3)),
+        operating_hours=rng.choices([hours for hours, _ in OPERATING_HOURS], [weight for _, weight in OPERATING_HOURS])[0],
+        is_halal=rng.random() < 0.4,
+        accepts_ewallet=rng.random() < 0.8,
+        is_featured=rng.random() < 0.05,
+        latitude=venue.latitude + rng.uniform(-0.001, 0.001),
+        longitude=venue.longitude + rng.uniform(-0.001, 0.001),
+    )
+    # What Merchant.save() would have filled in.
+    merchant.search_document = merchant.build_search_document()
+    merchant.apply_operating_hours()
+    return merchant
+
+
+def _product(rng, merchant, number, sizes):
+    """A product and its variants, with the columns the signals would have filled in already set."""
+    product = Product(merchant=merchant, name=" ".join(rng.sample(WORDS, 2)).title(), description=" ".join(rng.choices(WORDS, k=8)))
+    base = Decimal(rng.randint(100, 20000)) / 100
+    names = _variant_names(1 + _between(rng, sizes.variants_per_product - 1, 0, 11))
+    variants = [
+        ProductVariant(
+            name=name,
+            sku=f"P{number + 1}-{i + 1}",
+            price_rm=base + rng.choice((0, 0, 0, 5, 10)),
+            stock_qty=rng.choice((0, 0, 1, 5, 20, 100)),
+            is_active=rng.random() < 0.95,
+        )
+        for i, name in enumerate(names)
+    ]
+    # As merchants.availability and merchants.search would compute them.
+    active = [variant for variant in variants if variant.is_active]
+    product.min_active_price_rm = min((variant.price_rm for variant in active), default=None)
+    product.total_stock = sum(variant.stock_qty for variant in active if variant.stock_qty > 0)
+    product.in_stock = product.total_stock > 0
+    product.search_document = product_document(product, variants)
+    return product, variants
+
+
+def _insert_trigrams(products):
+    """The trigram rows refresh_product_search() would write, inserted without building a model per row."""
+    if connection.vendor == 'postgresql':
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {quote(ProductSearchTrigram._meta.db_table)} ({quote('product_id')}, {quote('trigram')}) VALUES (%s, %s)",
+            [(product.pk, gram) for product in products for gram in trigrams(product.search_document)],
+        )
+
+
+def _variant_names(count):
+    if count == 1:
+        return ['']
+    if count <= len(SIZES):
+        return list(SIZES[:count])
+    return [f"{size} / {colour}" for colour in COLOURS for size in SIZES][:count]
+
+
+def seed(scale: float = 1, *, seed: int = 42, batch_size: int = BATCH_SIZE, log=None) -> Dataset:
+    """Write a dataset of the given scale; the same ``seed`` gives the same data."""
+    sizes = Sizes.for_scale(scale)
+    log = log or (lambda message: None)
+    User = get_user_model()
+    counts = dict.fromkeys(('venues', 'floors', 'merchants', 'products', 'variants', 'shoppers', 'follows', 'updates'), 0)
+
+    owner = User.objects.create_user(OWNER)
+    UserProfile.objects.filter(user=owner).update(role=UserProfile.Role.VENUE)
+    shopper = User.objects.create_user(SHOPPER)
+    UserProfile.objects.filter(user=shopper).update(latitude=HOME[0], longitude=HOME[1])
+
+    merchant_categories = [
+        MerchantCategory.objects.get_or_create(slug=f'{PREFIX}{name.lower()}', defaults={'name': name})[0]
+        for name in MERCHANT_CATEGORIES
+    ]
+    product_categories = [
+        ProductCategory.objects.get_or_create(slug=f'{PREFIX}{name.lower()}', defaults={'name': name})[0]
+        for name in PRODUCT_CATEGORIES
+    ]
+
+    # Merchant ids with their cumulative popularity, for picking follows.
+    merchant_ids, popularity = array('q'), array('d')
+    rngs = {part: _rng(seed, part) for part in ('venues', 'merchants', 'products', 'updates', 'shoppers', 'follows')}
+    now = timezone.now()
+    venues = []
+
+    def write_merchants(merchants):
+        merchants = Merchant.objects.bulk_create(merchants)
+        for merchant in merchants:
+            merchant_ids.append(merchant.pk)
+            popularity.append((popularity[-1] if popularity else 0.0) + rngs['merchants'].paretovariate(1.2))
+        counts['merchants'] += len(merchants)
+        write_products(merchants)
+        write_updates(merchants)
+
+    def write_products(merchants):
+        rng = rngs['products']
+        for batch in _batches(
+            (merchant for merchant in merchants for _ in range(_between(rng, sizes.products_per_merchant, 0, 60))),
+            batch_size,
+        ):
+            rows = [_product(rng, merchant, counts['products'] + i, sizes) for i, merchant in enumerate(batch)]
+            products = Product.objects.bulk_create([product for product, _ in rows])
+            variants = []
+            for product, product_variants in rows:
+                for variant in product_variants:
+                    variant.product = product
+                variants += product_variants
+            ProductVariant.objects.bulk_create(variants, batch_size=batch_size)
+            Product.categories.through.objects.bulk_create([
+                Product.categories.through(product_id=product.pk, productcategory_id=category.pk)
+                for product in products
+                for category in rng.sample(product_categories, rng.choice((1, 1, 1, 2)))
+            ])
+            _insert_trigrams(products)
+            counts['products'] += len(products)
+            counts['variants'] += len(variants)
+
+    def write_updates(merchants):
+        rng = rngs['updates']
+        updates = MerchantUpdate.objects.bulk_create(
+            [
+                MerchantUpdate(merchant=merchant, title=f"Update {i}", body=" ".join(rng.choices(WORDS, k=20)))
+                for merchant in merchants
+                for i in range(_between(rng, sizes.updates_per_merchant, 0, 30))
+            ],
+            batch_size=batch_size,
+        )
+        # published_at is set on insert, so the updates are spread out afterwards, one query per day.
+        by_day = {}
+        for update in updates:
+            by_day.setdefault(rng.randrange(UPDATE_DAYS), []).append(update.pk)
+        for day, pks in sorted(by_day.items()):
+            MerchantUpdate.objects.filter(pk__in=pks).update(published_at=now - timedelta(days=day, minutes=rng.randrange(1440)))
+        counts['updates'] += len(updates)
+
+    pending = []
+    for venue, merchant_count in _venues(rngs['venues'], sizes, owner):
+        venue.save()
+        venues.append(venue)
+        floors = Floor.objects.bulk_create([
+            Floor(venue=venue, name=name, level_order=level)
+            for level, name in _floor_names(max(2, min(8, merchant_count // 30 + 1)))
+        ])
+        counts['venues'] += 1
+        counts['floors'] += len(floors)
+        for i in range(merchant_count):
+            pending.append(_merchant(rngs['merchants'], venue, floors, merchant_categories, i))
+            if len(pending) >= batch_size:
+                write_merchants(pending)
+                pending = []
+        if counts['venues'] % 100 == 0:
+            log(f"{counts['venues']} venues, {counts['merchants'] + len(pending)} merchants...")
+    if pending:
+        write_merchants(pending)
+    log(f"{counts['venues']} venues, {counts['floors']} floors, {counts['merchants']} merchants, "
+        f"{counts['products']} products, {counts['variants']} variants, {counts['updates']} updates")
+
+    def follows_for(rng, user_id, count):
+        chosen = set()
+        # Popular merchants are picked far more often; stop early if the picks keep repeating.
+        for _ in range(count * 4):
+            if len(chosen) >= count:
+                break
+            chosen.add(merchant_ids[bisect(popularity, rng.random() * popularity[-1])])
+        return [MerchantFollow(user_id=user_id, merchant_id=merchant_id) for merchant_id in chosen]
+
+    follow_rng = rngs['follows']
+    shopper_rng = rngs['shoppers']
+    counts['follows'] += len(MerchantFollow.objects.bulk_create(follows_for(follow_rng, shopper.pk, 25)))
+    password = make_password(None)
+    for batch in _batches(range(sizes.shoppers), batch_size):
+        users = User.objects.bulk_create([User(username=f'{PREFIX}shopper-{i}', password=password) for i in batch])
+        profiles = []
+        for user in users:
+            profile = UserProfile(user=user)
+            if shopper_rng.random() < 0.3:
+                _, lat, lon, _, spread = shopper_rng.choices(CITIES, [city[3] for city in CITIES])[0]
+                profile.latitude, profile.longitude = shopper_rng.gauss(lat, spread), shopper_rng.gauss(lon, spread)
+            profiles.append(profile)
+        UserProfile.objects.bulk_create(profiles)
+        follows = [
+            follow
+            for user in users
+            for follow in follows_for(follow_rng, user.pk, _between(follow_rng, sizes.follows_per_shopper, 1, 200))
+        ]
+        MerchantFollow.objects.bulk_create(follows, batch_size=batch_size)
+        counts['shoppers'] += len(users)
+        counts['follows'] += len(follows)
+    counts['shoppers'] += 1
+    log(f"{counts['shoppers']} shoppers, {counts['follows']} follows")
+
+    # Bulk writes skip the signals that expire cached directory pages.
+    for venue in venues:
+        bump_directory_generation(venue.pk)
+
+    return Dataset(owner=owner, shopper=shopper, venues=venues, counts=counts)
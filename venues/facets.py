@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .utils import open_now_q
+
+
+@dataclass(frozen=True)
+class DirectoryFilters:
+    """Directory filters that combine with the text search and category."""
+    floor: int | None = None
+    halal: bool = False
+    ewallet: bool = False
+    open_now: bool = False
+
+    @classmethod
+    def from_request(cls, request) -> DirectoryFilters:
+        floor = request.GET.get('floor', '')
+        return cls(
+            floor=int(floor) if floor.isdigit() else None,
+            halal=request.GET.get('halal') == '1',
+            ewallet=request.GET.get('ewallet') == '1',
+            open_now=request.GET.get('open') == '1',
+        )
+
+    def conditions(self, now: datetime) -> dict[str, Q]:
+        conditions = {}
+        if self.floor is not None:
+            conditions['floor'] = Q(floor_id=self.floor)
+        if self.halal:
+            conditions['halal'] = Q(is_halal=True)
+        if self.ewallet:
+            conditions['ewallet'] = Q(accepts_ewallet=True)
+        if self.open_now:
+            conditions['open'] = open_now_q(now=now)
+        return conditions
+
+    def apply(self, merchants, *, now: Optional[datetime] = None):
+        for condition in self.conditions(now or timezone.localtime()).values():
+            merchants = merchants.filter(condition)
+        return merchants
+
+    @property
+    def cache_key(self) -> tuple:
+        return (self.floor, self.halal, self.ewallet, self.open_now)
+
+
+def _count(condition):
+    return Count('pk', filter=condition) if condition else Count('pk')
+
+
+def directory_facets(merchants, filters: DirectoryFilters, *, now: Optional[datetime] = None) -> dict:
+    """
+    Live counts for the directory filters over ``merchants`` (a Merchant
+    queryset narrowed by venue, text and category but not by ``filters``).
+    Each count applies every selected filter except its own, so it is the
+    number of results that turning the filter on (or picking the floor)
+    would give.
+
+    One query: merchants are grouped by floor with a conditional count per
+    flag, and the flag counts are summed over the floors.
+    Returns ``{'floors': [{'id', 'name', 'count', 'selected'}], 'halal',
+    'ewallet', 'open', 'total'}``.
+    """
+    now = now or timezone.localtime()
+    conditions = filters.conditions(now)
+
+    def matching(skip, *extra):
+        condition = Q(*extra)
+        for name, selected in conditions.items():
+            if name != skip:
+                condition &= selected
+        return condition
+
+    rows = (
+        merchants.order_by()
+        .values('floor_id', 'floor__name', 'floor__level_order')
+        .annotate(
+            total=_count(matching('floor')),
+            halal=_count(matching('halal', Q(is_halal=True))),
+            ewallet=_count(matching('ewallet', Q(accepts_ewallet=True))),
+            open=_count(matching('open', open_now_q(now=now))),
+        )
+    )
+    rows = sorted(rows, key=lambda row: (row['floor__level_order'], row['floor__name']))
+    return {
+        'floors': [
+            {'id': row['floor_id'], 'name': row['floor__name'], 'count': row['total'], 'selected': row['floor_id'] == filters.floor}
+            for row in rows
+        ],
+        # The flag counts already include the floor selection.
+        'halal': sum(row['halal'] for row in rows),
+        'ewallet': sum(row['ewallet'] for row in rows),
+        'open': sum(row['open'] for row in rows),
+        'total': sum(row['total'] for row in rows if filters.floor in (None, row['floor_id'])),
+    }
@@ -1,6 +1,7 @@
 from django import forms
 from django.utils.text import slugify
 
+from .merchant_io import openpyxl
 from .models import Venue, VenueLead, Floor
 from merchants.models import Merchant, MerchantCategory
 
@@ -73,4 +74,18 @@ class MerchantForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Filter floors to only show floors belonging to the current venue
         if venue:
-            self.fields['floor'].queryset = Floor.objects.filter(venue=venue)
+            self.fields['floor'].queryset = Floor.objects.filter(venue=venue).select_related('venue')
+
+
+class MerchantImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV (UTF-8) or Excel .xlsx, with a header row.")
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        name = upload.name.lower()
+        if name.endswith('.xlsx'):
+            if openpyxl is None:
+                raise forms.ValidationError("Excel files are not supported on this server; upload a CSV file.")
+        elif not name.endswith('.csv'):
+            raise forms.ValidationError("Upload a .csv or .xlsx file.")
+        return upload
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+
+# Widths generated per image field (model label -> field -> widths), sized
+# for the slots the templates show them in at 1x/2x/3x density.
+RENDITION_WIDTHS = {
+    'merchants.Merchant': {'logo': (64, 128, 192), 'storefront_image': (480, 960, 1440)},
+    'merchants.ProductImage': {'image': (320, 640, 1280)},
+    'venues.Venue': {'cover_image': (640, 1280, 1920)},
+}
+
+# Encoder settings; the fallback is JPEG, or PNG when the image has transparency.
+_FORMATS = {
+    'avif': ('AVIF', 'avif', {'quality': 55}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'png', {'optimize': True}),
+}
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+
+def modern_formats() -> list[str]:
+    """Next-generation formats this Pillow build can write, best first."""
+    return [name for name in ('avif', 'webp') if features.check(name)]
+
+
+def renditions_attr(field_name: str) -> str:
+    return f"{field_name}_renditions"
+
+
+def renditions_are_stale(instance, field_name: str) -> bool:
+    """True when the stored renditions were not made from the field's current file."""
+    manifest = getattr(instance, renditions_attr(field_name)) or {}
+    return (getattr(instance, field_name).name or '') != manifest.get('source', '')
+
+
+def _open(fieldfile, max_width):
+    with fieldfile.open('rb') as fh:
+        image = Image.open(fh)
+        # Lets JPEG decode at a reduced scale when the original is huge.
+        image.draft('RGB', (max_width, max_width * image.height // max(image.width, 1)))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    icc_profile = image.info.get('icc_profile')
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    # Drops EXIF (GPS, camera serials) and other metadata; only the colour profile is kept.
+    image.info = {}
+    return image, has_alpha, icc_profile
+
+
+def build_renditions(fieldfile, widths) -> dict:
+    """
+    Resize ``fieldfile`` to each of ``widths`` (never upscaling) in every
+    modern format plus a JPEG/PNG fallback, and save them next to the
+    original as ``<name>.<width>w.<ext>``. Returns the manifest stored in
+    the model's ``<field>_renditions``.
+    """
+    storage = fieldfile.storage
+    image, has_alpha, icc_profile = _open(fieldfile, max(widths))
+    width, height = image.size
+    base, _ = os.path.splitext(fieldfile.name)
+
+    sizes = sorted({min(w, width) for w in widths}, reverse=True)
+    resized = {}
+    source = image
+    for size in sizes:
+        # Each width is scaled from the next larger one, which is much cheaper than from the original.
+        if size != source.width:
+            source = source.resize((size, max(1, round(height * size / width))), Image.Resampling.LANCZOS)
+        resized[size] = source
+
+    sources = {}
+    for name in modern_formats() + ['png' if has_alpha else 'jpeg']:
+        pil_format, ext, options = _FORMATS[name]
+        entries = []
+        for size in reversed(sizes):
+            buffer = BytesIO()
+            resized[size].save(buffer, pil_format, icc_profile=icc_profile, **options)
+            path = f"{base}.{size}w.{ext}"
+            # Fixed names make regenerating idempotent instead of piling up suffixed copies.
+            storage.delete(path)
+            entries.append([size, storage.save(path, ContentFile(buffer.getvalue()))])
+        sources[name] = entries
+
+    return {'source': fieldfile.name, 'width': width, 'height': height, 'sources': sources}
+
+
+def rendition_paths(manifest: dict) -> set[str]:
+    return {path for entries in (manifest or {}).get('sources', {}).values() for _, path in entries}
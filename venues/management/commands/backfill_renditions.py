@@ -0,0 +1,47 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from jobs.queue import enqueue
+from venues.images import RENDITION_WIDTHS, renditions_are_stale, renditions_attr
+from venues.tasks import generate_renditions
+
+
+class Command(BaseCommand):
+    help = "Queue (or build with --now) resized copies of logos, storefronts, covers and product images that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--now', action='store_true', help="Generate in this process instead of queueing jobs.")
+        parser.add_argument('--force', action='store_true', help="Rebuild every image, e.g. after changing the widths.")
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, fields in RENDITION_WIDTHS.items():
+            Model = apps.get_model(model)
+            for field in fields:
+                images = (
+                    Model.objects.exclude(Q(**{field: ''}) | Q(**{f'{field}__isnull': True}))
+                    .only('pk', field, renditions_attr(field))
+                    .order_by('pk')
+                )
+                count = 0
+                for instance in images.iterator(chunk_size=500):
+                    if not (options['force'] or renditions_are_stale(instance, field)):
+                        continue
+                    if options['now']:
+                        try:
+                            generate_renditions(model=model, pk=instance.pk, field=field)
+                        except Exception as exc:
+                            self.stderr.write(f"{model} #{instance.pk} {field}: {exc}")
+                            continue
+                    else:
+                        enqueue(
+                            generate_renditions, key=f"renditions:{model}:{instance.pk}:{field}",
+                            model=model, pk=instance.pk, field=field,
+                        )
+                    count += 1
+                self.stdout.write(f"{model}.{field}: {count}")
+                total += count
+
+        verb = "Generated" if options['now'] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{verb} renditions for {total} images."))
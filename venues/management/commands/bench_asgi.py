@@ -0,0 +1,229 @@
+import asyncio
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from venues import dataset
+from venues.cache import bump_directory_generation
+from venues.management.commands.bench_site import _git_commit, percentile
+
+
+MODES = ('wsgi', 'asgi')
+HOST = 'testserver'
+
+
+def keystrokes(rng, words):
+    """What a search box sends while ``words`` are typed: every prefix from two letters on."""
+    typed = []
+    for _ in range(words):
+        term = " ".join(rng.sample(dataset.WORDS, rng.choice((1, 1, 2))))
+        endpoint = rng.choice(('directory', 'items'))
+        typed.extend((endpoint, term[:end]) for end in range(2, len(term) + 1) if not term[:end].endswith(' '))
+    return typed
+
+
+def _environ(path, query):
+    return {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': HOST, 'HTTP_HX_REQUEST': 'true',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def _scope(path, query):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', HOST.encode()), (b'hx-request', b'true')],
+        'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay concurrent search-as-you-type traffic (HTMX requests to the directory and item search, one per "
+        "keystroke) through the WSGI handler with a fixed number of worker threads, as gunicorn runs it, and "
+        "through the ASGI handler on one event loop, as a uvicorn worker runs it, and report latency and "
+        "throughput for each. Reads the dataset seed_dataset left in the database: the ASGI handler opens "
+        "its own connections, so uncommitted data would be invisible to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--users', type=int, default=20, help="Shoppers typing at the same time.")
+        parser.add_argument('--words', type=int, default=3, help="Searches each shopper types.")
+        parser.add_argument('--think-ms', type=float, default=100, help="Pause between keystrokes.")
+        parser.add_argument('--workers', type=int, default=4, help="WSGI requests handled at once (gunicorn threads).")
+        parser.add_argument('--modes', default=','.join(MODES), help="Comma separated subset of wsgi and asgi.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}. Choose from {', '.join(MODES)}.")
+        try:
+            data = dataset.Dataset.load()
+        except get_user_model().DoesNotExist:
+            raise CommandError("No seeded dataset found; run seed_dataset first.")
+        venue = data.venues[0]
+        urls = {
+            'directory': reverse('venue_directory', args=[venue.slug]),
+            'items': reverse('venue_item_search', args=[venue.slug]),
+        }
+        rng = random.Random(options['seed'])
+        # The same keystrokes are replayed in every mode.
+        typists = [
+            [(urls[endpoint], urlencode({'q': term})) for endpoint, term in keystrokes(rng, options['words'])]
+            for _ in range(options['users'])
+        ]
+        self.stdout.write(
+            f"{options['users']} shoppers, {sum(map(len, typists))} keystrokes, {options['think_ms']:g} ms apart"
+        )
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]):
+            for mode in modes:
+                run = self._wsgi if mode == 'wsgi' else self._asgi
+                # Load templates and warm per-process caches outside the measurement.
+                run([[(url, 'q=ko') for url in urls.values()]], options)
+                # Each mode starts with the venue's directory fragments cold.
+                bump_directory_generation(venue.pk)
+                timings, wall = run(typists, options)
+                results[mode] = self._summary(timings, wall)
+                self._write_row(mode, results[mode])
+
+        if {'wsgi', 'asgi'} <= results.keys():
+            wsgi, asgi = results['wsgi'], results['asgi']
+            self.stdout.write(
+                f"asgi vs wsgi: p95 {asgi['p95_ms'] / wsgi['p95_ms'] - 1:+.0%}, "
+                f"throughput {asgi['throughput_rps'] / wsgi['throughput_rps'] - 1:+.0%}"
+            )
+        if options['output']:
+            report = {
+                'meta': {
+                    'commit': _git_commit(),
+                    'seed': options['seed'],
+                    'users': options['users'],
+                    'words': options['words'],
+                    'think_ms': options['think_ms'],
+                    'workers': options['workers'],
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                },
+                'modes': results,
+            }
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def _check(self, status, path, query):
+        if status != 200:
+            raise CommandError(f"HTTP {status} for {path}?{query}")
+
+    def _wsgi(self, typists, options):
+        handler = WSGIHandler()
+        # A request waiting for a free worker is as slow to the shopper as a slow one.
+        slots = threading.BoundedSemaphore(options['workers'])
+        timings, errors = [], []
+
+        def type_(keystrokes):
+            try:
+                for path, query in keystrokes:
+                    started = time.perf_counter()
+                    status = []
+                    with slots:
+                        body = handler(_environ(path, query), lambda line, headers: status.append(line))
+                        b''.join(body)
+                        # Fires request_finished, which closes the thread's connection.
+                        body.close()
+                    timings.append(time.perf_counter() - started)
+                    self._check(int(status[0].split()[0]), path, query)
+                    time.sleep(options['think_ms'] / 1000)
+            except Exception as exc:
+                errors.append(exc)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=type_, args=(keystrokes,)) for keystrokes in typists]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return timings, time.perf_counter() - started
+
+    def _asgi(self, typists, options):
+        handler = ASGIHandler()
+        timings = []
+
+        async def request(path, query):
+            status = None
+            received = False
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # The client never disconnects; the handler stops listening once it has answered.
+                await asyncio.Event().wait()
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+
+            await handler(_scope(path, query), receive, send)
+            return status
+
+        async def type_(keystrokes):
+            for path, query in keystrokes:
+                started = time.perf_counter()
+                status = await request(path, query)
+                timings.append(time.perf_counter() - started)
+                self._check(status, path, query)
+                await asyncio.sleep(options['think_ms'] / 1000)
+
+        async def main():
+            await asyncio.gather(*(type_(keystrokes) for keystrokes in typists))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return timings, time.perf_counter() - started
+
+    def _summary(self, timings, wall):
+        timings = sorted(timings)
+        return {
+            'requests': len(timings),
+            'throughput_rps': round(len(timings) / wall, 1),
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        }
+
+    def _write_row(self, mode, row):
+        self.stdout.write(
+            f"{mode:<5} {row['requests']:5d} requests  {row['throughput_rps']:7.1f} req/s  "
+            f"p50 {row['p50_ms']:8.2f} ms  p95 {row['p95_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms"
+        )
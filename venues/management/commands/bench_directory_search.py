@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from merchants.models import Merchant, MerchantCategory
+from merchants.search import _legacy_merchant_filter, search_merchants
+from venues.models import Floor, Venue
+
+
+WORDS = (
+    "kopi nasi lemak roti canai teh tarik batik songket durian cendol laksa satay "
+    "phone repair optical bookstore pharmacy bakery sushi fashion sneakers watch "
+    "gold jewellery toys gadget laptop boutique salon spa florist bank"
+).split()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare the legacy icontains directory search with the full-text index on throwaway merchants."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=50_000)
+        parser.add_argument('--requests', type=int, default=30, help="Queries per search term.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back, so the
+        # configured database is left untouched.
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        owner = get_user_model().objects.create_user(username=f"bench-{rng.random()}")
+        venue = Venue.objects.create(owner=owner, name="Bench Mall", slug=f"bench-mall-{rng.randrange(10**9)}")
+        floors = [Floor.objects.create(venue=venue, name=f"Level {i}", level_order=i) for i in range(6)]
+        categories = [
+            MerchantCategory.objects.create(name=word.title(), slug=f"bench-{word}-{rng.randrange(10**9)}")
+            for word in WORDS[:12]
+        ]
+
+        self.stdout.write(f"Seeding {options['merchants']} merchants...")
+        batch = []
+        for i in range(options['merchants']):
+            merchant = Merchant(
+                floor=rng.choice(floors),
+                category=rng.choice(categories),
+                name=" ".join(rng.sample(WORDS, 2)).title() + f" {i}",
+                lot_number=f"{rng.choice('GL')}-{rng.randint(1, 300)}",
+                description=" ".join(rng.choices(WORDS, k=12)),
+                keywords=", ".join(rng.sample(WORDS, 3)),
+            )
+            merchant.search_document = merchant.build_search_document()
+            batch.append(merchant)
+            if len(batch) >= 5000:
+                Merchant.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Merchant.objects.bulk_create(batch)
+
+        base = Merchant.objects.filter(floor__venue=venue)
+        strategies = [
+            ("icontains", lambda q: _legacy_merchant_filter(base, q).order_by('-is_featured', 'name')),
+            ("full-text", lambda q: search_merchants(base, q)),
+        ]
+        for term in ("ko", "nasi lemak", "durian", "G-12"):
+            for label, build in strategies:
+                timings = []
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    qs = build(term)
+                    qs.count()
+                    list(qs[:20])
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p50 = statistics.median(timings)
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(f"q={term!r:<14} {label:<10} p50={p50:8.1f} ms  p95={p95:8.1f} ms")
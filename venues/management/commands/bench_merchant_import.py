@@ -0,0 +1,99 @@
+import csv
+import io
+import random
+import resource
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from merchants.models import Merchant, MerchantCategory
+from venues.merchant_io import COLUMNS, export_rows, import_merchants, stream_csv
+from venues.models import Floor, Venue
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Import, re-import and export a generated merchant CSV on throwaway data and report time, queries and peak memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--floors', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back, so the
+        # configured database is left untouched.
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        owner = get_user_model().objects.create(username="bench-import-owner")
+        venue = Venue.objects.create(owner=owner, name="Bench Mall", slug="bench-import-mall")
+        floors = Floor.objects.bulk_create(
+            [Floor(venue=venue, name=f"Level {i}", level_order=i) for i in range(options['floors'])]
+        )
+        categories = MerchantCategory.objects.bulk_create(
+            [MerchantCategory(name=f"Bench {i}", slug=f"bench-import-{i}") for i in range(12)]
+        )
+
+        with tempfile.TemporaryFile() as fh:
+            self._write_csv(fh, rng, options['rows'], floors, categories)
+            self._measure("import", lambda: import_merchants(venue, fh, 'merchants.csv'))
+            # The same file again matches every row by lot number and finds nothing to change.
+            self._measure("re-import", lambda: import_merchants(venue, fh, 'merchants.csv'))
+
+        with tempfile.TemporaryFile() as fh:
+            # Every row changes its hours (and so the derived schedule columns).
+            self._write_csv(fh, random.Random(options['seed']), options['rows'], floors, categories, hours="9:00 AM - 9:00 PM")
+            self._measure("update", lambda: import_merchants(venue, fh, 'merchants.csv'))
+
+        def export():
+            return sum(len(chunk) for chunk in stream_csv(export_rows(venue)))
+
+        self._measure("export", export)
+        self.stdout.write(f"{Merchant.objects.filter(floor__venue=venue).count()} merchants in the venue")
+
+    def _write_csv(self, fh, rng, rows, floors, categories, hours="10:00 AM - 10:00 PM"):
+        text = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow([column for column in COLUMNS if column != 'id'])
+        for i in range(rows):
+            writer.writerow([
+                f"Shop {i}", rng.choice(floors).name, rng.choice(categories).name, f"L{i:05d}",
+                "Near North Entrance", "Fashion, food and more", hours, "+60123456789",
+                f"https://shop{i}.example.com", "", "", rng.choice(['yes', 'no']), 'yes', "kopi, teh", 'no',
+                round(3.1 + rng.random() / 10, 6), round(101.6 + rng.random() / 10, 6),
+            ])
+        text.flush()
+        text.detach()
+
+    def _measure(self, label, func):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+        # Peak resident size of the whole process so far (KiB on Linux).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if hasattr(result, 'created'):
+            result = (
+                f"{result.created} created, {result.updated} updated, "
+                f"{result.unchanged} unchanged, {result.failed} failed"
+            )
+        else:
+            result = f"{result} characters"
+        self.stdout.write(
+            f"{label}: {result} in {elapsed * 1000:.0f} ms, {len(queries)} queries, "
+            f"peak RSS {peak / 1024:.0f} MiB"
+        )
@@ -0,0 +1,233 @@
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from merchants.feed import feed_page
+from merchants.models import Merchant
+from venues import dataset
+from venues.cache import bump_directory_generation
+
+
+TERMS = ("kopi", "nasi lemak", "durian", "phone", "G-12", "")
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _QueryCount:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(timings, share):
+    """Nearest-rank percentile of sorted ``timings``."""
+    return timings[max(0, math.ceil(share * len(timings)) - 1)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the public and owner pages through the Django test client over a seeded dataset and report "
+        "throughput, p50/p95/p99 latency and queries per request. Save a baseline with --output and check "
+        "a later run against it with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small', help="Dataset scale to seed (see seed_dataset).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=50, help="Requests per scenario.")
+        parser.add_argument(
+            '--existing', action='store_true',
+            help="Use the dataset seed_dataset left in the database instead of seeding a throwaway one.",
+        )
+        parser.add_argument('--scenarios', help="Comma separated subset of the scenarios to run.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="Baseline JSON from an earlier --output to compare with.")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help="With --compare, fail when a p95 grows by more than this share or a query count grows at all.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scale = dataset.parse_scale(options['scale'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read the baseline: {exc}")
+
+        # Seeded data lives in one transaction that is rolled back, so the
+        # configured database is left untouched.
+        data = None
+        try:
+            with transaction.atomic():
+                if options['existing']:
+                    try:
+                        data = dataset.Dataset.load()
+                    except get_user_model().DoesNotExist:
+                        raise CommandError("No seeded dataset found; run seed_dataset first.")
+                else:
+                    self.stdout.write(f"Seeding scale {options['scale']}...")
+                    data = dataset.seed(scale, seed=options['seed'])
+                results = self._run(data, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            if data is not None and not options['existing']:
+                # Cached pages of the rolled-back venues must not be served to
+                # later venues that are given the same ids.
+                for venue in data.venues:
+                    bump_directory_generation(venue.pk)
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'scale': scale,
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if baseline:
+            self._compare(baseline, report, options['tolerance'])
+
+    def _scenarios(self, data, rng):
+        venue = data.venues[0]
+        anonymous, shopper, owner = Client(), Client(), Client()
+        shopper.force_login(data.shopper)
+        owner.force_login(data.owner)
+        directory = reverse('venue_directory', args=[venue.slug])
+        items = reverse('venue_item_search', args=[venue.slug])
+        merchant_ids = list(Merchant.objects.filter(floor__venue=venue).values_list('pk', flat=True)[:50])
+
+        cursors = [None]
+        while len(cursors) < 3:
+            cursor = feed_page(data.shopper, cursors[-1], 20).next_cursor
+            if cursor is None:
+                break
+            cursors.append(cursor)
+
+        def follow(i):
+            url = reverse('merchant_follow', args=[venue.slug, merchant_ids[i % len(merchant_ids)]])
+            return shopper.post(url, HTTP_HX_REQUEST='true')
+
+        return {
+            'directory': lambda i: anonymous.get(directory, {'q': rng.choice(TERMS)}),
+            'directory_htmx': lambda i: anonymous.get(directory, {'q': rng.choice(TERMS)}, HTTP_HX_REQUEST='true'),
+            'item_search_near': lambda i: shopper.get(items, {'near': '1', 'q': rng.choice(TERMS)}),
+            'feed': lambda i: shopper.get(
+                reverse('user_feed'), {'cursor': cursors[i % len(cursors)]} if cursors[i % len(cursors)] else {},
+            ),
+            # Each merchant is followed and unfollowed in turn.
+            'follow_toggle': follow,
+            'owner_dashboard': lambda i: owner.get(reverse('venue_dashboard', args=[venue.pk])),
+            'owner_merchants': lambda i: owner.get(reverse('venue_merchants', args=[venue.pk])),
+        }
+
+    def _run(self, data, options):
+        rng = random.Random(options['seed'])
+        scenarios = self._scenarios(data, rng)
+        if options['scenarios']:
+            wanted = options['scenarios'].split(',')
+            unknown = set(wanted) - set(scenarios)
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Choose from {', '.join(scenarios)}.")
+            scenarios = {name: scenarios[name] for name in wanted}
+
+        results = {}
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name, request in scenarios.items():
+                timings, queries = [], []
+                for i in range(options['requests']):
+                    counter = _QueryCount()
+                    with connection.execute_wrapper(counter):
+                        started = time.perf_counter()
+                        response = request(i)
+                        timings.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise CommandError(f"{name}: HTTP {response.status_code} for {response.wsgi_request.get_full_path()}")
+                    queries.append(counter.queries)
+                results[name] = self._summary(timings, queries)
+                self._write_row(name, results[name])
+        return results
+
+    def _summary(self, timings, queries):
+        timings = sorted(timings)
+        return {
+            'requests': len(timings),
+            'throughput_rps': round(len(timings) / sum(timings), 1),
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+            'queries_mean': round(statistics.mean(queries), 1),
+            'queries_max': max(queries),
+        }
+
+    def _write_row(self, name, row):
+        self.stdout.write(
+            f"{name:<17} {row['throughput_rps']:7.1f} req/s  p50 {row['p50_ms']:8.2f} ms  "
+            f"p95 {row['p95_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms  "
+            f"queries {row['queries_mean']:g} (max {row['queries_max']})"
+        )
+
+    def _compare(self, baseline, report, tolerance):
+        self.stdout.write(f"Compared with {baseline['meta'].get('commit') or 'the baseline'}:")
+        regressions = []
+        for name, row in report['scenarios'].items():
+            before = baseline['scenarios'].get(name)
+            if before is None:
+                self.stdout.write(f"{name:<17} not in the baseline")
+                continue
+            change = row['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            self.stdout.write(
+                f"{name:<17} p95 {before['p95_ms']:8.2f} -> {row['p95_ms']:8.2f} ms ({change:+.0%})  "
+                f"queries {before['queries_max']} -> {row['queries_max']}"
+            )
+            if change > tolerance:
+                regressions.append(f"{name} p95 {change:+.0%}")
+            if row['queries_max'] > before['queries_max']:
+                regressions.append(f"{name} queries {before['queries_max']} -> {row['queries_max']}")
+        if regressions:
+            raise CommandError("Slower than the baseline: " + "; ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions."))
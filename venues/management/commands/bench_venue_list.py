@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from merchants.utils import geohash_encode
+from venues.models import Venue
+from venues.views import venue_list
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Seed throwaway venues and report venue_list latency (p50/p95) for several search radii."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--venues', type=int, default=100_000)
+        parser.add_argument('--requests', type=int, default=50, help="Requests per radius.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back, so the
+        # configured database is left untouched.
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        owner = get_user_model().objects.create_user(username=f"bench-{rng.random()}")
+
+        self.stdout.write(f"Seeding {options['venues']} venues...")
+        batch = []
+        for i in range(options['venues']):
+            # Peninsular Malaysia-ish spread, with some venues lacking coordinates.
+            lat = lon = None
+            if rng.random() > 0.05:
+                lat = rng.uniform(1.3, 6.7)
+                lon = rng.uniform(100.1, 104.3)
+            batch.append(Venue(
+                owner=owner,
+                name=f"Bench Venue {i}",
+                slug=f"bench-venue-{i}",
+                latitude=lat,
+                longitude=lon,
+                geohash=geohash_encode(lat, lon) if lat is not None else '',
+            ))
+            if len(batch) >= 5000:
+                Venue.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Venue.objects.bulk_create(batch)
+
+        factory = RequestFactory()
+        for radius in ('5', '30', 'all'):
+            timings = []
+            for _ in range(options['requests']):
+                params = {'lat': rng.uniform(2.9, 3.3), 'lon': rng.uniform(101.4, 101.8), 'radius': radius}
+                request = factory.get('/venues/', params)
+                request.user = AnonymousUser()
+                started = time.perf_counter()
+                response = venue_list(request)
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200
+            timings.sort()
+            p50 = statistics.median(timings)
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f"radius={radius:>4}  p50={p50:8.1f} ms  p95={p95:8.1f} ms")
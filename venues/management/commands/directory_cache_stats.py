@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from venues.cache import directory_cache_stats, reset_directory_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show the directory cache hit/miss counters (shared across workers when REDIS_URL is set)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero the counters after printing them.")
+
+    def handle(self, *args, **options):
+        stats = directory_cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0.0
+        self.stdout.write(f"hits={stats['hits']} misses={stats['misses']} hit_ratio={ratio:.1%}")
+        if options['reset']:
+            reset_directory_cache_stats()
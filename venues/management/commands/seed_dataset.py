@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from venues import dataset
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _scale(value):
+    try:
+        return dataset.parse_scale(value)
+    except ValueError as exc:
+        raise CommandError(str(exc))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic venues, merchants, products, follows and updates shaped like "
+        "production (see venues.dataset). --scale takes a name (tiny, small, medium, large, huge) or a "
+        "multiplier; small is about 200 merchants. --fixture also writes the rows as a loaddata fixture."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=dataset.BATCH_SIZE, help="Rows per bulk insert.")
+        parser.add_argument('--replace', action='store_true', help="Delete a previously seeded dataset first.")
+        parser.add_argument('--fixture', help="Write the seeded rows to this JSON Lines file (.jsonl) for loaddata.")
+        parser.add_argument(
+            '--fixture-only', action='store_true',
+            help="With --fixture, roll the database back afterwards so only the file is left.",
+        )
+
+    def handle(self, *args, **options):
+        scale = _scale(options['scale'])
+        if options['fixture_only'] and not options['fixture']:
+            raise CommandError("--fixture-only needs --fixture.")
+        exists = get_user_model().objects.filter(username=dataset.OWNER).exists()
+        if exists and not options['replace']:
+            raise CommandError("A seeded dataset already exists; pass --replace to start again.")
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if exists:
+                    self.stdout.write(f"Deleted {dataset.clear()} seeded rows")
+                data = dataset.seed(scale, seed=options['seed'], batch_size=options['batch_size'], log=self.stdout.write)
+                if options['fixture']:
+                    with open(options['fixture'], 'w') as fh:
+                        dataset.write_fixture(fh)
+                    self.stdout.write(f"Wrote {options['fixture']}")
+                if options['fixture_only']:
+                    raise _Rollback
+        except _Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded scale {options['scale']} in {time.perf_counter() - started:.1f}s: "
+            + ", ".join(f"{count} {name}" for name, count in data.counts.items())
+        ))
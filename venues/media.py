@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import IMMUTABLE_CACHE_CONTROL, is_blob, is_immutable
+
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    The inclusive ``(start, end)`` of a single ``bytes=`` range, or None
+    to send the whole file (no, malformed or multi-part ranges, which
+    servers may ignore). Raises RangeNotSatisfiable when it starts past
+    the end of the file.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise RangeNotSatisfiable
+        return start, min(int(last), size - 1) if last else size - 1
+    # "bytes=-N" is the last N bytes.
+    if int(last) == 0 or size == 0:
+        raise RangeNotSatisfiable
+    return max(0, size - int(last)), size - 1
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _etag(path, st):
+    if is_blob(path):
+        # The content hash is in the name, so every server agrees on it.
+        return quote_etag(os.path.splitext(posixpath.basename(path))[0])
+    return quote_etag(f'{st.st_mtime_ns:x}-{st.st_size:x}')
+
+
+def _content_type(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an upload from MEDIA_ROOT with validators for conditional
+    requests, single byte ranges and a cache lifetime: a year for blobs
+    and their renditions, whose URLs change with their content, and
+    MEDIA_CACHE_MAX_AGE for older uploads.
+
+    With MEDIA_OFFLOAD set, only the headers are produced here and the
+    front server sends the file (see DEPLOYMENT.md).
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404("Media file not found.")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("Media file not found.")
+
+    content_type = _content_type(path)
+    etag = _etag(path, st)
+    last_modified = int(st.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': (
+            IMMUTABLE_CACHE_CONTROL if is_immutable(path) else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+        ),
+        'Accept-Ranges': 'bytes',
+    }
+    response = HttpResponse(content_type=content_type, headers=headers)
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+    if conditional is not response:
+        return conditional
+
+    if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(path)
+        return response
+    if settings.MEDIA_OFFLOAD == 'x-sendfile':
+        response['X-Sendfile'] = fullpath
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    # A range only applies to the version of the file the client already has.
+    if 'Range' in request.headers and (not if_range or if_range in (etag, headers['Last-Modified'])):
+        try:
+            byte_range = parse_range(request.headers['Range'], st.st_size)
+        except RangeNotSatisfiable:
+            response.status_code = 416
+            response['Content-Range'] = f'bytes */{st.st_size}'
+            return response
+
+    if byte_range is None:
+        # FileResponse lets the WSGI server send the body with sendfile().
+        return FileResponse(open(fullpath, 'rb'), content_type=content_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    return StreamingHttpResponse(
+        _read_range(fullpath, start, length), status=206, content_type=content_type,
+        headers={**headers, 'Content-Range': f'bytes {start}-{end}/{st.st_size}', 'Content-Length': length},
+    )
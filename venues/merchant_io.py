@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import csv
+import io
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from zipfile import BadZipFile
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+try:
+    import openpyxl
+except ImportError:  # openpyxl is optional; CSV import and export work without it.
+    openpyxl = None
+
+from merchants.models import Merchant, MerchantCategory, Product
+from merchants.search import refresh_product_search
+from merchants.utils import parse_bool
+
+from .cache import bump_directory_generation
+from .models import Floor
+
+
+# Spreadsheet columns, in export order. Rows are matched to existing
+# merchants by ``id``, or else by ``lot_number``; anything else is created.
+COLUMNS = [
+    'id', 'name', 'floor', 'category', 'lot_number', 'nearest_entrance', 'description',
+    'operating_hours', 'phone_number', 'website', 'instagram', 'facebook',
+    'is_halal', 'accepts_ewallet', 'keywords', 'is_featured', 'latitude', 'longitude',
+]
+
+_MODEL_COLUMNS = [column for column in COLUMNS if column not in ('id', 'floor', 'category')]
+_BOOLEANS = {'is_halal', 'accepts_ewallet', 'is_featured'}
+_FLOATS = {'latitude', 'longitude'}
+# Fields Merchant.build_search_document() reads.
+_DOCUMENT_FIELDS = {'name', 'lot_number', 'category_id', 'keywords', 'description'}
+
+# Fields clean_fields() must skip: relations are resolved from the lookups
+# (validating them costs a query each) and the rest are not imported.
+_UNVALIDATED = [
+    'floor', 'category', 'logo', 'storefront_image', 'logo_renditions', 'storefront_image_renditions',
+]
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 200
+
+
+class ImportFileError(ValueError):
+    """The upload as a whole cannot be read (wrong format, no header, missing columns)."""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    # (line, message) for the first MAX_REPORTED_ERRORS failed rows.
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _header(cells):
+    return [str(cell or '').strip().lower().replace(' ', '_') for cell in cells]
+
+
+def _csv_rows(fh):
+    text = io.TextIOWrapper(fh, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = _header(next(reader, []))
+        yield header
+        for cells in reader:
+            if any(cells):
+                yield reader.line_num, dict(zip(header, (cell.strip() for cell in cells)))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ImportFileError(f"Could not read the CSV file ({exc}). Save it as UTF-8 CSV and try again.")
+    finally:
+        # Leave the upload open for the caller.
+        text.detach()
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _xlsx_rows(fh):
+    if openpyxl is None:
+        raise ImportFileError("XLSX import needs openpyxl; upload a CSV file instead.")
+    try:
+        workbook = openpyxl.load_workbook(fh, read_only=True, data_only=True)
+    except (BadZipFile, KeyError, ValueError, OSError) as exc:
+        raise ImportFileError(f"Could not open the XLSX file ({exc}).")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _header(next(rows, []))
+        yield header
+        for line, cells in enumerate(rows, start=2):
+            if any(cell not in (None, '') for cell in cells):
+                yield line, dict(zip(header, map(_cell_text, cells)))
+    finally:
+        workbook.close()
+
+
+def read_rows(fh, filename: str):
+    """
+    Yield the normalised header, then ``(line, {column: text})`` for each
+    non-empty row of a CSV or XLSX file, reading it incrementally.
+    """
+    fh.seek(0)
+    rows = _xlsx_rows(fh) if filename.lower().endswith('.xlsx') else _csv_rows(fh)
+    header = next(rows)
+    if 'name' not in header:
+        raise ImportFileError("The first row must be a header with at least a \"name\" column.")
+    yield header
+    yield from rows
+
+
+class MerchantImporter:
+    """
+    Create and update a venue's merchants from spreadsheet rows.
+
+    Floors (by name) and categories (by name or slug) are looked up from
+    dictionaries loaded once. Rows are validated and written
+    ``chunk_size`` at a time, each chunk in its own transaction, so memory
+    stays flat however long the file is. Invalid rows are skipped and
+    reported; the rest are saved.
+    """
+
+    def __init__(self, venue, *, chunk_size: int = CHUNK_SIZE):
+        self.venue = venue
+        self.chunk_size = chunk_size
+        self.floors = {floor.name.strip().lower(): floor for floor in Floor.objects.filter(venue=venue)}
+        self.categories = {}
+        for category in MerchantCategory.objects.all():
+            self.categories.setdefault(category.slug.lower(), category)
+            self.categories.setdefault(category.name.strip().lower(), category)
+        self.result = ImportResult()
+        self._seen = set()
+
+    def run(self, rows) -> ImportResult:
+        rows = iter(rows)
+        header = next(rows)
+        columns = [column for column in _MODEL_COLUMNS if column in header]
+        tracked = list(columns)
+        if 'floor' in header:
+            tracked.append('floor_id')
+        if 'category' in header:
+            tracked.append('category_id')
+        if 'operating_hours' in header:
+            tracked += ['opens_minute', 'closes_minute', 'is_overnight', 'open_days']
+
+        while chunk := list(islice(rows, self.chunk_size)):
+            self._import_chunk(chunk, columns, tracked)
+
+        if self.result.created or self.result.updated:
+            transaction.on_commit(partial(bump_directory_generation, self.venue.pk))
+        return self.result
+
+    def _existing(self, chunk):
+        ids = {int(row['id']) for _, row in chunk if row.get('id', '').isdigit()}
+        lots = {row['lot_number'].lower() for _, row in chunk if not row.get('id') and row.get('lot_number')}
+        by_id, by_lot = {}, {}
+        if not ids and not lots:
+            return by_id, by_lot
+        merchants = (
+            Merchant.objects.filter(floor__venue=self.venue)
+            .select_related('category')
+            .annotate(lot=Lower('lot_number'))
+            .filter(Q(pk__in=ids) | Q(lot__in=lots))
+        )
+        for merchant in merchants:
+            by_id[merchant.pk] = merchant
+            by_lot.setdefault(merchant.lot, []).append(merchant)
+        return by_id, by_lot
+
+    def _import_chunk(self, chunk, columns, tracked):
+        by_id, by_lot = self._existing(chunk)
+        to_create, renamed = [], []
+        # Rows are updated in groups that set the same values, often a
+        # single statement for a column edited down the whole sheet.
+        updates = defaultdict(list)
+
+        for line, row in chunk:
+            try:
+                merchant, key = self._match(row, by_id, by_lot)
+                if key in self._seen:
+                    raise ValidationError("Appears more than once in the file.")
+                if key is not None:
+                    self._seen.add(key)
+                before = [getattr(merchant, attname) for attname in tracked]
+                self._apply(merchant, row, columns)
+            except ValidationError as exc:
+                self.result.add_error(line, _error_text(exc))
+                continue
+
+            merchant.apply_operating_hours()
+            if merchant.pk is None:
+                merchant.search_document = merchant.build_search_document()
+                to_create.append(merchant)
+                continue
+            changed = tuple(
+                (attname, current)
+                for attname, value in zip(tracked, before)
+                if (current := getattr(merchant, attname)) != value
+            )
+            if any(attname in _DOCUMENT_FIELDS for attname, _ in changed):
+                merchant.search_document = merchant.build_search_document()
+                changed += (('search_document', merchant.search_document),)
+            if not changed:
+                # Re-uploading an edited export only writes the rows that were edited.
+                self.result.unchanged += 1
+                continue
+            updates[changed].append(merchant.pk)
+            if any(attname == 'name' for attname, _ in changed):
+                renamed.append(merchant.pk)
+
+        with transaction.atomic():
+            Merchant.objects.bulk_create(to_create)
+            # A later chunk finds these by lot number; they count as seen.
+            self._seen.update(('id', merchant.pk) for merchant in to_create if merchant.lot_number)
+            # Cheaper than bulk_update(), whose CASE per field and row costs more than a statement per row.
+            for values, pks in updates.items():
+                Merchant.objects.filter(pk__in=pks).update(**dict(values))
+            if renamed:
+                # update() skips the signal that re-indexes products under the new name.
+                refresh_product_search(Product.objects.filter(merchant_id__in=renamed).values_list('pk', flat=True))
+        self.result.created += len(to_create)
+        self.result.updated += sum(len(pks) for pks in updates.values())
+
+    def _match(self, row, by_id, by_lot):
+        if row.get('id'):
+            if not row['id'].isdigit() or int(row['id']) not in by_id:
+                raise ValidationError(f"No merchant with id {row['id']} in this venue.")
+            return by_id[int(row['id'])], ('id', int(row['id']))
+        lot = row.get('lot_number', '').lower()
+        if not lot:
+            return Merchant(), None
+        matches = by_lot.get(lot, [])
+        if len(matches) > 1:
+            raise ValidationError(f"Several merchants use lot {row['lot_number']}; add their id column to tell them apart.")
+        if matches:
+            return matches[0], ('id', matches[0].pk)
+        return Merchant(), ('lot', lot)
+
+    def _apply(self, merchant, row, columns):
+        errors = {}
+        for column in columns:
+            value = row.get(column, '')
+            if column in _BOOLEANS:
+                try:
+                    flag = parse_bool(value)
+                except ValidationError as exc:
+                    errors[column] = exc.messages
+                else:
+                    if flag is not None:
+                        setattr(merchant, column, flag)
+            elif column in _FLOATS:
+                try:
+                    setattr(merchant, column, float(value) if value else None)
+                except ValueError:
+                    errors[column] = ["Enter a number."]
+            else:
+                setattr(merchant, column, value)
+
+        if 'floor' in row:
+            floor = self.floors.get(row['floor'].lower())
+            if floor is None:
+                errors['floor'] = [f"No floor named \"{row['floor']}\" in this venue."]
+            else:
+                merchant.floor = floor
+        elif merchant.pk is None:
+            errors['floor'] = ["Required for new merchants."]
+        if row.get('category'):
+            category = self.categories.get(row['category'].lower())
+            if category is None:
+                errors['category'] = [f"Unknown category \"{row['category']}\"."]
+            else:
+                merchant.category = category
+        elif 'category' in row:
+            merchant.category = None
+
+        try:
+            merchant.clean_fields(exclude=[*_UNVALIDATED, *errors])
+        except ValidationError as exc:
+            errors.update(exc.message_dict)
+        if errors:
+            raise ValidationError(errors)
+
+
+def _error_text(exc: ValidationError) -> str:
+    if hasattr(exc, 'error_dict'):
+        return "; ".join(f"{field}: {' '.join(messages)}" for field, messages in exc.message_dict.items())
+    return " ".join(exc.messages)
+
+
+def import_merchants(venue, fh, filename: str, *, chunk_size: int = CHUNK_SIZE) -> ImportResult:
+    """Import a CSV or XLSX file of merchants into ``venue``; raises ImportFileError for unreadable files."""
+    return MerchantImporter(venue, chunk_size=chunk_size).run(read_rows(fh, filename))
+
+
+def export_rows(venue):
+    """Yield the header, then one row per merchant, in a form import_merchants() reads back."""
+    yield COLUMNS
+    merchants = (
+        Merchant.objects.filter(floor__venue=venue)
+        .order_by('floor__level_order', 'floor__name', 'name', 'pk')
+        .values_list('pk', 'name', 'floor__name', 'category__name', *COLUMNS[4:])
+    )
+    for values in merchants.iterator(chunk_size=2000):
+        yield [
+            ('yes' if value else 'no') if column in _BOOLEANS else ('' if value is None else value)
+            for column, value in zip(COLUMNS, values)
+        ]
+
+
+class _Echo:
+    """File-like object whose write() hands back the line for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    # The byte order mark makes Excel open the file as UTF-8.
+    yield '\ufeff'
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, fh) -> None:
+    """Write rows to ``fh`` as XLSX; write-only mode keeps them out of memory."""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Merchants')
+    for row in rows:
+        sheet.append(row)
+    workbook.save(fh)
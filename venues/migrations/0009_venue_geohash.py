@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from merchants.utils import geohash_encode
+
+    Venue = apps.get_model('venues', 'Venue')
+    venues = Venue.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    batch = []
+    for venue in venues.iterator(chunk_size=1000):
+        venue.geohash = geohash_encode(venue.latitude, venue.longitude)
+        batch.append(venue)
+        if len(batch) >= 1000:
+            Venue.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Venue.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venues', '0008_add_venue_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venue',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('venues', '0009_venue_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venue',
+            name='cover_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 
+from merchants.utils import geohash_encode
+
 class Plan(models.Model):
     class PlanCode(models.TextChoices):
         STARTER = 'STARTER', 'Starter'
@@ -31,11 +33,14 @@ class Venue(models.Model):
 
     # Visuals for the landing page
     cover_image = models.ImageField(upload_to='venues/', blank=True, null=True)
+    # Resized WebP/AVIF/JPEG copies, filled in by a background job (see venues.images).
+    cover_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     # Location for distance-based search
     latitude = models.FloatField(blank=True, null=True, help_text="Venue latitude for location-based search")
     longitude = models.FloatField(blank=True, null=True, help_text="Venue longitude for location-based search")
     address = models.TextField(blank=True, help_text="Full address of the venue")
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
 
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -43,6 +48,17 @@ class Venue(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Keep the geohash in step with the coordinates it is derived from.
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
 class VenueSubscription(models.Model):
     class Status(models.TextChoices):
         TRIALING = 'TRIALING', 'Trialing'
@@ -89,3 +105,14 @@ class Floor(models.Model):
     def __str__(self):
         return f"{self.venue.name} - {self.name}"
 
+
+
+class StoredFile(models.Model):
+    """An upload stored under its content hash, and how many file fields use it (see venues.storage)."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from django.core.paginator import AsyncPaginator, Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+@dataclass
+class CursorPage:
+    object_list: list
+    next_cursor: Optional[str]
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(published_at: datetime, pk: int) -> str:
+    raw = json.dumps([published_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> Optional[tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        published_at, pk = json.loads(raw)
+        published_at = parse_datetime(published_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if published_at is None:
+        return None
+    return published_at, pk
+
+
+def cursor_paginate(queryset, cursor: str | None, per_page: int, *, id_field: str = "id") -> CursorPage:
+    """
+    Newest-first page of a queryset with ``published_at`` and a unique
+    tie-breaking ``id_field``.
+
+    Seeks past the ``(published_at, id)`` of the last row already shown
+    instead of using OFFSET, and never counts, so every page costs the same.
+    An unreadable cursor starts again from the first page.
+    """
+    queryset = queryset.order_by('-published_at', f'-{id_field}')
+    position = decode_cursor(cursor)
+    if position is not None:
+        published_at, pk = position
+        queryset = queryset.filter(
+            Q(published_at__lt=published_at) | Q(published_at=published_at, **{f"{id_field}__lt": pk})
+        )
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].published_at, getattr(rows[-1], id_field))
+    return CursorPage(object_list=rows, next_cursor=next_cursor)
+
+
+async def aget_page(queryset, per_page: int, number) -> Page:
+    """
+    ``Paginator(queryset, per_page).get_page(number)`` for async views.
+
+    AsyncPaginator fetches the count and the page's rows with the async
+    ORM. The result is a plain Page, so templates read ``has_next`` and
+    ``paginator.num_pages`` as they do in sync views.
+    """
+    page = await AsyncPaginator(queryset, per_page).aget_page(number)
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await page.paginator.acount()
+    return Page(await page.aget_object_list(), page.number, paginator)
@@ -0,0 +1,121 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from jobs.queue import enqueue
+from merchants.models import Merchant, MerchantCategory, ProductImage
+
+from . import tasks
+from .cache import bump_directory_generation
+from .images import RENDITION_WIDTHS, rendition_paths, renditions_are_stale, renditions_attr
+from .models import Floor, Venue
+
+
+# Bumped on commit so a concurrent request cannot cache the pre-commit rows
+# under the new generation.
+def _bump(venue_ids, using):
+    for venue_id in set(venue_ids):
+        transaction.on_commit(partial(bump_directory_generation, venue_id), using=using)
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+def invalidate_venue_directory(sender, instance, using='default', **kwargs):
+    _bump([instance.pk], using)
+
+
+@receiver(post_save, sender=Floor)
+@receiver(post_delete, sender=Floor)
+def invalidate_floor_directory(sender, instance, using='default', **kwargs):
+    _bump([instance.venue_id], using)
+
+
+@receiver(post_save, sender=Merchant)
+@receiver(post_delete, sender=Merchant)
+def invalidate_merchant_directory(sender, instance, using='default', origin=None, **kwargs):
+    if isinstance(origin, (Floor, Venue)):
+        # Cascade from a floor or venue delete, which bumps the venue itself.
+        return
+    _bump([instance.floor.venue_id], using)
+
+
+@receiver(post_save, sender=MerchantCategory)
+@receiver(pre_delete, sender=MerchantCategory)
+def invalidate_category_directories(sender, instance, using='default', **kwargs):
+    # pre_delete: once the category is gone its merchants no longer point at it.
+    venue_ids = Floor.objects.using(using).filter(merchants__category=instance).values_list('venue_id', flat=True)
+    _bump(venue_ids, using)
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_save, sender=Merchant)
+@receiver(post_save, sender=ProductImage)
+def queue_image_renditions(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    model = sender._meta.label
+    for field in RENDITION_WIDTHS[model]:
+        if renditions_are_stale(instance, field):
+            enqueue(
+                tasks.generate_renditions, key=f"renditions:{model}:{instance.pk}:{field}",
+                using=using, model=model, pk=instance.pk, field=field,
+            )
+
+
+# Stored files are released on commit, once nothing can roll the change back.
+def _release(storage, names, using):
+    for name in names:
+        if name:
+            transaction.on_commit(partial(storage.delete, name), using=using)
+
+
+@receiver(post_init, sender=Venue)
+@receiver(post_init, sender=Merchant)
+@receiver(post_init, sender=ProductImage)
+def remember_stored_images(sender, instance, **kwargs):
+    # Names as loaded, so a save can release the file it replaced. Uploads
+    # assigned in the constructor are not stored yet and have no name.
+    instance._stored_images = {
+        field: value if isinstance(value := instance.__dict__.get(field), str) else ''
+        for field in RENDITION_WIDTHS[sender._meta.label]
+    }
+
+
+@receiver(pre_save, sender=Venue)
+@receiver(pre_save, sender=Merchant)
+@receiver(pre_save, sender=ProductImage)
+def remember_uploads(sender, instance, **kwargs):
+    # Fields whose file the save is about to store. Storing takes a new
+    # reference even when the content, and so the name, is unchanged.
+    instance._uploaded_images = {
+        field for field in RENDITION_WIDTHS[sender._meta.label] if not getattr(instance, field)._committed
+    }
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_save, sender=Merchant)
+@receiver(post_save, sender=ProductImage)
+def release_replaced_images(sender, instance, raw=False, using='default', update_fields=None, **kwargs):
+    stored = instance._stored_images
+    uploaded = instance.__dict__.pop('_uploaded_images', set())
+    for field in RENDITION_WIDTHS[sender._meta.label]:
+        if update_fields is not None and field not in update_fields:
+            continue
+        fieldfile = getattr(instance, field)
+        replaced = field in uploaded or stored[field] != (fieldfile.name or '')
+        # Fixture loading restores rows as they were; it holds no references.
+        if stored[field] and replaced and not raw:
+            _release(fieldfile.storage, [stored[field]], using)
+        stored[field] = fieldfile.name or ''
+
+
+@receiver(post_delete, sender=Venue)
+@receiver(post_delete, sender=Merchant)
+@receiver(post_delete, sender=ProductImage)
+def release_deleted_images(sender, instance, using='default', **kwargs):
+    for field in RENDITION_WIDTHS[sender._meta.label]:
+        fieldfile = getattr(instance, field)
+        if fieldfile:
+            _release(fieldfile.storage, [fieldfile.name, *rendition_paths(getattr(instance, renditions_attr(field)))], using)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.db import transaction
+from django.db.models import F
+
+
+BLOB_PREFIX = 'blobs'
+
+# Blob URLs change whenever their content does, so they can be cached forever.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_BLOB_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def is_blob(name: str) -> bool:
+    return name.startswith(f'{BLOB_PREFIX}/') and bool(_BLOB_RE.match(posixpath.basename(name)))
+
+
+def is_immutable(name: str) -> bool:
+    """True for blobs and the renditions stored next to them."""
+    return name.startswith(f'{BLOB_PREFIX}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each upload once, as ``blobs/ab/cd/<sha256><ext>``, whatever its
+    ``upload_to`` or file name, and counts the fields using it in
+    StoredFile. ``delete()`` releases one reference and only removes the
+    file, along with the renditions saved next to it, when none are left.
+
+    Every reference must come from ``save()`` and be released by exactly one
+    ``delete()`` (venues.signals does this for image fields); copying a
+    stored name onto another field without saving bypasses the count.
+    Files uploaded before this storage keep their names and are deleted
+    outright.
+    """
+
+    def save(self, name, content, max_length=None):
+        validate_file_name(name, allow_relative_path=True)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        if is_immutable(name):
+            # A rendition of a blob: it belongs to the blob, so overwrite in place.
+            super().delete(name)
+            return super().save(name, content, max_length)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        blob = f'{BLOB_PREFIX}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{ext}'
+
+        from .models import StoredFile
+
+        with transaction.atomic():
+            stored, _ = StoredFile.objects.select_for_update().get_or_create(name=blob, defaults={'size': content.size})
+            if not self.exists(blob):
+                self._save(blob, content)
+            StoredFile.objects.filter(pk=stored.pk).update(refcount=F('refcount') + 1)
+        return blob
+
+    def delete(self, name):
+        if not is_blob(name):
+            if not is_immutable(name):
+                super().delete(name)
+            # Renditions go when their blob does.
+            return
+
+        from .models import StoredFile
+
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is not None and stored.refcount > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(refcount=F('refcount') - 1)
+                return
+            if stored is not None:
+                stored.delete()
+            directory, filename = posixpath.split(name)
+            stem = os.path.splitext(filename)[0]
+            if self.exists(directory):
+                for sibling in self.listdir(directory)[1]:
+                    if sibling.startswith(f'{stem}.') and sibling != filename:
+                        super().delete(posixpath.join(directory, sibling))
+            super().delete(name)
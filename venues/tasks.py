@@ -0,0 +1,36 @@
+from django.apps import apps
+from django.db.models import Q
+
+from jobs.queue import task
+
+from .cache import bump_directory_generation
+from .images import RENDITION_WIDTHS, build_renditions, rendition_paths, renditions_attr
+
+
+@task('venues.generate_renditions', max_attempts=3)
+def generate_renditions(model, pk, field):
+    """(Re)build the resized copies of one image field, or remove them if the image was cleared."""
+    Model = apps.get_model(model)
+    instance = Model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    fieldfile = getattr(instance, field)
+    attr = renditions_attr(field)
+    old = getattr(instance, attr) or {}
+
+    manifest = build_renditions(fieldfile, RENDITION_WIDTHS[model][field]) if fieldfile else {}
+    # Only store them if the image was not replaced again meanwhile; a newer job handles that one.
+    current = Q(**{field: fieldfile.name}) if fieldfile else Q(**{field: ''}) | Q(**{f'{field}__isnull': True})
+    storage = fieldfile.storage
+    if not Model.objects.filter(current, pk=pk).update(**{attr: manifest}):
+        for path in rendition_paths(manifest):
+            storage.delete(path)
+        return
+    for path in rendition_paths(old) - rendition_paths(manifest):
+        storage.delete(path)
+
+    # Saved with update(), so no signal refreshes cached directory pages.
+    if model == 'venues.Venue':
+        bump_directory_generation(instance.pk)
+    elif model == 'merchants.Merchant':
+        bump_directory_generation(instance.floor.venue_id)
@@ -0,0 +1,44 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from venues.images import MIME_TYPES, renditions_are_stale, renditions_attr
+
+
+register = template.Library()
+
+
+def _srcset(storage, entries):
+    return ", ".join(f"{storage.url(path)} {width}w" for width, path in entries)
+
+
+@register.simple_tag
+def picture(fieldfile, sizes='100vw', loading='lazy', **attrs):
+    """
+    ``<picture>`` for an image field with AVIF/WebP sources and a resized
+    fallback, e.g. ``{% picture merchant.logo sizes="64px" alt=merchant.name class="..." %}``.
+    Until its renditions are generated the original is shown as a plain ``<img>``.
+    Pass ``loading="eager"`` for images at the top of the page.
+    """
+    if not fieldfile:
+        return ''
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    instance, name = fieldfile.instance, fieldfile.field.name
+    if renditions_are_stale(instance, name):
+        return format_html(
+            '<img src="{}" loading="{}" decoding="async"{}>', fieldfile.url, loading, extra,
+        )
+
+    manifest = getattr(instance, renditions_attr(name))
+    storage = fieldfile.storage
+    formats = list(manifest['sources'])
+    fallback = manifest['sources'][formats[-1]]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[fmt], _srcset(storage, manifest['sources'][fmt]), sizes) for fmt in formats[:-1]),
+    )
+    return format_html(
+        '<picture class="contents">{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'loading="{}" decoding="async"{}></picture>',
+        sources, storage.url(fallback[-1][1]), _srcset(storage, fallback), sizes,
+        manifest['width'], manifest['height'], loading, extra,
+    )
@@ -0,0 +1,16 @@
+"""Fixtures shared by the tests of every app."""
+from django.contrib.auth import get_user_model
+
+from .models import Floor, Venue
+
+
+def create_venue(owner=None, *, name="Mall", slug="mall", **fields):
+    """A venue, owned by a new user called ``owner`` unless ``owner`` is given."""
+    if owner is None:
+        owner = get_user_model().objects.create_user('owner', password='pw')
+    return Venue.objects.create(owner=owner, name=name, slug=slug, **fields)
+
+
+def create_floor(venue=None, *, name="G", **fields):
+    """A floor of ``venue``, or of a new venue from ``create_venue()``."""
+    return Floor.objects.create(venue=venue or create_venue(), name=name, **fields)
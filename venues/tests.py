@@ -1,3 +1,888 @@
-from django.test import TestCase
+import json
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from math import cos, radians
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import UserProfile
+from config.instrumentation import PerformanceMiddleware
+from config.metrics import registry as metrics_registry
+from jobs.queue import run_pending
+from merchants import utils as geo
+from merchants.availability import stale_products
+from merchants.models import (
+    Merchant,
+    MerchantCategory,
+    MerchantFollow,
+    MerchantMembership,
+    MerchantUpdate,
+    Product,
+    ProductCategory,
+    ProductVariant,
+)
+from merchants.search import refresh_product_search, search_merchants
+from venues import dataset, merchant_io
+from venues.cache import directory_cache_stats
+from venues.facets import DirectoryFilters, directory_facets
+from venues.images import modern_formats, rendition_paths
+from venues.media import RangeNotSatisfiable, parse_range
+from venues.models import Floor, StoredFile, Venue
+from venues.pagination import cursor_paginate, encode_cursor
+from venues.storage import IMMUTABLE_CACHE_CONTROL
+from venues.testing import create_floor, create_venue
+from venues.utils import ALL_DAYS, filter_open_now, parse_operating_hours
+
+
+class VenueRadiusTests(TestCase):
+    origins = [(3.139, 101.6869, 30), (10.0, 179.9, 150), (-16.5, -179.95, 80), (89.5, 20.0, 40), (51.5, 0.0, 400)]
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = get_user_model().objects.create_user('owner', password='pw')
+        rng = random.Random(3)
+        for n, (lat, lon, radius) in enumerate(cls.origins):
+            for i in range(40):
+                # Up to twice the radius away, so about a quarter are in range.
+                p_lat = max(-90.0, min(90.0, lat + rng.uniform(-2, 2) * radius / 111))
+                p_lon = (lon + rng.uniform(-2, 2) * radius / 111 / max(cos(radians(lat)), 0.05) + 180) % 360 - 180
+                create_venue(owner, name=f"V{n}-{i}", slug=f"v{n}-{i}", latitude=p_lat, longitude=p_lon)
+        create_venue(owner, name="Unmapped", slug="unmapped")
+
+    def test_radius_results_match_a_brute_force_scan(self):
+        venues = list(Venue.objects.exclude(latitude=None))
+        for lat, lon, radius in self.origins:
+            with self.subTest(lat=lat, lon=lon):
+                expected = sorted(
+                    (geo.haversine_km(lat, lon, venue.latitude, venue.longitude), venue.name) for venue in venues
+                )
+                expected = [name for distance, name in expected if distance <= radius]
+                self.assertTrue(0 < len(expected) < 24)
+                response = self.client.get(reverse('venue_list'), {'lat': lat, 'lon': lon, 'radius': radius})
+                self.assertEqual([venue.name for venue in response.context['venues']], expected + ["Unmapped"])
+
+
+class OpeningHoursTests(TestCase):
+    hours = [
+        "10:00 AM - 10:00 PM",
+        "8:00 PM - 2:00 AM",
+        "Mon-Fri 09:00 - 18:00",
+        "Fri-Sun 6:00 PM - 1:00 AM",
+        "10:00 AM - 10:00 PM, closed Tuesday",
+        "Ask the counter",
+    ]
+
+    def test_parse_days(self):
+        self.assertEqual(parse_operating_hours("10:00 AM - 10:00 PM").days, ALL_DAYS)
+        self.assertEqual(parse_operating_hours("Mon-Fri 09:00 - 18:00").days, 0b0011111)
+        self.assertEqual(parse_operating_hours("Fri-Mon 09:00 - 18:00").days, 0b1110001)
+        self.assertEqual(parse_operating_hours("10:00 AM - 10:00 PM, closed Tuesday").days, ALL_DAYS & ~0b10)
+        self.assertTrue(parse_operating_hours("8:00 PM - 2:00 AM").is_overnight)
+        self.assertIsNone(parse_operating_hours("Ask the counter"))
+
+    def test_sql_filter_matches_python(self):
+        floor = create_floor()
+        for hours in self.hours:
+            Merchant.objects.create(floor=floor, name=hours, operating_hours=hours)
+        merchants = list(Merchant.objects.all())
+
+        # Every 30 minutes across a week starting on Monday 2024-01-01.
+        start = timezone.make_aware(datetime(2024, 1, 1))
+        for step in range(7 * 48):
+            now = start + timedelta(minutes=30 * step)
+            with self.subTest(now=now):
+                expected = {m.pk for m in merchants if m.is_open_now(now)}
+                self.assertEqual(set(filter_open_now(Merchant.objects.all(), now=now).values_list('pk', flat=True)), expected)
+
+
+class DirectoryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venue = create_venue()
+        cls.floor = Floor.objects.create(venue=cls.venue, name="Ground")
+        cls.category = MerchantCategory.objects.create(name="Food", slug="food")
+        cls.merchant = Merchant.objects.create(floor=cls.floor, category=cls.category, name="Kopi Corner")
+        cls.url = reverse('venue_directory', args=[cls.venue.slug])
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_anonymous_pages_are_cached_until_a_change(self):
+        self.assertContains(self.get(), "Kopi Corner")
+        with self.assertNumQueries(1):
+            self.get()
+        self.assertEqual(directory_cache_stats()['hits'], 3)
+
+        changes = {
+            'merchant': lambda: Merchant.objects.get(pk=self.merchant.pk).save(),
+            'floor': lambda: Floor.objects.get(pk=self.floor.pk).save(),
+            'category': lambda: MerchantCategory.objects.get(pk=self.category.pk).save(),
+            'venue': lambda: Venue.objects.get(pk=self.venue.pk).save(),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                with self.assertNumQueries(6):
+                    self.get()
+
+    def test_changes_show_up(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.name = "Kedai Kopi"
+            self.merchant.save()
+        self.assertContains(self.get(), "Kedai Kopi")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Merchant.objects.create(floor=self.floor, name="Batik House")
+        self.assertContains(self.get(), "Batik House")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertNotContains(self.get(), "?category=food")
+
+    def test_cache_is_keyed_by_request(self):
+        Merchant.objects.create(floor=self.floor, name="Batik House")
+        self.assertContains(self.get(), "Batik House")
+        self.assertNotContains(self.get(q="kopi"), "Batik House")
+        self.assertNotContains(self.get(category="food"), "Batik House")
+
+    def test_logged_in_users_bypass_the_list_cache(self):
+        self.client.force_login(get_user_model().objects.create_user('shopper', password='pw'))
+        self.get()
+        self.get()
+        # Only the shared category list is cached for signed-in users.
+        self.assertEqual(directory_cache_stats(), {'hits': 1, 'misses': 1})
+
+
+class DirectoryFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.venue = create_venue()
+        cls.ground = Floor.objects.create(venue=cls.venue, name="Ground", level_order=0)
+        cls.upper = Floor.objects.create(venue=cls.venue, name="Upper", level_order=1)
+        for floor, name, halal, ewallet, hours in [
+            (cls.ground, "Kopi Corner", True, True, "12:00 AM - 11:59 PM"),
+            (cls.ground, "Kopi Kedai", False, True, ""),
+            (cls.upper, "Kopi Lounge", True, False, "12:00 AM - 11:59 PM"),
+            (cls.upper, "Batik House", True, True, ""),
+        ]:
+            Merchant.objects.create(
+                floor=floor, name=name, is_halal=halal, accepts_ewallet=ewallet, operating_hours=hours,
+                search_document=name,
+            )
+        cls.url = reverse('venue_directory', args=[cls.venue.slug])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_apply_every_other_filter(self):
+        facets = self.client.get(self.url, {'halal': '1'}).context['facets']
+        self.assertEqual((facets['total'], facets['halal'], facets['ewallet'], facets['open']), (3, 3, 2, 2))
+        self.assertEqual([(f['name'], f['count']) for f in facets['floors']], [("Ground", 1), ("Upper", 2)])
+        self.assertEqual(facets['halal_url'], "?")
+        self.assertEqual(facets['floors'][1]['url'], f"?floor={self.upper.pk}&halal=1")
+
+        with self.assertNumQueries(1):
+            facets = directory_facets(
+                Merchant.objects.filter(floor__venue=self.venue), DirectoryFilters(floor=self.upper.pk, ewallet=True)
+            )
+        # The floor count ignores the floor selection; the flags stay on the selected floor.
+        self.assertEqual([f['count'] for f in facets['floors']], [2, 1])
+        self.assertEqual((facets['total'], facets['halal'], facets['ewallet'], facets['open']), (1, 1, 1, 0))
+
+    def test_htmx_search_refreshes_the_counts_out_of_band(self):
+        response = self.client.get(self.url, {'q': 'kopi', 'ewallet': '1'}, headers={'HX-Request': 'true'})
+        self.assertContains(response, "Kopi Kedai")
+        self.assertNotContains(response, "Kopi Lounge")
+        self.assertContains(response, 'id="directory-facets" class="flex flex-wrap items-center gap-2" hx-swap-oob="true"')
+        self.assertContains(response, '<input type="hidden" name="ewallet" value="1">')
+        self.assertContains(response, "2 shops")
+
+        response = self.client.get(self.url, {'q': 'kopi', 'page': '2'}, headers={'HX-Request': 'true'})
+        self.assertNotContains(response, "directory-facets")
+
+    async def test_htmx_searches_under_asgi(self):
+        response = await self.async_client.get(self.url, {'q': 'kopi', 'halal': '1'}, headers={'HX-Request': 'true'})
+        self.assertContains(response, "Kopi Lounge")
+        self.assertNotContains(response, "Kopi Kedai")
+        self.assertContains(response, "2 shops")
+
+        response = await self.async_client.get(
+            reverse('venue_item_search', args=[self.venue.slug]), {'q': 'kopi', 'page': '9'}, headers={'HX-Request': 'true'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        floor = create_floor()
+        cls.merchant = Merchant.objects.create(floor=floor, name="Kopi Corner")
+        updates = MerchantUpdate.objects.bulk_create([MerchantUpdate(merchant=cls.merchant, title=f"News {i}") for i in range(45)])
+        # Several updates share a timestamp, so the id must break ties.
+        start = timezone.make_aware(datetime(2024, 1, 1))
+        for i, update in enumerate(updates):
+            update.published_at = start + timedelta(minutes=i // 4)
+        MerchantUpdate.objects.bulk_update(updates, ['published_at'])
+
+    def test_pages_cover_every_update_once_in_order(self):
+        seen = []
+        cursor = None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                page = cursor_paginate(MerchantUpdate.objects.all(), cursor, 20)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn("COUNT(", queries[0]['sql'])
+            seen.extend(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        expected = list(MerchantUpdate.objects.order_by('-published_at', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_bad_cursor_starts_over(self):
+        first = cursor_paginate(MerchantUpdate.objects.all(), None, 20)
+        for cursor in ("nonsense", "e30", encode_cursor(timezone.now(), 1)[:-3]):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(list(cursor_paginate(MerchantUpdate.objects.all(), cursor, 20)), list(first))
+
+    def test_htmx_load_more(self):
+        url = reverse('merchant_updates', args=["mall", self.merchant.pk])
+        page = self.client.get(url)
+        cursor = page.context['updates'].next_cursor
+        more = self.client.get(url, {'cursor': cursor}, headers={'HX-Request': 'true'})
+        self.assertTemplateUsed(more, 'venues/partials/merchant_updates.html')
+        self.assertTemplateNotUsed(more, 'venues/base.html')
+        self.assertEqual(len(more.context['updates']), 20)
+
+
+def _image_upload(name, size, mode='RGB', fmt='JPEG', **save_options):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, fmt, **save_options)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.storage = default_storage
+
+        floor = create_floor()
+        self.exif = exif = Image.Exif()
+        exif[0x010F] = "Camera Maker"
+        self.merchant = Merchant.objects.create(
+            floor=floor, name="Kopi Corner",
+            logo=_image_upload('logo.png', (400, 400), 'RGBA', 'PNG'),
+            storefront_image=_image_upload('front.jpg', (2000, 1000), exif=exif),
+        )
+
+    def render(self, fieldfile):
+        return Template('{% load responsive_images %}{% picture image sizes="100vw" alt="Shop" class="w-full" %}').render(
+            Context({'image': fieldfile})
+        )
+
+    def test_renditions_are_generated_in_the_background(self):
+        self.assertIn('<img src="/media/blobs/', self.render(self.merchant.storefront_image))
+        run_pending()
+        self.merchant.refresh_from_db()
+
+        logo = self.merchant.logo_renditions['sources']
+        front = self.merchant.storefront_image_renditions['sources']
+        self.assertEqual(list(logo), modern_formats() + ['png'])
+        self.assertEqual(list(front), modern_formats() + ['jpeg'])
+        self.assertEqual([width for width, _ in logo['png']], [64, 128, 192])
+        self.assertEqual([width for width, _ in front['jpeg']], [480, 960, 1440])
+        for _, path in front['jpeg']:
+            with self.storage.open(path) as fh:
+                self.assertEqual(dict(Image.open(fh).getexif()), {})
+
+        html = self.render(self.merchant.storefront_image)
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('.480w.jpg 480w', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('alt="Shop" class="w-full"', html)
+
+    def test_small_images_are_not_upscaled_and_replacements_clean_up(self):
+        run_pending()
+        self.merchant.refresh_from_db()
+        old = rendition_paths(self.merchant.storefront_image_renditions)
+
+        old_name = self.merchant.storefront_image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.storefront_image = _image_upload('small.jpg', (300, 200))
+            self.merchant.save()
+        run_pending()
+        self.merchant.refresh_from_db()
+
+        self.assertEqual([width for width, _ in self.merchant.storefront_image_renditions['sources']['jpeg']], [300])
+        self.assertFalse(self.storage.exists(old_name))
+        self.assertFalse(any(self.storage.exists(path) for path in old))
+
+    def test_identical_uploads_are_stored_once(self):
+        run_pending()
+        self.merchant.refresh_from_db()
+        name = self.merchant.storefront_image.name
+        paths = rendition_paths(self.merchant.storefront_image_renditions)
+
+        copy = Merchant.objects.create(
+            floor=self.merchant.floor, name="Kopi Corner 2",
+            storefront_image=_image_upload('copy.jpg', (2000, 1000), exif=self.exif),
+        )
+        self.assertEqual(copy.storefront_image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 2)
+
+        response = self.client.get(f"/media/{name}")
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        response.close()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.delete()
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(any(self.storage.exists(path) for path in paths))
+
+
+    def test_reuploading_the_same_image_keeps_one_reference(self):
+        name = self.merchant.storefront_image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.storefront_image = _image_upload('again.jpg', (2000, 1000), exif=self.exif)
+            self.merchant.save()
+        self.assertEqual(self.merchant.storefront_image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.data = bytes(range(256)) * 40
+        self.blob = default_storage.save('products/menu.pdf', ContentFile(self.data))
+        self.url = f"/media/{self.blob}"
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_full_response_and_revalidation(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        for headers in ({'If-None-Match': response['ETag']}, {'If-Modified-Since': response['Last-Modified']}):
+            cached, body = self.get(**headers)
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(body, b'')
+            self.assertEqual(cached['ETag'], response['ETag'])
+            self.assertEqual(cached['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+        changed, _ = self.get(**{'If-None-Match': '"something-else"'})
+        self.assertEqual(changed.status_code, 200)
+
+    def test_byte_ranges(self):
+        size = len(self.data)
+        for header, start, end in (('bytes=0-99', 0, 99), ('bytes=5000-', 5000, size - 1),
+                                   ('bytes=-10', size - 10, size - 1), ('bytes=10000-20000', 10000, size - 1)):
+            response, body = self.get(Range=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(body, self.data[start:end + 1], header)
+            self.assertEqual(response['Content-Range'], f"bytes {start}-{end}/{size}")
+            self.assertEqual(int(response['Content-Length']), end - start + 1)
+
+        response, _ = self.get(Range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{size}")
+
+        # Ranges for a different version of the file, and multi-part ranges, get the whole file.
+        for headers in ({'Range': 'bytes=0-9', 'If-Range': '"stale"'}, {'Range': 'bytes=0-9,20-29'}):
+            response, body = self.get(**headers)
+            self.assertEqual((response.status_code, body), (200, self.data))
+
+        self.assertIsNone(parse_range('bytes=9-3', size))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range('bytes=-0', size)
+
+    def test_legacy_uploads_offload_and_missing_files(self):
+        with open(f"{settings.MEDIA_ROOT}/old.jpg", 'wb') as fh:
+            fh.write(b'jpeg')
+        response, body = self.get('/media/old.jpg')
+        self.assertEqual(body, b'jpeg')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+
+        with override_settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            response, body = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], f"/protected-media/{self.blob}")
+        self.assertEqual(body, b'')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+        self.assertEqual(self.get('/media/missing.jpg')[0].status_code, 404)
+        self.assertEqual(self.get('/media/../settings.py')[0].status_code, 404)
+        self.assertEqual(self.get('/media/blobs')[0].status_code, 404)
+
+
+class MerchantImportTests(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user('owner', password='pw')
+        self.owner.userprofile.role = UserProfile.Role.VENUE
+        self.owner.userprofile.save()
+        self.venue = create_venue(self.owner)
+        self.ground = Floor.objects.create(venue=self.venue, name="Ground", level_order=0)
+        Floor.objects.create(venue=self.venue, name="Level 1", level_order=1)
+        self.food = MerchantCategory.objects.create(name="Food & Drink", slug="food")
+        self.client.force_login(self.owner)
+
+    def upload(self, content, name='merchants.csv'):
+        return self.client.post(
+            reverse('merchant_import', args=[self.venue.pk]),
+            {'file': SimpleUploadedFile(name, content.encode() if isinstance(content, str) else content)},
+        )
+
+    def export(self, fmt='csv'):
+        response = self.client.get(reverse('merchant_export', args=[self.venue.pk]), {'format': fmt})
+        body = b''.join(response.streaming_content)
+        response.close()
+        return body
+
+    def test_import_reports_bad_rows_and_saves_the_rest(self):
+        response = self.upload(
+            "Name,Floor,Category,Lot Number,Operating Hours,Website,Is Halal\n"
+            "Kopi Corner,ground,food,G-01,10:00 AM - 10:00 PM,https://kopi.example.com,yes\n"
+            "Nasi Lemak,Level 1,Food & Drink,L1-02,,,no\n"
+            "Ghost Shop,Level 9,,G-03,,,\n"
+            "Bad Link,Ground,,G-04,,not a url,maybe\n"
+            "Kopi Again,Ground,,g-01,,,\n"
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.context['result']
+        self.assertEqual((result.created, result.updated, result.failed), (2, 0, 3))
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6])
+        self.assertIn('Level 9', result.errors[0][1])
+        self.assertIn('website', result.errors[1][1])
+        self.assertIn('is_halal', result.errors[1][1])
+        self.assertIn('more than once', result.errors[2][1])
+
+        kopi = Merchant.objects.get(lot_number='G-01')
+        self.assertEqual((kopi.floor, kopi.category, kopi.is_halal), (self.ground, self.food, True))
+        self.assertEqual(kopi.opens_minute, 600)
+        self.assertIn('Food & Drink', kopi.search_document)
+        self.assertEqual([m.name for m in search_merchants(Merchant.objects.all(), 'nasi')], ['Nasi Lemak'])
+
+        # Matching by lot number updates in place; the other row is left alone.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload("name,lot_number\nKopi Corner Cafe,G-01\nNasi Lemak,L1-02\n")
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "venues_merchant"')]
+        self.assertEqual(len(updates), 1)
+        self.assertRedirects(response, reverse('venue_merchants', args=[self.venue.pk]))
+        kopi.refresh_from_db()
+        self.assertEqual((kopi.name, kopi.opens_minute, kopi.floor), ("Kopi Corner Cafe", 600, self.ground))
+        self.assertEqual(Merchant.objects.count(), 2)
+
+    def test_export_round_trips(self):
+        self.upload(
+            "name,floor,category,lot_number,operating_hours,latitude,longitude\n"
+            + "".join(f"Shop {i},Ground,food,G-{i},9:00 AM - 9:00 PM,3.1,101.6\n" for i in range(30))
+        )
+        exported = self.export().decode('utf-8-sig')
+        header, first = exported.splitlines()[:2]
+        self.assertTrue(header.startswith('id,name,floor,category,lot_number'))
+        self.assertIn(',Shop 0,Ground,Food & Drink,G-0,', first)
+
+        self.upload(exported.replace('Shop 7,', 'Shop Seven,')).wsgi_request
+        self.assertEqual(Merchant.objects.filter(name='Shop Seven').count(), 1)
+        self.assertEqual(Merchant.objects.count(), 30)
+
+        other = get_user_model().objects.create_user('other', password='pw')
+        other.userprofile.role = UserProfile.Role.VENUE
+        other.userprofile.save()
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('merchant_export', args=[self.venue.pk])).status_code, 403)
+
+    def test_reimport_reads_do_not_grow_with_rows(self):
+        self.upload("name,floor,category,lot_number\n" + "".join(f"Shop {i},Ground,food,G-{i}\n" for i in range(30)))
+
+        def rename(rows):
+            with CaptureQueriesContext(connection) as queries:
+                self.upload("name,lot_number\n" + "".join(f"Store {i},G-{i}\n" for i in range(rows)))
+            return [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+
+        # Rebuilding the search documents reads each merchant's category.
+        self.assertEqual(len(rename(3)), len(rename(30)))
+        self.assertIn('Store 29\nG-29\nFood & Drink', Merchant.objects.get(lot_number='G-29').search_document)
+
+        # A column the search document is not built from leaves it alone.
+        with CaptureQueriesContext(connection) as queries:
+            self.upload("name,lot_number,is_halal\nStore 1,G-1,yes\n")
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "venues_merchant"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('search_document', updates[0])
+
+    @unittest.skipIf(merchant_io.openpyxl is None, "openpyxl is not installed")
+    def test_xlsx_round_trip(self):
+        self.upload("name,floor,lot_number,is_featured\nKopi,Ground,G-1,yes\n")
+        workbook = self.export('xlsx')
+        Merchant.objects.update(name="Renamed", is_featured=False)
+
+        response = self.upload(workbook, 'merchants.xlsx')
+        self.assertRedirects(response, reverse('venue_merchants', args=[self.venue.pk]))
+        self.assertEqual(list(Merchant.objects.values_list('name', 'is_featured')), [("Kopi", True)])
+
+
+@override_settings(PERF_INSTRUMENTATION=True, PERF_SAMPLE_RATE=1.0)
+class PerformanceMiddlewareTests(TestCase):
+    def test_requests_are_timed_and_logged_by_url_name(self):
+        venue = create_venue()
+        Merchant.objects.create(floor=create_floor(venue), name="Kopi Corner")
+        with self.assertLogs('config.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('venue_directory', args=[venue.slug]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, open_now;dur=[\d.]+$')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['url_name'], entry['status'], entry['bytes']), ('venue_directory', 200, len(response.content)))
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+
+    @override_settings(PERF_DUPLICATE_QUERY_WARNING=2)
+    def test_duplicate_queries_are_reported(self):
+        def view(request):
+            for _ in range(3):
+                list(Venue.objects.filter(slug='mall'))
+            list(Venue.objects.filter(slug='other'))
+            return HttpResponse("ok")
+
+        with self.assertLogs('config.instrumentation', 'WARNING') as logs:
+            PerformanceMiddleware(view)(RequestFactory().get('/'))
+        entry = logs.records[0].perf
+        self.assertEqual((entry['queries'], entry['duplicate_queries']), (4, 2))
+        self.assertTrue(entry['duplicated_sql'].startswith('SELECT "venues_venue"."id"'))
+
+    async def test_async_views_are_measured(self):
+        async def view(request):
+            await Venue.objects.filter(slug='mall').acount()
+            return HttpResponse("ok")
+
+        # The queries run on the database thread, not where the middleware runs.
+        with self.assertLogs('config.instrumentation', 'INFO') as logs:
+            response = await PerformanceMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(logs.records[0].perf['queries'], 1)
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_unsampled_and_disabled(self):
+        with override_settings(PERF_SAMPLE_RATE=0.0), self.assertNoLogs('config.instrumentation'):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('pricing')))
+        with override_settings(PERF_INSTRUMENTATION=False), self.assertRaises(MiddlewareNotUsed):
+            PerformanceMiddleware(lambda request: HttpResponse())
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='scrape-me', METRICS_DIR='')
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+        cache.clear()
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_counted_by_url_name_and_htmx(self):
+        venue = create_venue()
+        Merchant.objects.create(floor=create_floor(venue), name="Kopi Corner")
+        url = reverse('venue_directory', args=[venue.slug])
+        self.client.get(url)
+        self.client.get(url, HTTP_HX_REQUEST='true')
+        self.client.get('/no-such-venue/')  # Resolves to venue_directory, then 404s.
+
+        text = self.scrape()
+        self.assertIn('# TYPE dekat_http_request_duration_seconds histogram', text)
+        self.assertIn('dekat_http_request_duration_seconds_count{htmx="false",view="venue_directory"} 2', text)
+        self.assertIn('dekat_http_request_duration_seconds_bucket{htmx="true",view="venue_directory",le="+Inf"} 1', text)
+        self.assertIn('dekat_http_responses_total{htmx="false",status="4xx",view="venue_directory"} 1', text)
+        self.assertRegex(text, r'dekat_db_queries_total\{htmx="false",view="venue_directory"\} [1-9]')
+        self.assertRegex(text, r'dekat_directory_cache_requests_total\{result="miss"\} [1-9]')
+        self.assertNotIn('view="metrics"', text)
+
+    def test_worker_files_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(f'{directory}/99999-other.json', 'w') as fh:
+                json.dump([['dekat_http_responses_total', [['htmx', 'false'], ['status', '2xx'], ['view', 'pricing']], 2]], fh)
+            self.client.get(reverse('pricing'))
+            text = self.scrape()
+        self.assertIn('dekat_http_responses_total{htmx="false",status="2xx",view="pricing"} 3', text)
+
+    def test_needs_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(METRICS_TOKEN=''):
+            staff = get_user_model().objects.create_user('staff', password='pw', is_staff=True)
+            self.client.force_login(staff)
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 404)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_dataset_is_deterministic_and_consistent(self):
+        call_command('seed_dataset', scale='tiny', stdout=StringIO())
+        rows = list(ProductVariant.objects.order_by('pk').values_list('product__merchant__name', 'sku', 'price_rm', 'stock_qty'))
+        self.assertEqual(Merchant.objects.count(), 11)
+        self.assertGreater(ProductVariant.objects.count(), Product.objects.count())
+        # The columns the bulk writes fill in match what the signals would have written.
+        self.assertEqual(stale_products(Product.objects.all()), [])
+        product = Product.objects.order_by('pk').first()
+        grams = set(product.search_trigrams.values_list('trigram', flat=True))
+        refresh_product_search([product.pk])
+        self.assertEqual(set(product.search_trigrams.values_list('trigram', flat=True)), grams)
+        self.assertEqual(dataset.Dataset.load().shopper.userprofile.latitude, dataset.HOME[0])
+
+        with self.assertRaises(CommandError):
+            call_command('seed_dataset', scale='tiny', stdout=StringIO())
+        call_command('seed_dataset', scale='tiny', replace=True, stdout=StringIO())
+        self.assertEqual(
+            list(ProductVariant.objects.order_by('pk').values_list('product__merchant__name', 'sku', 'price_rm', 'stock_qty')), rows,
+        )
+
+    def test_seed_dataset_fixture_loads_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fixture = f'{directory}/tiny.jsonl'
+            call_command('seed_dataset', scale='tiny', fixture=fixture, fixture_only=True, stdout=StringIO())
+            self.assertFalse(Venue.objects.exists())
+            call_command('loaddata', fixture, verbosity=0)
+        data = dataset.Dataset.load()
+        self.assertEqual(data.owner.userprofile.role, UserProfile.Role.VENUE)
+        self.assertEqual(Merchant.objects.filter(floor__venue__in=data.venues).count(), 11)
+        self.assertEqual(stale_products(Product.objects.all()), [])
+
+    def test_bench_site_reports_and_compares_with_a_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = f'{directory}/baseline.json'
+            call_command('bench_site', scale='tiny', requests=3, output=baseline, stdout=StringIO())
+            with open(baseline) as fh:
+                report = json.load(fh)
+            self.assertEqual(set(report['scenarios']), {
+                'directory', 'directory_htmx', 'item_search_near', 'feed', 'follow_toggle', 'owner_dashboard', 'owner_merchants',
+            })
+            self.assertEqual(report['scenarios']['owner_dashboard']['requests'], 3)
+            self.assertFalse(Venue.objects.exists())  # Rolled back.
+
+            report['scenarios']['feed']['queries_max'] -= 1
+            with open(baseline, 'w') as fh:
+                json.dump(report, fh)
+            with self.assertRaisesMessage(CommandError, "feed queries"):
+                call_command('bench_site', scale='tiny', requests=3, compare=baseline, tolerance=100, stdout=StringIO())
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Pin the number of SQL queries per view. Each view is requested for
+    venues holding 1, 20 and 100 merchants (and products, updates, follows);
+    the count must be the same for every size, so an N+1 fails here.
+    """
+
+    sizes = (1, 20, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.owner = User.objects.create_user('owner', password='pw')
+        cls.owner.userprofile.role = UserProfile.Role.VENUE
+        cls.owner.userprofile.save()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.category = MerchantCategory.objects.create(name='Food', slug='food')
+        cls.product_category = ProductCategory.objects.create(name='Drinks', slug='drinks')
+
+        cls.fixtures = {}
+        for size in cls.sizes:
+            cls.fixtures[size] = cls._seed(size)
+
+    @classmethod
+    def _seed(cls, size):
+        User = get_user_model()
+        venue = Venue.objects.create(
+            owner=cls.owner, name=f"Mall {size}", slug=f"mall-{size}", latitude=3.14, longitude=101.69
+        )
+        floors = [Floor.objects.create(venue=venue, name=f"Level {i}", level_order=i) for i in range(max(1, size // 10))]
+
+        merchants = []
+        for i in range(size):
+            merchant = Merchant(
+                floor=floors[i % len(floors)],
+                category=cls.category,
+                name=f"Kopi {size}-{i}",
+                lot_number=f"G-{i}",
+                operating_hours="00:00 - 23:59",
+                latitude=3.14,
+                longitude=101.69,
+            )
+            merchant.search_document = merchant.build_search_document()
+            merchant.apply_operating_hours()
+            merchants.append(merchant)
+        merchants = Merchant.objects.bulk_create(merchants)
+
+        products = Product.objects.bulk_create(
+            [Product(merchant=m, name=f"Iced kopi {m.pk}") for m in merchants]
+            + [Product(merchant=merchants[0], name=f"Kopi beans {i}") for i in range(size - 1)]
+        )
+        ProductVariant.objects.bulk_create(
+            [ProductVariant(product=p, name=name, sku=f"SKU-{p.pk}-{name}", price_rm=5, stock_qty=3)
+             for p in products for name in ('S', 'L')]
+        )
+        Product.categories.through.objects.bulk_create(
+            [Product.categories.through(product=p, productcategory=cls.product_category) for p in products]
+        )
+        refresh_product_search([p.pk for p in products])
+        MerchantUpdate.objects.bulk_create([MerchantUpdate(merchant=m, title="Promo") for m in merchants])
+        MerchantUpdate.objects.bulk_create([MerchantUpdate(merchant=merchants[0], title=f"News {i}") for i in range(size - 1)])
+
+        shopper = User.objects.create_user(f"shopper-{size}", password='pw')
+        shopper.userprofile.latitude = 3.14
+        shopper.userprofile.longitude = 101.69
+        shopper.userprofile.save()
+        MerchantFollow.objects.bulk_create([MerchantFollow(user=shopper, merchant=m) for m in merchants])
+
+        merchant_user = User.objects.create_user(f"merchant-{size}", password='pw')
+        merchant_user.userprofile.role = UserProfile.Role.MERCHANT
+        merchant_user.userprofile.save()
+        MerchantMembership.objects.create(user=merchant_user, merchant=merchants[0])
+
+        return {
+            'venue': venue,
+            'floor': floors[0],
+            'merchant': merchants[0],
+            'product': products[0],
+            'shopper': shopper,
+            'merchant_user': merchant_user,
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def assertQueryBudget(self, budget, build_request, user=None, cold_cache=False):
+        for size in self.sizes:
+            with self.subTest(size=size):
+                fixture = self.fixtures[size]
+                if user is not None:
+                    self.client.force_login(fixture[user] if isinstance(user, str) else user)
+                method, url, data, headers = build_request(fixture)
+                send = self.client.post if method == 'post' else self.client.get
+                # Warm per-process caches (content types, FTS availability) first.
+                send(url, data, headers=headers)
+                if cold_cache:
+                    cache.clear()
+                with self.assertNumQueries(budget):
+                    response = send(url, data, headers=headers)
+                self.assertLess(response.status_code, 400)
+                self.client.logout()
+
+    def test_public_pages(self):
+        self.assertQueryBudget(1, lambda f: ('get', reverse('home'), {}, {}))
+        self.assertQueryBudget(0, lambda f: ('get', reverse('pricing'), {}, {}))
+        self.assertQueryBudget(2, lambda f: ('get', reverse('venue_list'), {}, {}))
+        self.assertQueryBudget(
+            2, lambda f: ('get', reverse('venue_list'), {'lat': 3.1, 'lon': 101.6, 'radius': '30'}, {})
+        )
+
+    def test_venue_directory(self):
+        url = lambda f: reverse('venue_directory', args=[f['venue'].slug])
+        requests = [
+            lambda f: ('get', url(f), {}, {}),
+            lambda f: ('get', url(f), {'page': 2}, {'HX-Request': 'true'}),
+            lambda f: ('get', url(f), {'q': 'kopi', 'category': 'food'}, {}),
+            lambda f: ('get', url(f), {'open': '1'}, {}),
+        ]
+        # The first page of each search adds one query for the facet counts.
+        for cold_budget, build_request in zip((6, 4, 6, 6), requests):
+            # Anonymous visitors get the cached list; only the venue lookup runs.
+            self.assertQueryBudget(1, build_request)
+            self.assertQueryBudget(cold_budget, build_request, cold_cache=True)
+        self.assertQueryBudget(8, lambda f: ('get', url(f), {'q': 'kopi'}, {'HX-Request': 'true'}), user='shopper')
+        self.assertQueryBudget(
+            6, lambda f: ('get', url(f), {'q': 'kopi', 'floor': f['floor'].pk, 'halal': '1', 'open': '1'}, {}), user='shopper'
+        )
+
+    def test_merchant_pages(self):
+        args = lambda f: [f['venue'].slug, f['merchant'].pk]
+        self.assertQueryBudget(6, lambda f: ('get', reverse('merchant_detail', args=args(f)), {}, {}), user='shopper')
+        self.assertQueryBudget(7, lambda f: ('get', reverse('merchant_updates', args=args(f)), {}, {}), user='shopper')
+        self.assertQueryBudget(7, lambda f: ('post', reverse('merchant_follow', args=args(f)), {}, {}), user='shopper')
+
+    def test_feed(self):
+        self.assertQueryBudget(4, lambda f: ('get', reverse('user_feed'), {}, {}), user='shopper')
+
+    def test_item_search(self):
+        url = lambda f: reverse('venue_item_search', args=[f['venue'].slug])
+        self.assertQueryBudget(7, lambda f: ('get', url(f), {}, {}))
+        self.assertQueryBudget(6, lambda f: ('get', url(f), {'q': 'kopi', 'category': 'drinks'}, {'HX-Request': 'true'}))
+        self.assertQueryBudget(10, lambda f: ('get', url(f), {'near': '1', 'radius': '15'}, {}), user='shopper')
+        self.assertQueryBudget(
+            5, lambda f: ('get', reverse('product_detail', args=[f['venue'].slug, f['product'].pk]), {}, {})
+        )
+
+    def test_owner_pages(self):
+        venue_url = lambda name, *extra: lambda f: ('get', reverse(name, args=[f['venue'].pk, *extra]), {}, {})
+        self.assertQueryBudget(4, lambda f: ('get', reverse('venue_portal'), {}, {}), user=self.owner)
+        self.assertQueryBudget(8, venue_url('venue_dashboard'), user=self.owner)
+        self.assertQueryBudget(5, venue_url('venue_merchants'), user=self.owner)
+        self.assertQueryBudget(12, venue_url('merchant_add'), user=self.owner)
+        self.assertQueryBudget(
+            13, lambda f: ('get', reverse('merchant_edit', args=[f['venue'].pk, f['merchant'].pk]), {}, {}), user=self.owner
+        )
+        self.assertQueryBudget(
+            5, lambda f: ('get', reverse('floor_edit', args=[f['venue'].pk, f['floor'].pk]), {}, {}), user=self.owner
+        )
+
+    def test_merchant_portal(self):
+        self.assertQueryBudget(7, lambda f: ('get', reverse('merchant_portal'), {}, {}), user='merchant_user')
+
+    @override_settings(STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+    def test_admin_changelists(self):
+        budgets = {
+            'admin:venues_venue_changelist': 6,
+            'admin:merchants_merchant_changelist': 8,
+            'admin:merchants_product_changelist': 8,
+            'admin:merchants_merchantfollow_changelist': 7,
+        }
+        for name, budget in budgets.items():
+            with self.subTest(changelist=name):
+                self.assertQueryBudget(budget, lambda f: ('get', reverse(name), {}, {}), user=self.admin)
@@ -2,22 +2,55 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime, time
+from functools import lru_cache
 import re
 from typing import Optional
 
+from django.db.models import F, Q
+from django.db.models.lookups import GreaterThan
 from django.utils import timezone
 
 
+# Bit 0 is Monday, matching datetime.weekday().
+ALL_DAYS = 0b1111111
+
+
 @dataclass(frozen=True)
 class HoursWindow:
     opens_at: time
     closes_at: time
+    days: int = ALL_DAYS
+
+    @property
+    def opens_minute(self) -> int:
+        return self.opens_at.hour * 60 + self.opens_at.minute
+
+    @property
+    def closes_minute(self) -> int:
+        return self.closes_at.hour * 60 + self.closes_at.minute
+
+    @property
+    def is_overnight(self) -> bool:
+        return self.opens_at > self.closes_at
+
+    def is_open(self, now: datetime) -> bool:
+        return schedule_is_open(self.opens_minute, self.closes_minute, self.is_overnight, self.days, now)
 
 
 _HOURS_RANGE_RE = re.compile(
     r"(?P<start>\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)\s*-\s*(?P<end>\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)"
 )
 
+_DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+_DAYS_RE = re.compile(
+    r"\b(?P<first>mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?"
+    r"(?:\s*(?:-|–|to)\s*(?P<last>mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?)?",
+    re.IGNORECASE,
+)
+
+_CLOSED_RE = re.compile(r"\bclosed\b", re.IGNORECASE)
+
 
 def _parse_time(value: str) -> Optional[time]:
     value = value.strip()
@@ -29,7 +62,25 @@ def _parse_time(value: str) -> Optional[time]:
     return None
 
 
+def _parse_days(value: str) -> int:
+    mask = 0
+    for match in _DAYS_RE.finditer(value):
+        first = _DAY_NAMES.index(match.group("first").lower())
+        last = _DAY_NAMES.index((match.group("last") or match.group("first")).lower())
+        # Ranges may wrap past Sunday, e.g. "Fri-Mon".
+        for offset in range((last - first) % 7 + 1):
+            mask |= 1 << ((first + offset) % 7)
+    return mask
+
+
 def parse_operating_hours(value: str | None) -> Optional[HoursWindow]:
+    """
+    Parse free-text hours such as ``"10:00 AM - 10:00 PM"``,
+    ``"Mon-Fri 9:00 - 18:00"`` or ``"10:00 AM - 10:00 PM, closed Tuesday"``.
+
+    Day names before any "closed" mark the days the window applies to (every
+    day if none are given); day names after it are removed.
+    """
     if not value:
         return None
     match = _HOURS_RANGE_RE.search(value)
@@ -41,20 +92,57 @@ def parse_operating_hours(value: str | None) -> Optional[HoursWindow]:
     if not start or not end:
         return None
 
-    return HoursWindow(opens_at=start, closes_at=end)
+    text = value[:match.start()] + " " + value[match.end():]
+    closed = _CLOSED_RE.search(text)
+    if closed:
+        open_days = _parse_days(text[:closed.start()]) or ALL_DAYS
+        days = open_days & ~_parse_days(text[closed.end():])
+    else:
+        days = _parse_days(text) or ALL_DAYS
+
+    return HoursWindow(opens_at=start, closes_at=end, days=days)
+
+
+@lru_cache(maxsize=1024)
+def parse_operating_hours_cached(value: str | None) -> Optional[HoursWindow]:
+    """Memoized ``parse_operating_hours`` for rows whose schedule columns are not filled in yet."""
+    return parse_operating_hours(value)
+
+
+def schedule_is_open(opens_minute: int, closes_minute: int, is_overnight: bool, days: int, now: datetime) -> bool:
+    minute = now.hour * 60 + now.minute
+    today = 1 << now.weekday()
+    if not is_overnight:
+        return bool(days & today) and opens_minute <= minute <= closes_minute
+
+    # Overnight window (e.g. 8:00 PM - 2:00 AM): the early hours belong to the previous day's opening.
+    yesterday = 1 << ((now.weekday() - 1) % 7)
+    return bool(days & today) and minute >= opens_minute or bool(days & yesterday) and minute <= closes_minute
 
 
 def is_open_now(operating_hours: str | None, *, now: Optional[datetime] = None) -> Optional[bool]:
-    window = parse_operating_hours(operating_hours)
+    window = parse_operating_hours_cached(operating_hours)
     if not window:
         return None
+    return window.is_open(now or timezone.localtime())
 
-    now = now or timezone.localtime()
-    now_t = now.time()
-
-    if window.opens_at <= window.closes_at:
-        return window.opens_at <= now_t <= window.closes_at
-
-    # Overnight window (e.g. 8:00 PM - 2:00 AM)
-    return now_t >= window.opens_at or now_t <= window.closes_at
 
+def open_now_q(*, now: Optional[datetime] = None) -> Q:
+    """
+    Condition matching ``Merchant`` rows open at ``now`` using the
+    precomputed schedule columns. Same rules as ``schedule_is_open``.
+    """
+    now = now or timezone.localtime()
+    minute = now.hour * 60 + now.minute
+    open_today = GreaterThan(F('open_days').bitand(1 << now.weekday()), 0)
+    open_yesterday = GreaterThan(F('open_days').bitand(1 << ((now.weekday() - 1) % 7)), 0)
+    return (
+        Q(open_today, is_overnight=False, opens_minute__lte=minute, closes_minute__gte=minute)
+        | Q(open_today, is_overnight=True, opens_minute__lte=minute)
+        | Q(open_yesterday, is_overnight=True, closes_minute__gte=minute)
+    )
+
+
+def filter_open_now(queryset, *, now: Optional[datetime] = None):
+    """Restrict a ``Merchant`` queryset to merchants open at ``now`` (see ``open_now_q``)."""
+    return queryset.filter(open_now_q(now=now))
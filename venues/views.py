@@ -1,15 +1,30 @@
+import tempfile
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
 from django.core.paginator import Paginator # Import this
-from django.shortcuts import render, get_object_or_404, redirect
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.db.utils import OperationalError
-from django.db.models import Q, Count
+from django.db.models import F, Q, Count
 from django.contrib import messages
+from django.utils import timezone
 from .models import Venue, Floor
-from merchants.models import Merchant, MerchantCategory, MerchantFollow, MerchantUpdate
-from .forms import VenueLeadForm, VenueCreateForm, MerchantForm, FloorForm
-from .utils import is_open_now
+from merchants.models import Merchant, MerchantCategory, MerchantFollow
+from merchants.facets import facet_url
+from merchants.feed import feed_page
+from merchants.search import search_merchants
+from merchants.utils import bounding_box, bounding_box_q, geohash_cover, geohash_q, haversine_expression
+from .forms import VenueLeadForm, VenueCreateForm, MerchantForm, FloorForm, MerchantImportForm
+from .cache import acached_directory_fragment, seconds_until_schedule_change
+from .facets import DirectoryFilters, directory_facets
+from .merchant_io import ImportFileError, export_rows, import_merchants, openpyxl, stream_csv, write_xlsx
+from .pagination import CursorPage, aget_page, cursor_paginate
 from accounts.models import UserProfile
+from config.instrumentation import span
 
 def home(request):
     venues = Venue.objects.filter(is_active=True).order_by('name')
@@ -66,9 +81,14 @@ def faq(request):
 def terms(request):
     return render(request, 'venues/terms.html')
 
-def venue_list(request):
-    import math
+def _parse_coordinate(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
 
+
+def venue_list(request):
     # Get user's location from query params
     user_lat = request.GET.get('lat')
     user_lon = request.GET.get('lon')
@@ -76,53 +96,42 @@ def venue_list(request):
 
     venues = Venue.objects.filter(is_active=True)
 
-    # Helper function to calculate distance using Haversine formula
-    def calculate_distance(lat1, lon1, lat2, lon2):
-        """Calculate distance between two points in kilometers"""
-        if not all([lat1, lon1, lat2, lon2]):
-            return None
-
-        R = 6371  # Earth's radius in kilometers
-
-        lat1_rad = math.radians(float(lat1))
-        lat2_rad = math.radians(float(lat2))
-        delta_lat = math.radians(float(lat2) - float(lat1))
-        delta_lon = math.radians(float(lon2) - float(lon1))
-
-        a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-        return R * c
-
-    # Calculate distances and filter by radius if location provided
-    venues_with_distance = []
-    for venue in venues:
-        if user_lat and user_lon and venue.latitude and venue.longitude:
-            distance = calculate_distance(user_lat, user_lon, venue.latitude, venue.longitude)
-            venue.distance = round(distance, 1) if distance else None
-
-            # Filter by radius (if not "all")
-            if radius != 'all':
-                try:
-                    radius_km = float(radius)
-                    if distance and distance <= radius_km:
-                        venues_with_distance.append(venue)
-                except ValueError:
-                    venues_with_distance.append(venue)
-            else:
-                venues_with_distance.append(venue)
-        else:
-            venue.distance = None
-            venues_with_distance.append(venue)
+    lat = _parse_coordinate(user_lat)
+    lon = _parse_coordinate(user_lon)
+    location_query = ''
+    if lat is not None and lon is not None:
+        location_query = urlencode({'lat': user_lat, 'lon': user_lon, 'radius': radius})
+        venues = venues.annotate(distance=haversine_expression('latitude', 'longitude', lat, lon))
+
+        radius_km = None
+        if radius != 'all':
+            try:
+                radius_km = float(radius)
+            except ValueError:
+                radius_km = None
+
+        if radius_km is not None:
+            # Cheap index-backed prefilter (geohash cells + bounding box) before the exact distance check.
+            box = bounding_box(lat, lon, radius_km)
+            within = (
+                geohash_q('geohash', geohash_cover(*box))
+                & bounding_box_q('latitude', 'longitude', box)
+                & Q(distance__lte=radius_km)
+            )
+            # Venues without coordinates are still listed, after the nearby ones.
+            venues = venues.filter(within | Q(geohash=''))
 
-    # Sort by distance if available, otherwise by name
-    if user_lat and user_lon:
-        venues_with_distance.sort(key=lambda v: (v.distance is None, v.distance if v.distance is not None else float('inf')))
+        venues = venues.order_by(F('distance').asc(nulls_last=True), 'name')
     else:
-        venues_with_distance.sort(key=lambda v: v.name)
+        venues = venues.order_by('name')
+
+    paginator = Paginator(venues, 24)
+    page_obj = paginator.get_page(request.GET.get('page'))
 
     context = {
-        'venues': venues_with_distance,
+        'venues': page_obj,
+        'page_range': paginator.get_elided_page_range(page_obj.number),
+        'location_query': location_query,
         'user_lat': user_lat,
         'user_lon': user_lon,
         'radius': radius,
@@ -141,17 +150,19 @@ def merchant_detail(request, slug, merchant_id):
     return render(
         request,
         'venues/merchant_detail.html',
-        {'venue': venue, 'merchant': merchant, 'is_following': is_following, 'is_open_now': is_open_now(merchant.operating_hours)},
+        {'venue': venue, 'merchant': merchant, 'is_following': is_following, 'is_open_now': merchant.is_open_now()},
     )
 
-def _merchant_ui_context(merchants, user):
-    open_ids = {m.id for m in merchants if is_open_now(m.operating_hours) is True}
+async def _merchant_ui_context(merchants, user):
+    now = timezone.localtime()
+    open_ids = {m.id for m in merchants if m.is_open_now(now) is True}
     followed_ids = set()
     if user.is_authenticated:
         try:
-            followed_ids = set(
+            followed_ids = {
+                merchant_id async for merchant_id in
                 MerchantFollow.objects.filter(user=user, merchant__in=merchants).values_list('merchant_id', flat=True)
-            )
+            }
         except OperationalError:
             followed_ids = set()
     return {'followed_ids': followed_ids, 'open_ids': open_ids}
@@ -159,23 +170,19 @@ def _merchant_ui_context(merchants, user):
 @login_required
 def user_feed(request):
     try:
-        updates = (
-            MerchantUpdate.objects.filter(is_published=True, merchant__followers__user=request.user)
-            .select_related('merchant', 'merchant__floor', 'merchant__floor__venue')
-            .order_by('-published_at')
-        )
+        page = feed_page(request.user, request.GET.get('cursor'), 20)
     except OperationalError:
-        updates = MerchantUpdate.objects.none()
-    paginator = Paginator(updates, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    return render(request, 'venues/feed.html', {'updates': page_obj})
+        page = CursorPage(object_list=[], next_cursor=None)
+    if request.headers.get('HX-Request'):
+        return render(request, 'venues/partials/feed_updates.html', {'updates': page})
+    return render(request, 'venues/feed.html', {'updates': page})
 
 def merchant_updates(request, slug, merchant_id):
     venue = get_object_or_404(Venue, slug=slug)
     merchant = get_object_or_404(Merchant.objects.select_related('floor', 'floor__venue'), pk=merchant_id, floor__venue=venue)
-    updates = merchant.updates.filter(is_published=True)
-    paginator = Paginator(updates, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    page = cursor_paginate(merchant.updates.filter(is_published=True), request.GET.get('cursor'), 20)
+    if request.headers.get('HX-Request'):
+        return render(request, 'venues/partials/merchant_updates.html', {'merchant': merchant, 'updates': page})
     is_following = False
     if request.user.is_authenticated:
         try:
@@ -185,7 +192,7 @@ def merchant_updates(request, slug, merchant_id):
     return render(
         request,
         'venues/merchant_updates.html',
-        {'venue': venue, 'merchant': merchant, 'updates': page_obj, 'is_following': is_following},
+        {'venue': venue, 'merchant': merchant, 'updates': page, 'is_following': is_following},
     )
 
 @login_required
@@ -207,56 +214,122 @@ def toggle_merchant_follow(request, slug, merchant_id):
 
     return render(request, 'venues/partials/follow_button.html', {'venue': venue, 'merchant': merchant, 'is_following': is_following})
 
-def venue_directory(request, slug):
-    venue = get_object_or_404(Venue, slug=slug)
+async def _schedule_boundaries(venue):
+    """Minutes of the day at which any merchant in the venue opens or closes."""
+    windows = Merchant.objects.filter(floor__venue=venue, opens_minute__isnull=False).values_list('opens_minute', 'closes_minute').distinct()
+    # Closing times are inclusive, so the badge flips a minute later.
+    return sorted({minute async for opens, closes in windows for minute in (opens, closes + 1)})
+
+
+def _directory_facet_links(facets, params):
+    def toggled(name, value):
+        return facet_url(params, **{name: None if params.get(name) == value else value})
+
+    for floor in facets['floors']:
+        floor['url'] = toggled('floor', floor['id'])
+    return {
+        **facets,
+        'halal_url': toggled('halal', '1'),
+        'ewallet_url': toggled('ewallet', '1'),
+        'open_url': toggled('open', '1'),
+    }
+
+
+async def venue_directory(request, slug):
+    # Async so that under ASGI (see start.sh) a search-as-you-type request
+    # waiting on the database does not hold a worker thread. The ORM calls
+    # run on the request's database thread; facets and templates, which
+    # query lazily, are handed to it with sync_to_async.
+    venue = await aget_object_or_404(Venue, slug=slug)
+    # Loaded once here; templates read it from request.user.
+    request.user = user = await request.auser()
     query = request.GET.get('q', '')
     category_slug = request.GET.get('category')
-    
-    # 1. Base Query
-    merchant_list = Merchant.objects.filter(floor__venue=venue)
-
-    if query:
-        merchant_list = merchant_list.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(lot_number__icontains=query) |
-            Q(category__name__icontains=query) | 
-            Q(keywords__icontains=query)
+    directory_filters = DirectoryFilters.from_request(request)
+    open_only = directory_filters.open_now
+    page_number = request.GET.get('page')
+    params = {
+        'q': query, 'category': category_slug, 'floor': directory_filters.floor,
+        'halal': '1' if directory_filters.halal else None,
+        'ewallet': '1' if directory_filters.ewallet else None,
+        'open': '1' if open_only else None,
+    }
+    filters = {
+        'search_query': query, 'current_category': category_slug, 'open_only': open_only,
+        'directory_filters': directory_filters,
+        # The floor and flag filters, for search and category links that keep them.
+        'filter_params': urlencode({
+            key: value for key, value in params.items() if key not in ('q', 'category') and value not in (None, '')
+        }),
+    }
+
+    async def render_merchant_list():
+        # 1. Base Query
+        merchant_list = Merchant.objects.filter(floor__venue=venue).select_related('floor__venue')
+
+        if category_slug:
+            merchant_list = merchant_list.filter(category__slug=category_slug)
+
+        if query:
+            # Full-text match, best rank first (featured, then name, break ties)
+            # May look up the FTS table the first time, so not in the event loop.
+            merchant_list = await sync_to_async(search_merchants)(merchant_list, query)
+        else:
+            # Sort: Featured first, then name
+            merchant_list = merchant_list.order_by('-is_featured', 'name')
+
+        # Counted before the floor and flag filters; further pages don't show them.
+        facets = None if page_number else await sync_to_async(directory_facets)(merchant_list, directory_filters)
+        merchant_list = directory_filters.apply(merchant_list)
+
+        # 2. PAGINATION LOGIC (Show 20 per page)
+        page_obj = await aget_page(merchant_list, 20, page_number)
+        with span('open_now'):
+            ui_context = await _merchant_ui_context(page_obj.object_list, user)
+        html = await sync_to_async(render_to_string)(
+            'venues/partials/merchant_list.html', {'merchants': page_obj, **filters, **ui_context}, request=request
         )
+        return {'html': html, 'has_merchants': bool(page_obj.object_list), 'facets': facets}
 
-    if category_slug:
-        merchant_list = merchant_list.filter(category__slug=category_slug)
-    
-    # Sort: Featured first, then name
-    merchant_list = merchant_list.order_by('-is_featured', 'name')
-    
-    # 2. PAGINATION LOGIC (Show 20 per page)
-    paginator = Paginator(merchant_list, 20) 
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    ui_context = _merchant_ui_context(page_obj.object_list, request.user)
-    
-    # 3. HTMX CHECK
+    # 3. CACHE: anonymous visitors all see the same list, so share it until the venue changes
+    if user.is_authenticated:
+        listing = await render_merchant_list()
+    else:
+        boundaries = await acached_directory_fragment(venue.pk, ('schedule',), lambda: _schedule_boundaries(venue))
+        listing = await acached_directory_fragment(
+            venue.pk,
+            ('merchants', query, category_slug, directory_filters.cache_key, page_number),
+            render_merchant_list,
+            timeout=seconds_until_schedule_change(boundaries),
+        )
+    facets = listing['facets'] and _directory_facet_links(listing['facets'], params)
+
+    # 4. HTMX CHECK
     # If the browser says "I am HTMX asking for more data", we send only the partial list.
     if request.headers.get('HX-Request'):
-        return render(
-            request,
-            'venues/partials/merchant_list.html',
-            {'merchants': page_obj, 'search_query': query, 'current_category': category_slug, **ui_context},
-        )
+        html = listing['html']
+        if facets:
+            # A new search (not "load more") also refreshes the counts, swapped in out of band.
+            html += await sync_to_async(render_to_string)(
+                'venues/partials/directory_facets.html', {'facets': facets, 'oob': True, **filters}, request=request
+            )
+        return HttpResponse(html)
 
     # Otherwise, send the full page (Header + Search + List)
-    categories = MerchantCategory.objects.filter(merchant__floor__venue=venue).distinct()
-    
+    async def categories_list():
+        return [category async for category in MerchantCategory.objects.filter(merchant__floor__venue=venue).distinct()]
+
+    categories = await acached_directory_fragment(venue.pk, ('categories',), categories_list)
+
     context = {
         'venue': venue,
-        'merchants': page_obj, # Pass the Page object, not the full list
+        'merchant_list_html': listing['html'],
+        'has_merchants': listing['has_merchants'],
         'categories': categories,
-        'search_query': query,
-        'current_category': category_slug,
-        **ui_context,
+        'facets': facets,
+        **filters,
     }
-    return render(request, 'venues/directory.html', context)
+    return await sync_to_async(render)(request, 'venues/directory.html', context)
 
 
 # ============================================
@@ -265,7 +338,7 @@ def venue_directory(request, slug):
 
 def _check_venue_owner(user, venue):
     """Helper function to check if user owns the venue"""
-    if venue.owner != user:
+    if venue.owner_id != user.pk:
         return False
     role = getattr(getattr(user, 'userprofile', None), 'role', None)
     return role == UserProfile.Role.VENUE
@@ -338,6 +411,61 @@ def merchant_add(request, venue_id):
     return render(request, 'venues/owners/merchant_form.html', context)
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def merchant_import(request, venue_id):
+    """Create or update many merchants at once from a CSV or XLSX file"""
+    venue = get_object_or_404(Venue, pk=venue_id)
+
+    if not _check_venue_owner(request.user, venue):
+        return render(request, 'venues/owners/portal_forbidden.html', status=403)
+
+    result = None
+    if request.method == "POST":
+        form = MerchantImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = import_merchants(venue, upload, upload.name)
+            except ImportFileError as exc:
+                form.add_error('file', str(exc))
+            else:
+                if not result.failed:
+                    messages.success(request, f'Imported {result.created} new and {result.updated} updated merchants.')
+                    return redirect('venue_merchants', venue_id=venue.id)
+    else:
+        form = MerchantImportForm()
+
+    context = {
+        'venue': venue,
+        'form': form,
+        'result': result,
+        'xlsx_supported': openpyxl is not None,
+    }
+    return render(request, 'venues/owners/merchant_import.html', context)
+
+
+@login_required
+def merchant_export(request, venue_id):
+    """Download a venue's merchants in the import format"""
+    venue = get_object_or_404(Venue, pk=venue_id)
+
+    if not _check_venue_owner(request.user, venue):
+        return render(request, 'venues/owners/portal_forbidden.html', status=403)
+
+    filename = f"{venue.slug}-merchants"
+    if request.GET.get('format') == 'xlsx' and openpyxl is not None:
+        # XLSX is a zip archive, so it is assembled in a temporary file rather than streamed.
+        fh = tempfile.TemporaryFile()
+        write_xlsx(export_rows(venue), fh)
+        fh.seek(0)
+        return FileResponse(fh, as_attachment=True, filename=f"{filename}.xlsx")
+
+    response = StreamingHttpResponse(stream_csv(export_rows(venue)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def merchant_edit(request, venue_id, merchant_id):